@@ -1,5 +1,6 @@
 from .warehouse_model.warehouse_model import WarehouseHIV
 from .warehouse_model.warehouse_injector import InjectorHIV
+from .warehouse_model.snapshot import WarehouseSnapshot
 from .agents.deduple_agent import DedupleAgent, LinkageRecordsHIV
 from .data_matching.matching_data import Deduple, PLinkage
 from .process_layer.base import ProcessBase
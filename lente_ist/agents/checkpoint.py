@@ -0,0 +1,113 @@
+'''
+    Durable state of long-running linkage jobs.
+
+    The candidate pairs of a job are cut into fixed-size blocks. Each block that is
+    compared and persisted is recorded in the warehouse, so a restarted job skips the
+    blocks already finished instead of comparing all pairs again.
+'''
+import json
+import uuid
+import pandas as pd
+
+class RunCheckpoint:
+    '''
+        Record of the runs and of their finished blocks within the warehouse.
+
+        Args:
+        -----
+            warehouse:
+                WarehouseBase. Warehouse containing the tables 'linkage_runs' and
+                'linkage_run_blocks'.
+    '''
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+
+    def start(self, task, parameters, number_of_pairs, blocksize):
+        '''
+            Register a new run and return its ID.
+
+            Args:
+            -----
+                task:
+                    String. Name of the task performed by the run.
+                parameters:
+                    Dictionary. JSON serializable arguments needed to restart the task.
+                number_of_pairs:
+                    Integer. Number of candidate pairs of the run.
+                blocksize:
+                    Integer. Number of candidate pairs in each block.
+        '''
+        run_id = uuid.uuid4().hex
+        run = pd.DataFrame([{
+            "RUN_ID": run_id, "TAREFA": task, "PARAMETROS": json.dumps(parameters),
+            "NUMERO_PARES": number_of_pairs, "TAMANHO_BLOCO": blocksize, "STATUS": "RUNNING",
+        }])
+        self.warehouse.insert('linkage_runs', run, verbose=False)
+        print(f"Run ID: {run_id}")
+        return run_id
+
+    def load(self, run_id=None, tasks=None):
+        '''
+            Return the run identified by 'run_id'. If not provided, return the latest
+            unfinished run among the given 'tasks'.
+        '''
+        if run_id is not None:
+            runs = self.warehouse.query_where('linkage_runs', value=run_id, colname='RUN_ID')
+        else:
+            runs = self.warehouse.query_where('linkage_runs', value='RUNNING', colname='STATUS')
+            runs = [ run for run in runs if tasks is None or run.TAREFA in tasks ]
+            runs = sorted(runs, key=lambda run: run.CRIADO_EM)[-1:]
+        if len(runs)==0:
+            raise Exception("No run to be resumed was found.")
+
+        run = runs[0]._asdict()
+        run["PARAMETROS"] = json.loads(run["PARAMETROS"]) if run["PARAMETROS"] else {}
+        return run
+
+    def finished_blocks(self, run_id):
+        '''
+            Set of the blocks already compared and persisted for the run.
+        '''
+        blocks = self.warehouse.query_where('linkage_run_blocks', value=run_id, colname='RUN_ID')
+        return { block.BLOCO for block in blocks }
+
+    def mark_block(self, run_id, block, number_of_pairs):
+        '''
+            Record that a block was compared and persisted.
+        '''
+        record = pd.DataFrame([{"RUN_ID": run_id, "BLOCO": block, "NUMERO_PARES": number_of_pairs}])
+        self.warehouse.insert('linkage_run_blocks', record, verbose=False)
+
+    def finish(self, run_id):
+        self.warehouse.update('linkage_runs', run_id, {"STATUS": "FINISHED"}, verbose=False)
+
+    def run_blocks(self, run_id, candidate_pairs, blocksize, process_block, verbose=True):
+        '''
+            Process the blocks of 'candidate_pairs' not finished yet and mark the run as finished.
+
+            Args:
+            -----
+                run_id:
+                    String.
+                candidate_pairs:
+                    pandas.MultiIndex. Candidate pairs of the run, in the same order as when the run
+                    was started.
+                blocksize:
+                    Integer. Number of candidate pairs in each block.
+                process_block:
+                    Callable. Receives the pairs of a block, compares and persists them. It returns
+                    the number of pairs effectively compared.
+        '''
+        finished = self.finished_blocks(run_id)
+        nblocks = (len(candidate_pairs)-1)//blocksize + 1 if len(candidate_pairs) else 0
+        if verbose and len(finished):
+            print(f"Blocks already finished: {len(finished)}/{nblocks}")
+
+        for block in range(nblocks):
+            if block in finished:
+                continue
+            if verbose:
+                print(f"Block {block+1}/{nblocks} ...")
+            ncompared = process_block(candidate_pairs[block*blocksize:(block+1)*blocksize])
+            self.mark_block(run_id, block, ncompared)
+        self.finish(run_id)
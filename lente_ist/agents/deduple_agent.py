@@ -1,16 +1,36 @@
 '''
     ...
 '''
-import joblib
-from pathlib import Path
 import pandas as pd
 import numpy as np
 import datetime as dt
-from tqdm import tqdm
 from lente_ist import WarehouseHIV
+from lente_ist.warehouse_model.backend import warehouse_url
 from lente_ist.utils import perform_query
 from lente_ist.process_layer.sus_specific import ProcessSinan
 from lente_ist.data_matching.matching_data import Deduple, PLinkage
+from lente_ist.data_matching.blocking import BlockingPass
+from lente_ist.agents.checkpoint import RunCheckpoint
+from lente_ist.agents.scoring import EnsembleScorer
+from lente_ist.warehouse_model.pair_store import PairStore
+from lente_ist.process_layer.standardized_store import StandardizedRecords
+
+# -- candidate pairs: union of the blocking passes below (pairs found by several passes are compared once).
+# -- the sorted neighbourhood over 'FONETICA_N' (the previous default blocking) is kept as an extra pass
+# -- until the recall of the phonetic passes is measured on the labelled pairs ('new' in 'blocking_counts').
+BLOCKING_PASSES = [
+    BlockingPass("FONETICA_BR", "FONETICA_BR"),
+    BlockingPass("FONETICA_SOBRENOME+nascimento", ["FONETICA_SOBRENOME", "nascimento_mes", "nascimento_ano"]),
+    BlockingPass("nascimento+primeiro_nome", ["nascimento_dia", "nascimento_mes", "nascimento_ano", "primeiro_nome"]),
+    BlockingPass("cpf", "cpf"),
+    BlockingPass("cns", "cns"),
+    BlockingPass("raretokens", ["NOME_PACIENTE", "NOME_MAE"], method="raretokens", max_block_size=100, min_shared=2),
+    BlockingPass("FONETICA_N", "FONETICA_N", method="sortedneighbourhood", window=3),
+]
+# -- linkage with SIM: the names are also compared by the similarity of their q-grams (MinHash LSH)
+SIM_BLOCKING_PASSES = BLOCKING_PASSES + [
+    BlockingPass("minhash", ["NOME_PACIENTE", "NOME_MAE"], method="minhash", threshold=0.5),
+]
 
 class DedupleAgent:
     '''
@@ -21,46 +41,81 @@ class DedupleAgent:
         self.warehouse_name = warehouse_name
         self.field_id = field_id
 
-        self.engine_url = f"sqlite:///{self.warehouse_location.joinpath(self.warehouse_name)}"
+        self.engine_url = warehouse_url(self.warehouse_location, self.warehouse_name)
         self.warehouse = WarehouseHIV(self.engine_url)
         self.engine = self.warehouse.db_init()
         self.current_pairs = []
         self.deduple = None
+        self.checkpoint = RunCheckpoint(self.warehouse)
+        self.standardized = StandardizedRecords(self.warehouse)
+        self.run_id = None
 
-        self.models = {
-            "GBT": joblib.load(Path(path_to_models).joinpath("GRADBOOST_SIVEP04SET2023.joblib")),
-            "RNF": joblib.load(Path(path_to_models).joinpath("RANDFOREST_SIVEP04SET2023.joblib")),
-            "LGT": joblib.load(Path(path_to_models).joinpath("LOGITREG_SIVEP04SET2023.joblib")),
-        }
+        # -- ensemble of models (loaded once per process and shared by the agents)
+        self.scorer = EnsembleScorer(path_to_models)
+        self.models = self.scorer.models
 
     def retrieve_compared_pairs(self):
         '''
             Retrieve the pairs that were already compared previously.
         '''
         # -- 
-        query_pairs = pd.DataFrame( self.warehouse.query_all(table_name='pairs_label') )
-        if query_pairs.shape[0]>0:
-            query_pairs = query_pairs[[f"{self.field_id}_1", f"{self.field_id}_2"]].copy()
-        else:
-            query_pairs = []
+        query_pairs = self.warehouse.query_frame('pairs_label', columns=[f"{self.field_id}_1", f"{self.field_id}_2"])
 
         if len(query_pairs):
             self.current_pairs = list(query_pairs.itertuples(index=False, name=None))
         return self
     
-    def perform(self, period=(dt.datetime(2000, 1, 1), dt.datetime.today()), number_of_blocks=1):
+    def classify_and_store(self, comparison_matrix, verbose=True):
         '''
+            Score the compared pairs with the ensemble of models and store them.
 
+            Args:
+            -----
+                comparison_matrix:
+                    pandas.DataFrame. Comparison matrix indexed by the pairs of IDs.
         '''
-        query_data = pd.DataFrame( self.warehouse.query_period(table_name='pessoa', date_col="DATA_NOTIFICACAO", period=period) )
+        # -- classify pairs (the IDs of the records are decoded from their integer codes)
+        pair_ids, X_sel = self.deduple.decode_pairs(comparison_matrix.index).to_frame(index=False), comparison_matrix.values
 
-        # -- process the data for standardization
-        processor = ProcessSinan(query_data, self.field_id)
-        processor.basic_standardize().specific_standardize()
-        processed_data = processor.data
+        # -- probabilities of being a negative pair for each model ('GBT', 'RNF' and 'LGT' columns)
+        scores = self.scorer.score(X_sel)
+        Y_neg1, Y_neg2, Y_neg3 = scores.T
+
+        pair_ids["FMT_ID"] = pair_ids[f"{self.field_id}_1"] + "-" + pair_ids[f"{self.field_id}_2"]
+        pair_ids["PROBA_NEGATIVO_MODELO_1"] = Y_neg1
+        pair_ids["PROBA_NEGATIVO_MODELO_2"] = Y_neg2
+        pair_ids["PROBA_NEGATIVO_MODELO_3"] = Y_neg3
+
+        self.warehouse.insert('pairs_label', pair_ids, batchsize=500, verbose=verbose)
+
+    def perform(self, period=(dt.datetime(2000, 1, 1), dt.datetime.today()), number_of_blocks=1, n_jobs=1, 
+                stream_chunksize=200000, checkpoint=False, run_id=None):
+        '''
+            Args:
+            -----
+                period:
+                    2-element list of datetime.datetime. Period of notification of the records to be deduplicated.
+                number_of_blocks:
+                    Integer. Number of partitions on the list of pairs to be compared.
+                n_jobs:
+                    Integer. Number of processes comparing the partitions in parallel.
+                stream_chunksize:
+                    Integer. Size of the blocks of a checkpointed run.
+                checkpoint:
+                    Boolean. Default False. If True, the run is registered in the warehouse and each
+                    block of 'stream_chunksize' pairs is recorded once compared and stored, so the run
+                    can be continued later with 'resume'.
+                run_id:
+                    String. Default None. ID of a checkpointed run to be continued.
+        '''
+        period = [ dt.datetime.fromisoformat(date) if isinstance(date, str) else date for date in period ]
+        # -- standardized records (new or updated records of 'pessoa' are standardized first)
+        self.standardized.refresh(verbose=False)
+        query_data = self.standardized.load(period=period, date_col="DATA_NOTIFICACAO")
+        processed_data = ProcessSinan.from_standardized(query_data.drop(columns=["FONTE"]), self.field_id).data
 
         # -- build the similarity matrix
-        self.deduple = Deduple(processed_data, left_id=self.field_id, env_folder=None)
+        self.deduple = Deduple(processed_data, left_id=self.field_id, env_folder=None, integer_ids=True)
         linkage_vars = [
             ("cpf", "cpf", "exact", 'cpf'),
             ("cns", "cns", "exact", 'cns'),
@@ -75,30 +130,59 @@ class DedupleAgent:
             ("complemento_nome", "complemento_nome", "string", 'complemento_nome'),
             ("complemento_nome_mae", "complemento_nome_mae", "string", 'complemento_nome_mae'),
         ]
-        self.deduple.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein").define_pairs("FONETICA_N", window=3)
-
-        # ---- remove pairs that were already compared previously
-        self.deduple.candidate_pairs = self.deduple.candidate_pairs.drop(self.current_pairs, errors='ignore')
-        print(f"Pairs to be effectively compared: {self.deduple.candidate_pairs.shape[0]}")
-        # -- compare and generate the similarity matrix
-        self.deduple.perform_linkage(threshold=0.60, number_of_blocks=number_of_blocks)
-
-        # -- classify pairs
-        pair_ids, X_sel = self.deduple.comparison_matrix.reset_index().iloc[:,:2],  self.deduple.comparison_matrix.reset_index().iloc[:,2:].values
-
-        batchsize = 6000
-        Y_neg1, Y_neg2, Y_neg3 = [], [], []
-        for batch in tqdm(np.array_split(X_sel, np.arange(batchsize, X_sel.shape[0]+1, batchsize))):
-            Y_neg1 += [ res[0] for res in self.models["GBT"].predict_proba(batch) ]
-            Y_neg2 += [ res[0] for res in self.models["RNF"].predict_proba(batch) ]
-            Y_neg3 += [ res[0] for res in self.models["LGT"].predict_proba(batch) ]
+        self.deduple.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein", string_engine="numpy").define_pairs(passes=BLOCKING_PASSES)
+
+        if not checkpoint and run_id is None:
+            # ---- remove pairs that were already compared previously
+            self.deduple.candidate_pairs = self.deduple.candidate_pairs.drop(self.deduple.encode_pairs(self.current_pairs), errors='ignore')
+            print(f"Pairs to be effectively compared: {self.deduple.candidate_pairs.shape[0]}")
+            # -- compare and generate the similarity matrix
+            self.deduple.perform_linkage(threshold=0.60, number_of_blocks=number_of_blocks, n_jobs=n_jobs)
+            self.classify_and_store(self.deduple.comparison_matrix)
+            return self
+
+        # -- checkpointed run: blocks are cut before removing the pairs already compared.
+        candidate_pairs = self.deduple.candidate_pairs
+        if run_id is None:
+            parameters = {"period": [ date.isoformat() for date in period ], "number_of_blocks": number_of_blocks,
+                          "n_jobs": n_jobs, "stream_chunksize": stream_chunksize}
+            run_id = self.checkpoint.start("perform", parameters, len(candidate_pairs), stream_chunksize)
+        run = self.checkpoint.load(run_id)
+        if run["NUMERO_PARES"]!=len(candidate_pairs):
+            raise Exception("The candidate pairs changed since the run was started. It cannot be resumed.")
+        self.run_id, blocksize = run_id, run["TAMANHO_BLOCO"]
+        # -- the pairs stored by a block interrupted before being marked as finished are not compared again
+        self.retrieve_compared_pairs()
+        compared_pairs = self.deduple.encode_pairs(self.current_pairs)
+
+        def process_block(block_pairs):
+            block_pairs = block_pairs.drop(compared_pairs, errors='ignore')
+            self.deduple.candidate_pairs = block_pairs
+            for comparison_matrix in self.deduple.stream_linkage(chunksize=blocksize, threshold=0.60, n_jobs=n_jobs, verbose=False):
+                self.classify_and_store(comparison_matrix, verbose=False)
+            # -- pairs compared by this run are kept along with the ones retrieved from the warehouse
+            self.current_pairs += list(self.deduple.decode_pairs(block_pairs))
+            return block_pairs.shape[0]
+
+        try:
+            self.checkpoint.run_blocks(run_id, candidate_pairs, blocksize, process_block)
+        finally:
+            self.deduple.candidate_pairs = candidate_pairs
+        return self
 
-        pair_ids["FMT_ID"] = pair_ids[f"{self.field_id}_1"] + "-" + pair_ids[f"{self.field_id}_2"]
-        pair_ids["PROBA_NEGATIVO_MODELO_1"] = Y_neg1
-        pair_ids["PROBA_NEGATIVO_MODELO_2"] = Y_neg2
-        pair_ids["PROBA_NEGATIVO_MODELO_3"] = Y_neg3
+    def resume(self, run_id=None):
+        '''
+            Continue a checkpointed run, skipping the blocks already finished.
 
-        self.warehouse.insert('pairs_label', pair_ids, batchsize=500, verbose=True)
+            Args:
+            -----
+                run_id:
+                    String. Default None. ID of the run. If not provided, the latest unfinished run
+                    of this agent is resumed.
+        '''
+        run = self.checkpoint.load(run_id, tasks=("perform",))
+        print(f"Resuming run {run['RUN_ID']} ({run['TAREFA']}) ...")
+        self.perform(run_id=run["RUN_ID"], **run["PARAMETROS"])
 
 # -- example
 class LinkageRecordsHIV:
@@ -106,35 +190,183 @@ class LinkageRecordsHIV:
         self.warehouse_location = warehouse_location
         self.warehouse_name = warehouse_name
         self.field_id = field_id
-        self.engine_url = f"sqlite:///{self.warehouse_location.joinpath(self.warehouse_name)}"
+        self.engine_url = warehouse_url(self.warehouse_location, self.warehouse_name)
         self.warehouse = WarehouseHIV(self.engine_url)
         self.engine = self.warehouse.db_init()
         self.current_pairs = []
         self.linkage = None
+        self.checkpoint = RunCheckpoint(self.warehouse)
+        self.standardized = StandardizedRecords(self.warehouse)
+        self.run_id = None
+
+        # -- pairs already compared. Pairs stored only as 'FMT_ID' strings are imported once.
+        self.pair_store = PairStore(self.warehouse)
+        if self.pair_store.count()==0:
+            self.pair_store.import_fmt_ids('likely_positive_pairs', classification="positive")
+            self.pair_store.import_fmt_ids('likely_negative_pairs', classification="negative")
 
-        self.models = dict()
-        self.models["GBT"] = joblib.load(Path(path_to_models).joinpath("GRADBOOST_SIVEP04SET2023.joblib"))
-        self.models["RNF"] = joblib.load(Path(path_to_models).joinpath("RANDFOREST_SIVEP04SET2023.joblib"))
-        self.models["LGT"] = joblib.load(Path(path_to_models).joinpath("LOGITREG_SIVEP04SET2023.joblib"))
+        # -- ensemble of models (loaded once per process and shared by the agents)
+        self.scorer = EnsembleScorer(path_to_models)
+        self.models = self.scorer.models
 
-    def perform_without_sim(self, number_of_blocks, frac=1.0, chunksize=5000):
+    def classify_and_store(self, comparison_matrix, verbose=True):
+        '''
+            Score the compared pairs with the ensemble of models and store them as likely
+            positive or likely negative pairs.
+
+            Args:
+            -----
+                comparison_matrix:
+                    pandas.DataFrame. Comparison matrix indexed by the pairs of IDs.
+        '''
+        # -- classify pairs (the IDs of the records are decoded from their integer codes)
+        pair_ids, X_sel = self.linkage.decode_pairs(comparison_matrix.index).to_frame(index=False), comparison_matrix.values
+
+        # -- probabilities of being a negative pair for each model ('GBT', 'RNF' and 'LGT' columns)
+        scores = self.scorer.score(X_sel)
+        Y_neg1, Y_neg2, Y_neg3 = scores.T
+
+        # -- create the subset of very likely positive pairs and very likely negative pairs
+        border_thr = 0.75
+        is_positive = (scores <= border_thr).all(axis=1)
+        scored_pairs = pd.DataFrame({
+            "FMT_ID": pair_ids[f"{self.field_id}_1"] + "-" + pair_ids[f"{self.field_id}_2"],
+            "PROBA_NEGATIVO_MODELO_1": Y_neg1,
+            "PROBA_NEGATIVO_MODELO_2": Y_neg2,
+            "PROBA_NEGATIVO_MODELO_3": Y_neg3,
+        })
+
+        # -- insert the likely positive and the likely negative pairs (pairs already stored by an
+        # -- interrupted block are ignored, so a replayed block does not fail on their 'FMT_ID')
+        self.warehouse.insert('likely_positive_pairs', scored_pairs[is_positive], batchsize=50000, verbose=verbose, bulk=True)
+        self.warehouse.insert('likely_negative_pairs', scored_pairs[~is_positive], batchsize=50000, verbose=verbose, bulk=True)
+
+        # -- keep the compared pairs indexed by their IDs
+        self.pair_store.add(pair_ids[is_positive], classification="positive")
+        self.pair_store.add(pair_ids[~is_positive], classification="negative")
+
+    def not_compared(self, candidate_pairs, batchsize=200000, classification="negative"):
+        '''
+            Candidate pairs (integer codes) not compared before as negative pairs (or with any
+            classification if 'classification' is None). The codes are decoded to IDs only to be
+            joined against the pairs stored.
+        '''
+        stored = self.pair_store.is_stored(self.linkage.decode_pairs(candidate_pairs), classification=classification, batchsize=batchsize)
+        return candidate_pairs[~stored]
+
+    def compare_candidates(self, task, parameters, checkpoint=False, run_id=None):
+        '''
+            Remove the candidate pairs already compared, then compare, classify and store the remaining ones.
+
+            Args:
+            -----
+                task:
+                    String. Name of the method performing the linkage, used to resume a checkpointed run.
+                parameters:
+                    Dictionary. Arguments of the method performing the linkage.
+                checkpoint:
+                    Boolean. If True, the candidate pairs are processed in blocks of 'stream_chunksize' pairs
+                    and each finished block is recorded in the warehouse.
+                run_id:
+                    String. ID of a checkpointed run to be continued.
+        '''
+        number_of_blocks, chunksize, n_jobs = parameters["number_of_blocks"], parameters["chunksize"], parameters["n_jobs"]
+        stream_chunksize = parameters["stream_chunksize"]
+        if not checkpoint and run_id is None and stream_chunksize is not None:
+            # -- streaming mode: each chunk of candidate pairs is generated, filtered against the pairs
+            # -- already compared, compared, classified and stored before the next one.
+            not_compared = lambda pairs: self.not_compared(pairs, batchsize=chunksize)
+            for comparison_matrix in self.linkage.stream_linkage(chunksize=stream_chunksize, threshold=0.60, n_jobs=n_jobs, pair_filter=not_compared):
+                self.classify_and_store(comparison_matrix, verbose=False)
+            return self
+
+        if not checkpoint and run_id is None:
+            # ---- remove pairs that were already compared previously
+            number_of_pairs = len(self.linkage.candidate_pairs)
+            self.linkage.candidate_pairs = self.not_compared(self.linkage.candidate_pairs, batchsize=chunksize)
+            print(f"Pairs already compared before: {number_of_pairs-len(self.linkage.candidate_pairs)}")
+            print(f"Pairs to be effectively compared: {self.linkage.candidate_pairs.shape[0]}")
+            # -- compare, classify and store the pairs
+            self.linkage.perform_linkage(threshold=0.60, number_of_blocks=number_of_blocks, n_jobs=n_jobs)
+            self.classify_and_store(self.linkage.comparison_matrix)
+            return self
+
+        # -- checkpointed run: blocks are cut before removing the pairs already compared, so they
+        # -- remain the same when the run is resumed.
+        candidate_pairs = self.linkage.candidate_pairs
+        if run_id is None:
+            parameters["stream_chunksize"] = stream_chunksize if stream_chunksize is not None else 200000
+            run_id = self.checkpoint.start(task, parameters, len(candidate_pairs), parameters["stream_chunksize"])
+        run = self.checkpoint.load(run_id)
+        if run["NUMERO_PARES"]!=len(candidate_pairs):
+            raise Exception("The candidate pairs changed since the run was started. It cannot be resumed.")
+        self.run_id, blocksize = run_id, run["TAMANHO_BLOCO"]
+
+        def process_block(block_pairs):
+            # -- a block interrupted before being marked as finished is processed again: the pairs it
+            # -- already stored are removed whatever their classification.
+            block_pairs = self.not_compared(block_pairs, batchsize=chunksize, classification=None)
+            self.linkage.candidate_pairs = block_pairs
+            for comparison_matrix in self.linkage.stream_linkage(chunksize=blocksize, threshold=0.60, n_jobs=n_jobs, verbose=False):
+                self.classify_and_store(comparison_matrix, verbose=False)
+            return block_pairs.shape[0]
+
+        try:
+            self.checkpoint.run_blocks(run_id, candidate_pairs, blocksize, process_block)
+        finally:
+            self.linkage.candidate_pairs = candidate_pairs
+        return self
+
+    def resume(self, run_id=None):
+        '''
+            Continue a checkpointed run, skipping the blocks already finished.
+
+            Args:
+            -----
+                run_id:
+                    String. Default None. ID of the run. If not provided, the latest unfinished run
+                    of this agent is resumed.
+        '''
+        run = self.checkpoint.load(run_id, tasks=("perform_without_sim", "perform_hiv_to_sim"))
+        print(f"Resuming run {run['RUN_ID']} ({run['TAREFA']}) ...")
+        getattr(self, run["TAREFA"])(run_id=run["RUN_ID"], **run["PARAMETROS"])
+
+    def perform_without_sim(self, number_of_blocks, frac=1.0, chunksize=5000, n_jobs=1, stream_chunksize=None, checkpoint=False, run_id=None):
         ''' 
             Perform Deduplication/Linkage within the connected database.
 
             This function performs a deduplication within the table 'pessoa' for all records that do not
             belong to SIM. That is, records from SINAN, SICLOM and SIMC are included. The deduplication
             here is equivalent to the record linkage process. 
+
+            Args:
+            -----
+                number_of_blocks:
+                    Integer. Number of partitions on the list of pairs to be compared.
+                chunksize:
+                    Integer. Number of candidate pairs checked against the pairs already compared at once.
+                n_jobs:
+                    Integer. Number of processes comparing the partitions in parallel.
+                stream_chunksize:
+                    Integer. Default None. If provided, the pairs are generated, compared, classified
+                    and stored one chunk of 'stream_chunksize' pairs at a time, bounding the memory usage
+                    by the size of the chunk. A failure loses only the current chunk.
+                checkpoint:
+                    Boolean. Default False. If True, the run is registered in the warehouse and each
+                    block of 'stream_chunksize' pairs is recorded once compared and stored, so the run
+                    can be continued later with 'resume'.
+                run_id:
+                    String. Default None. ID of a checkpointed run to be continued.
         '''
-        query_data = pd.DataFrame( self.warehouse.query_all(table_name='pessoa'))
+        self.standardized.refresh(verbose=False)
+        query_data = self.standardized.load()
         # -- remove records from SIM (it will not be compared here)
-        left_df = query_data[~query_data["FONTE"].str.contains("DO")]
-        processor_left = ProcessSinan(left_df, self.field_id)
-        processor_left.basic_standardize().specific_standardize()
-        processed_left = processor_left.data
+        left_df = query_data[~query_data["FONTE"].str.contains("DO")].drop(columns=["FONTE"])
+        processed_left = ProcessSinan.from_standardized(left_df, self.field_id).data
 
         # -- build the similarity matrix
         #self.linkage = PLinkage(processed_left, processed_right, left_id=f"{self.field_id}_1", right_id=f"{self.field_id}_2", env_folder=None)
-        self.linkage = Deduple(processed_left, left_id=f"{self.field_id}", env_folder=None)
+        self.linkage = Deduple(processed_left, left_id=f"{self.field_id}", env_folder=None, integer_ids=True)
         linkage_vars = [
             ("cpf", "cpf", "exact", 'cpf'),
             ("cns", "cns", "exact", 'cns'),
@@ -149,86 +381,49 @@ class LinkageRecordsHIV:
             ("complemento_nome", "complemento_nome", "string", 'complemento_nome'),
             ("complemento_nome_mae", "complemento_nome_mae", "string", 'complemento_nome_mae'),
         ]
-        self.linkage.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein").define_pairs("FONETICA_N", window=3)
-
-        # -- remove the pairs already compared
-        ids_to_remove = []
-        for j in tqdm(range(0, len(self.linkage.candidate_pairs), chunksize)):
-            current_chunk = list(self.linkage.candidate_pairs[j:j + chunksize])
-            chunk_tuple = tuple([ '"'+elem[0]+'-'+elem[1]+'"' for elem in current_chunk ])
-
-            q = f'''
-                SELECT * FROM likely_negative_pairs WHERE FMT_ID IN ({','.join(chunk_tuple)})
-            '''
-            found_ids = perform_query(q, self.engine)
-            # ["FMT_ID"].tolist()
-            if found_ids.shape[0]>0:
-                found_ids = [ (elem.split("-")[0], elem.split("-")[1]) for elem in found_ids["FMT_ID"].tolist() ]                
-                ids_to_remove += found_ids
-        print(f"Pairs already compared before: {len(ids_to_remove)}")
-
-        # ---- remove pairs that were already compared previously
-        self.linkage.candidate_pairs = self.linkage.candidate_pairs.drop(ids_to_remove, errors='ignore')
-        # -- free the space
-        del ids_to_remove
-        print(f"Pairs to be effectively compared: {self.linkage.candidate_pairs.shape[0]}")
-        # -- compare and generate the similarity matrix
-        self.linkage.perform_linkage(threshold=0.60, number_of_blocks=number_of_blocks)
-
-        # -- classify pairs
-        pair_ids, X_sel = self.linkage.comparison_matrix.reset_index().iloc[:,:2],  self.linkage.comparison_matrix.reset_index().iloc[:,2:].values
-
-        batchsize = 6000
-        Y_neg1, Y_neg2, Y_neg3 = [], [], []
-        for batch in tqdm(np.array_split(X_sel, np.arange(batchsize, X_sel.shape[0]+1, batchsize))):
-            Y_neg1 += [ res[0] for res in self.models["GBT"].predict_proba(batch) ]
-            Y_neg2 += [ res[0] for res in self.models["RNF"].predict_proba(batch) ]
-            Y_neg3 += [ res[0] for res in self.models["LGT"].predict_proba(batch) ]
-
-        # -- create the subset of very likely positive pairs Yp and very likely negative pairs Yn
-        border_thr = 0.75
-        Yp = [ ( pair_ids[f"{self.field_id}_1"].iloc[index]+"-"+pair_ids[f"{self.field_id}_2"].iloc[index], yl[0], yl[1], yl[2]) for index, yl in enumerate(zip(Y_neg1, Y_neg2, Y_neg3)) if yl[0] <= border_thr and yl[1] <= border_thr and yl[2] <= border_thr]
-        Yn = [ ( pair_ids[f"{self.field_id}_1"].iloc[index]+"-"+pair_ids[f"{self.field_id}_2"].iloc[index], yl[0], yl[1], yl[2]) for index, yl in enumerate(zip(Y_neg1, Y_neg2, Y_neg3)) if not (yl[0] <= border_thr and yl[1] <= border_thr and yl[2] <= border_thr)]
-
-        # -- insert the likely positive pairs
-        likely_positive = pd.DataFrame({
-            "FMT_ID": [ y_elem[0] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_1": [ y_elem[1] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_2": [ y_elem[2] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_3": [ y_elem[3] for y_elem in Yp ], 
-        })
-        self.warehouse.insert('likely_positive_pairs', likely_positive, batchsize=500, verbose=True)
-
-        # -- insert the likely negative pairs
-        likely_negative = pd.DataFrame({
-            "FMT_ID": [ y_elem[0] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_1": [ y_elem[1] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_2": [ y_elem[2] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_3": [ y_elem[3] for y_elem in Yn ], 
-        })
-        self.warehouse.insert('likely_negative_pairs', likely_negative, batchsize=500, verbose=True)
+        self.linkage.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein", string_engine="numpy").define_pairs(passes=BLOCKING_PASSES, lazy=stream_chunksize is not None and not checkpoint and run_id is None)
 
-    def perform_hiv_to_sim(self, number_of_blocks, frac=1.0, chunksize=5000):
+        # -- remove the pairs already compared, then compare, classify and store the remaining ones
+        parameters = {"number_of_blocks": number_of_blocks, "frac": frac, "chunksize": chunksize, "n_jobs": n_jobs, "stream_chunksize": stream_chunksize}
+        self.compare_candidates("perform_without_sim", parameters, checkpoint=checkpoint, run_id=run_id)
+
+    def perform_hiv_to_sim(self, number_of_blocks, frac=1.0, chunksize=5000, n_jobs=1, stream_chunksize=None, checkpoint=False, run_id=None):
         ''' 
             Perform Deduplication/Linkage within the connected database.
+
+            Args:
+            -----
+                number_of_blocks:
+                    Integer. Number of partitions on the list of pairs to be compared.
+                chunksize:
+                    Integer. Number of candidate pairs checked against the pairs already compared at once.
+                n_jobs:
+                    Integer. Number of processes comparing the partitions in parallel.
+                stream_chunksize:
+                    Integer. Default None. If provided, the pairs are generated, compared, classified
+                    and stored one chunk of 'stream_chunksize' pairs at a time, bounding the memory usage
+                    by the size of the chunk. A failure loses only the current chunk.
+                checkpoint:
+                    Boolean. Default False. If True, the run is registered in the warehouse and each
+                    block of 'stream_chunksize' pairs is recorded once compared and stored, so the run
+                    can be continued later with 'resume'.
+                run_id:
+                    String. Default None. ID of a checkpointed run to be continued.
         '''
-        query_data = pd.DataFrame( self.warehouse.query_all(table_name='pessoa'))
+        self.standardized.refresh(verbose=False)
+        query_data = self.standardized.load()
         # -- remove records from SIM (it will not be compared here)
-        left_df = query_data[~query_data["FONTE"].str.contains("DO")]
-        right_df = query_data[query_data["FONTE"].str.contains("DO")]
+        left_df = query_data[~query_data["FONTE"].str.contains("DO")].drop(columns=["FONTE"])
+        right_df = query_data[query_data["FONTE"].str.contains("DO")].drop(columns=["FONTE"])
         #left_df = query_data[query_data[self.field_id].isin(target_ids)]
-        processor_left = ProcessSinan(left_df, self.field_id)
-        processor_left.basic_standardize().specific_standardize()
-        processed_left = processor_left.data
-        processor_right = ProcessSinan(right_df, self.field_id)
-        processor_right.basic_standardize().specific_standardize()
-        processed_right = processor_right.data
+        processed_left = ProcessSinan.from_standardized(left_df, self.field_id).data
+        processed_right = ProcessSinan.from_standardized(right_df, self.field_id).data
         processed_left = processed_left.rename({self.field_id: f"{self.field_id}_1"}, axis=1)
         processed_right = processed_right.rename({self.field_id: f"{self.field_id}_2"}, axis=1)
         query_data = None
 
         # -- build the similarity matrix
-        self.linkage = PLinkage(processed_left, processed_right, left_id=f"{self.field_id}_1", right_id=f"{self.field_id}_2", env_folder=None)
+        self.linkage = PLinkage(processed_left, processed_right, left_id=f"{self.field_id}_1", right_id=f"{self.field_id}_2", env_folder=None, integer_ids=True)
         linkage_vars = [
             ("cpf", "cpf", "exact", 'cpf'),
             ("cns", "cns", "exact", 'cns'),
@@ -243,61 +438,8 @@ class LinkageRecordsHIV:
             ("complemento_nome", "complemento_nome", "string", 'complemento_nome'),
             ("complemento_nome_mae", "complemento_nome_mae", "string", 'complemento_nome_mae'),
         ]
-        self.linkage.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein").define_pairs("FONETICA_N", "FONETICA_N", window=3)
-
-        # -- remove the pairs already compared
-        ids_to_remove = []
-        for j in tqdm(range(0, len(self.linkage.candidate_pairs), chunksize)):
-            current_chunk = list(self.linkage.candidate_pairs[j:j + chunksize])
-            chunk_tuple = tuple([ '"'+elem[0]+'-'+elem[1]+'"' for elem in current_chunk ])
-
-            q = f'''
-                SELECT * FROM likely_negative_pairs WHERE FMT_ID IN ({','.join(chunk_tuple)})
-            '''
-            found_ids = perform_query(q, self.engine)
-            # ["FMT_ID"].tolist()
-            if found_ids.shape[0]>0:
-                found_ids = [ (elem.split("-")[0], elem.split("-")[1]) for elem in found_ids["FMT_ID"].tolist() ]                
-                ids_to_remove += found_ids
-        print(f"Pairs already compared before: {len(ids_to_remove)}")
-
-        # ---- remove pairs that were already compared previously
-        self.linkage.candidate_pairs = self.linkage.candidate_pairs.drop(ids_to_remove, errors='ignore')
-        # -- free the space
-        del ids_to_remove
-        print(f"Pairs to be effectively compared: {self.linkage.candidate_pairs.shape[0]}")
-        # -- compare and generate the similarity matrix
-        self.linkage.perform_linkage(threshold=0.60, number_of_blocks=number_of_blocks)
-
-        # -- classify pairs
-        pair_ids, X_sel = self.linkage.comparison_matrix.reset_index().iloc[:,:2],  self.linkage.comparison_matrix.reset_index().iloc[:,2:].values
-
-        batchsize = 6000
-        Y_neg1, Y_neg2, Y_neg3 = [], [], []
-        for batch in tqdm(np.array_split(X_sel, np.arange(batchsize, X_sel.shape[0]+1, batchsize))):
-            Y_neg1 += [ res[0] for res in self.models["GBT"].predict_proba(batch) ]
-            Y_neg2 += [ res[0] for res in self.models["RNF"].predict_proba(batch) ]
-            Y_neg3 += [ res[0] for res in self.models["LGT"].predict_proba(batch) ]
-
-        # -- create the subset of very likely positive pairs Yp and very likely negative pairs Yn
-        border_thr = 0.75
-        Yp = [ ( pair_ids[f"{self.field_id}_1"].iloc[index]+"-"+pair_ids[f"{self.field_id}_2"].iloc[index], yl[0], yl[1], yl[2]) for index, yl in enumerate(zip(Y_neg1, Y_neg2, Y_neg3)) if yl[0] <= border_thr and yl[1] <= border_thr and yl[2] <= border_thr]
-        Yn = [ ( pair_ids[f"{self.field_id}_1"].iloc[index]+"-"+pair_ids[f"{self.field_id}_2"].iloc[index], yl[0], yl[1], yl[2]) for index, yl in enumerate(zip(Y_neg1, Y_neg2, Y_neg3)) if not (yl[0] <= border_thr and yl[1] <= border_thr and yl[2] <= border_thr)]
-
-        # -- insert the likely positive pairs
-        likely_positive = pd.DataFrame({
-            "FMT_ID": [ y_elem[0] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_1": [ y_elem[1] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_2": [ y_elem[2] for y_elem in Yp ],
-            "PROBA_NEGATIVO_MODELO_3": [ y_elem[3] for y_elem in Yp ], 
-        })
-        self.warehouse.insert('likely_positive_pairs', likely_positive, batchsize=500, verbose=True)
-
-        # -- insert the likely negative pairs
-        likely_negative = pd.DataFrame({
-            "FMT_ID": [ y_elem[0] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_1": [ y_elem[1] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_2": [ y_elem[2] for y_elem in Yn ],
-            "PROBA_NEGATIVO_MODELO_3": [ y_elem[3] for y_elem in Yn ], 
-        })
-        self.warehouse.insert('likely_negative_pairs', likely_negative, batchsize=500, verbose=True)
\ No newline at end of file
+        self.linkage.set_linkage_variables(linkage_vars, string_method="damerau_levenshtein", string_engine="numpy").define_pairs(passes=SIM_BLOCKING_PASSES, lazy=stream_chunksize is not None and not checkpoint and run_id is None)
+
+        # -- remove the pairs already compared, then compare, classify and store the remaining ones
+        parameters = {"number_of_blocks": number_of_blocks, "frac": frac, "chunksize": chunksize, "n_jobs": n_jobs, "stream_chunksize": stream_chunksize}
+        self.compare_candidates("perform_hiv_to_sim", parameters, checkpoint=checkpoint, run_id=run_id)
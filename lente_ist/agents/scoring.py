@@ -0,0 +1,107 @@
+'''
+    Scoring of compared pairs with the ensemble of classification models.
+
+    The models are loaded once per process, with their arrays memory-mapped from the
+    '.joblib' files, and shared by all agents. Each block of comparison vectors is scored
+    by the models concurrently, and only its distinct vectors are scored: most features
+    are exact (0/1) comparisons, so identical vectors are very common. The scores of the
+    vectors already seen are kept in a cache and reused in the next blocks.
+'''
+import joblib
+import numpy as np
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+# -- name of each model of the ensemble and its file (order of the columns of the scores)
+ENSEMBLE_MODELS = {
+    "GBT": "GRADBOOST_SIVEP04SET2023.joblib",
+    "RNF": "RANDFOREST_SIVEP04SET2023.joblib",
+    "LGT": "LOGITREG_SIVEP04SET2023.joblib",
+}
+
+@lru_cache(maxsize=None)
+def load_model(path_to_model, mmap_mode='r'):
+    '''
+        Load a model once per process. The arrays of the model are memory-mapped from the file
+        (when saved uncompressed), so processes scoring with the same model share their pages.
+    '''
+    return joblib.load(path_to_model, mmap_mode=mmap_mode)
+
+class EnsembleScorer:
+    '''
+        Probabilities of the compared pairs being negative (not the same person) according to
+        each model of the ensemble.
+
+        Args:
+        -----
+            path_to_models:
+                String or pathlib.Path. Folder containing the '.joblib' files of the models.
+            models:
+                dict. Name and file of each model. Default is 'ENSEMBLE_MODELS'.
+            batchsize:
+                Integer. Number of distinct comparison vectors scored at once by each model.
+            max_cache:
+                Integer. Maximum number of comparison vectors whose scores are kept. The cache
+                is cleared when full.
+    '''
+    def __init__(self, path_to_models, models=None, batchsize=200000, max_cache=1000000):
+        models = ENSEMBLE_MODELS if models is None else models
+        self.names = list(models.keys())
+        self.models = { name: load_model(str(Path(path_to_models).joinpath(fname))) for name, fname in models.items() }
+        self.batchsize = batchsize
+        self.max_cache = max_cache
+        self.cache = dict()
+
+    def __getitem__(self, name):
+        return self.models[name]
+
+    def _predict(self, X):
+        '''
+            Probability of the negative class (first class) of each model, one column per model.
+        '''
+        with ThreadPoolExecutor(max_workers=len(self.names)) as executor:
+            futures = [ executor.submit(self.models[name].predict_proba, X) for name in self.names ]
+            return np.column_stack([ future.result()[:,0] for future in futures ])
+
+    def score(self, X):
+        '''
+            Score the comparison vectors.
+
+            Args:
+            -----
+                X:
+                    numpy.ndarray of shape (n_pairs, n_features). Comparison vectors.
+            Return:
+            -------
+                scores:
+                    numpy.ndarray of shape (n_pairs, n_models). Probability of each pair being
+                    negative according to each model (columns in the order of 'names').
+        '''
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        scores = np.empty((X.shape[0], len(self.names)), dtype=np.float64)
+        if X.shape[0]==0:
+            return scores
+
+        # -- distinct vectors, compared through their bytes
+        keys = X.view(np.dtype((np.void, X.dtype.itemsize*X.shape[1]))).ravel()
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        unique_scores = np.empty((unique_keys.shape[0], len(self.names)), dtype=np.float64)
+        cached = np.array([ key.tobytes() in self.cache for key in unique_keys ], dtype=bool)
+        for pos in np.flatnonzero(cached):
+            unique_scores[pos] = self.cache[unique_keys[pos].tobytes()]
+
+        # -- only the vectors not seen before are scored by the models
+        missing = np.flatnonzero(~cached)
+        for start in range(0, missing.shape[0], self.batchsize):
+            batch = missing[start:start+self.batchsize]
+            unique_scores[batch] = self._predict(X[first[batch]])
+
+        if len(self.cache)+missing.shape[0] > self.max_cache:
+            self.cache.clear()
+        missing = missing[:self.max_cache]
+        self.cache.update(zip([ key.tobytes() for key in unique_keys[missing] ], unique_scores[missing]))
+
+        scores[:] = unique_scores[inverse.ravel()]
+        return scores
@@ -1,2 +1,3 @@
 from .matching_base import MatchingBase
+from .blocking import BlockingPass, MinHashLSH, RareTokenIndex, MultiPassBlocking
 from .matching_data import Deduple, PLinkage
\ No newline at end of file
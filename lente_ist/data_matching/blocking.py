@@ -0,0 +1,657 @@
+'''
+    Multi-pass blocking for the generation of candidate pairs.
+
+    Each pass is a recordlinkage indexing algorithm over one or more fields (e.g. exact CPF,
+    exact CNS, date of birth and first name, sorted neighbourhood over the phonetic code of
+    the name, MinHash LSH or rare tokens of the names). The candidate pairs are the union of the pairs of
+    all passes, each pair kept once, in the order of the first pass that found it. The pairs are
+    generated in chunks from the blocking keys of the records, so the union is never stored.
+'''
+
+import numpy as np
+import pandas as pd
+from abc import ABC, abstractmethod
+from recordlinkage.base import BaseIndexAlgorithm
+from recordlinkage.index import Block, SortedNeighbourhood
+from lente_ist.data_matching.string_compare import encode_strings
+
+class BlockingPass:
+    '''
+        A single blocking criterion.
+
+        Args:
+        -----
+            name:
+                String. Name of the pass in the reports.
+            left_on:
+                String or list of strings. Blocking field(s) of the left-hand dataframe.
+            right_on:
+                String or list of strings. Blocking field(s) of the right-hand dataframe. If not
+                provided, the same fields of 'left_on' are used.
+            method:
+                String. 'block' (records with equal values in all fields), 'sortedneighbourhood'
+                (records within 'window' positions after sorting by the first field and with equal
+                values for the remaining fields), 'minhash' (records whose fields, joined, have
+                similar sets of character q-grams. See 'MinHashLSH') or 'raretokens' (records
+                sharing uncommon words. See 'RareTokenIndex').
+            window:
+                Odd Integer. Window of the sorted neighbourhood method.
+            options:
+                Keyword arguments of 'MinHashLSH' (e.g. 'threshold', 'q') or 'RareTokenIndex'
+                (e.g. 'max_block_size'), for the 'minhash' and 'raretokens' methods.
+    '''
+    def __init__(self, name, left_on, right_on=None, method="block", window=1, **options):
+        self.name = name
+        self.left_on = [left_on] if isinstance(left_on, str) else list(left_on)
+        self.right_on = self.left_on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+        self.method = method
+        self.window = window
+        self.options = options
+        if self.method not in ["block", "sortedneighbourhood", "minhash", "raretokens"]:
+            raise Exception(f"Unknown blocking method: {self.method}")
+        if len(self.left_on)!=len(self.right_on):
+            raise Exception("The number of left and right blocking fields must be the same.")
+
+    def indexer(self):
+        if self.method=="block":
+            return Block(left_on=self.left_on, right_on=self.right_on)
+        if self.method=="minhash":
+            return MinHashLSH(left_on=self.left_on, right_on=self.right_on, **self.options)
+        if self.method=="raretokens":
+            return RareTokenIndex(left_on=self.left_on, right_on=self.right_on, **self.options)
+        return SortedNeighbourhood(self.left_on[0], self.right_on[0], window=self.window,
+                                   block_left_on=self.left_on[1:], block_right_on=self.right_on[1:])
+
+    def index(self, left_df, right_df=None):
+        '''
+            Candidate pairs of this pass (deduplication if 'right_df' is not provided).
+        '''
+        if right_df is None:
+            return self.indexer().index(left_df)
+        return self.indexer().index(left_df, right_df)
+
+    def keys(self, left_df, right_df=None):
+        '''
+            Blocking keys of the records for this pass (see 'PassKeys'), generating its pairs in
+            chunks (deduplication if 'right_df' is not provided).
+        '''
+        dedup = right_df is None
+        right_df = left_df if dedup else right_df
+        if self.method=="block":
+            return BlockKeys(left_df, right_df, self.left_on, self.right_on, dedup)
+        if self.method=="minhash":
+            return MinHashKeys(self.indexer(), left_df, right_df, dedup)
+        if self.method=="raretokens":
+            return RareTokenKeys(self.indexer(), left_df, right_df, dedup)
+        return SortedNeighbourhoodKeys(left_df, right_df, self.left_on, self.right_on, self.window, dedup)
+
+class MinHashLSH(BaseIndexAlgorithm):
+    '''
+        Locality-sensitive hashing of the character q-grams of one or more fields.
+
+        The fields of each record are joined by spaces and its set of q-grams is summarized by
+        a MinHash signature of 'bands*rows' values. Records with an identical band of the
+        signature share a bucket. The pairs of records sharing at least one bucket are kept if
+        the Jaccard similarity estimated by their signatures is at least 'threshold'. The
+        number of candidates grows with the number of records, not with a window size.
+
+        Args:
+        -----
+            left_on:
+                String or list of strings. Field(s) of the left-hand dataframe.
+            right_on:
+                String or list of strings. Field(s) of the right-hand dataframe.
+            q:
+                Integer. Size of the character q-grams.
+            bands:
+                Integer. Number of bands of the signature.
+            rows:
+                Integer. Number of signature values in each band. Pairs with Jaccard similarity
+                s share a bucket with probability 1-(1-s^rows)^bands.
+            threshold:
+                Float. Minimum estimated Jaccard similarity of the candidate pairs.
+            seed:
+                Integer. Seed of the hash functions.
+            chunksize:
+                Integer. Number of records (signatures) or pairs (similarities) processed at once.
+    '''
+    def __init__(self, left_on, right_on=None, q=3, bands=16, rows=4, threshold=0.5, seed=0, chunksize=1024, **kwargs):
+        super().__init__(**kwargs)
+        self.left_on = [left_on] if isinstance(left_on, str) else list(left_on)
+        self.right_on = self.left_on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+        self.q, self.bands, self.rows = q, bands, rows
+        self.threshold, self.chunksize = threshold, chunksize
+
+        # -- multiply-shift hash functions: h(x) = (a*x + b) >> 32, with odd 'a'
+        rng = np.random.default_rng(seed)
+        self.hash_a = rng.integers(1, 2**63, size=bands*rows, dtype=np.uint64) | np.uint64(1)
+        self.hash_b = rng.integers(0, 2**63, size=bands*rows, dtype=np.uint64)
+        self.band_weights = rng.integers(1, 2**63, size=rows, dtype=np.uint64) | np.uint64(1)
+
+    def signatures(self, df, fields):
+        '''
+            MinHash signatures of the records of 'df'.
+
+            Return:
+            -------
+                signatures:
+                    numpy.array of shape (len(df), bands*rows).
+                has_qgrams:
+                    numpy.array of booleans. False for records without any q-gram.
+        '''
+        text = df[fields[0]].fillna('').astype(str)
+        for field in fields[1:]:
+            text = text + ' ' + df[field].fillna('').astype(str)
+        codes, lengths = encode_strings(text.str.strip().values)
+
+        max_value = np.iinfo(np.uint64).max
+        signatures = np.full((len(df), self.bands*self.rows), max_value, dtype=np.uint64)
+        number_of_qgrams = codes.shape[1]-self.q+1
+        if number_of_qgrams<=0:
+            return signatures, np.zeros(len(df), dtype=bool)
+
+        # -- q-grams as integers (unicode code points have at most 21 bits)
+        codes = np.maximum(codes, 0).astype(np.uint64)
+        qgrams = np.zeros((codes.shape[0], number_of_qgrams), dtype=np.uint64)
+        for offset in range(self.q):
+            qgrams = (qgrams << np.uint64(21)) | codes[:, offset:offset+number_of_qgrams]
+        valid = np.arange(number_of_qgrams)[None, :] < (lengths-self.q+1)[:, None]
+
+        with np.errstate(over='ignore'):
+            for start in range(0, len(df), self.chunksize):
+                current, current_valid = qgrams[start:start+self.chunksize], valid[start:start+self.chunksize]
+                hashed = (current[:, :, None]*self.hash_a + self.hash_b) >> np.uint64(32)
+                hashed[~current_valid] = max_value
+                signatures[start:start+self.chunksize] = hashed.min(axis=1)
+        return signatures, lengths>=self.q
+
+    def _buckets(self, signatures, has_qgrams):
+        '''
+            Bucket of each record in each band, as a frame with the columns 'band', 'key' and 'position'.
+        '''
+        positions = np.flatnonzero(has_qgrams)
+        banded = signatures[positions].reshape(len(positions), self.bands, self.rows)
+        with np.errstate(over='ignore'):
+            keys = (banded*self.band_weights).sum(axis=2, dtype=np.uint64)
+        return pd.DataFrame({
+            "band": np.repeat(np.arange(self.bands), len(positions)),
+            "key": keys.T.ravel(),
+            "position": np.tile(positions, self.bands),
+        })
+
+    def _pairs(self, df_a, df_b, dedup):
+        signatures_a, has_qgrams_a = self.signatures(df_a, self.left_on)
+        signatures_b, has_qgrams_b = (signatures_a, has_qgrams_a) if dedup else self.signatures(df_b, self.right_on)
+
+        # -- records sharing a bucket in any band
+        buckets_a = self._buckets(signatures_a, has_qgrams_a)
+        buckets_b = buckets_a if dedup else self._buckets(signatures_b, has_qgrams_b)
+        shared = buckets_a.merge(buckets_b, on=["band", "key"], suffixes=("_a", "_b"))
+        left, right = shared["position_a"].to_numpy(np.int64), shared["position_b"].to_numpy(np.int64)
+        if dedup:
+            lower = left>right
+            left, right = left[lower], right[lower]
+        pair_keys = np.unique(left*len(df_b)+right)
+        left, right = pair_keys//len(df_b), pair_keys%len(df_b)
+
+        # -- estimated Jaccard similarity: fraction of equal signature values
+        keep = np.zeros(len(pair_keys), dtype=bool)
+        for start in range(0, len(pair_keys), self.chunksize):
+            current_left, current_right = left[start:start+self.chunksize], right[start:start+self.chunksize]
+            similarity = (signatures_a[current_left]==signatures_b[current_right]).mean(axis=1)
+            keep[start:start+self.chunksize] = similarity>=self.threshold
+
+        return pd.MultiIndex(
+            levels=[df_a.index.values, df_b.index.values],
+            codes=[left[keep], right[keep]],
+            verify_integrity=False,
+        )
+
+    def _link_index(self, df_a, df_b):
+        return self._pairs(df_a, df_b, dedup=False)
+
+    def _dedup_index(self, df_a):
+        return self._pairs(df_a, df_a, dedup=True)
+
+class RareTokenIndex(BaseIndexAlgorithm):
+    '''
+        Inverted index of the words (tokens) of one or more fields, restricted to uncommon tokens.
+
+        Each token defines a block with the records containing it. Common tokens (e.g. 'MARIA',
+        'JOSE', 'SILVA') and particles (e.g. 'DA', 'DOS') are skipped: a token is used only if its
+        block has at most 'max_block_size' records (and, optionally, if its frequency among the
+        records is at most 'max_frequency'), so no block grows quadratically with the data. The candidate
+        pairs are the pairs of records sharing at least 'min_shared' of these rare tokens.
+
+        Args:
+        -----
+            left_on:
+                String or list of strings. Field(s) of the left-hand dataframe.
+            right_on:
+                String or list of strings. Field(s) of the right-hand dataframe.
+            max_frequency:
+                Float. Optional. Maximum fraction of the records containing a token.
+            max_block_size:
+                Integer. Maximum number of records containing a token.
+            min_shared:
+                Integer. Minimum number of rare tokens shared by a candidate pair.
+            min_length:
+                Integer. Minimum number of characters of a token.
+    '''
+    def __init__(self, left_on, right_on=None, max_frequency=None, max_block_size=100, min_shared=2, min_length=3, **kwargs):
+        super().__init__(**kwargs)
+        self.left_on = [left_on] if isinstance(left_on, str) else list(left_on)
+        self.right_on = self.left_on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+        self.max_frequency, self.max_block_size = max_frequency, max_block_size
+        self.min_shared, self.min_length = min_shared, min_length
+
+    def tokens(self, df, fields):
+        '''
+            Distinct tokens of each record, as a frame with the columns 'position' and 'token'.
+        '''
+        text = df[fields[0]].fillna('').astype(str)
+        for field in fields[1:]:
+            text = text + ' ' + df[field].fillna('').astype(str)
+        tokens = text.set_axis(np.arange(len(df))).str.split().explode().dropna()
+        tokens = tokens[tokens.str.len()>=self.min_length]
+        return pd.DataFrame({"position": tokens.index.to_numpy(np.int64), "token": tokens.to_numpy()}).drop_duplicates()
+
+    def _pairs(self, df_a, df_b, dedup):
+        tokens_a = self.tokens(df_a, self.left_on)
+        tokens_b = tokens_a if dedup else self.tokens(df_b, self.right_on)
+
+        # -- rare tokens: frequency over all records (both dataframes for linkage)
+        counts = tokens_a["token"].value_counts() if dedup else tokens_a["token"].value_counts().add(tokens_b["token"].value_counts(), fill_value=0)
+        number_of_records = len(df_a) if dedup else len(df_a)+len(df_b)
+        is_rare = (counts>=2) & (counts<=self.max_block_size)
+        if self.max_frequency is not None:
+            is_rare &= counts<=self.max_frequency*number_of_records
+        rare = counts[is_rare].index
+        tokens_a = tokens_a[tokens_a["token"].isin(rare)]
+        tokens_b = tokens_a if dedup else tokens_b[tokens_b["token"].isin(rare)]
+
+        # -- pairs within each block, kept if they share enough tokens
+        shared = tokens_a.merge(tokens_b, on="token", suffixes=("_a", "_b"))
+        left, right = shared["position_a"].to_numpy(np.int64), shared["position_b"].to_numpy(np.int64)
+        if dedup:
+            lower = left>right
+            left, right = left[lower], right[lower]
+        pair_keys, number_shared = np.unique(left*len(df_b)+right, return_counts=True)
+        pair_keys = pair_keys[number_shared>=self.min_shared]
+
+        return pd.MultiIndex(
+            levels=[df_a.index.values, df_b.index.values],
+            codes=[pair_keys//len(df_b), pair_keys%len(df_b)],
+            verify_integrity=False,
+        )
+
+    def _link_index(self, df_a, df_b):
+        return self._pairs(df_a, df_b, dedup=False)
+
+    def _dedup_index(self, df_a):
+        return self._pairs(df_a, df_a, dedup=True)
+
+def bucket_pairs(buckets_a, positions_a, buckets_b, positions_b, dedup=False, blocksize=200000):
+    '''
+        Pairs of records sharing a bucket, generated a few buckets at a time.
+
+        Buckets are filled in chunks of about 'blocksize' pairs; a bucket with more pairs is split
+        into slices of its left records. A record may belong to several buckets (and a pair may be
+        generated by each bucket its records share).
+
+        Args:
+        -----
+            buckets_a, buckets_b:
+                numpy.array of int64. Bucket of each entry of the left and right records.
+            positions_a, positions_b:
+                numpy.array of int64. Position of the record of each entry.
+            dedup:
+                Boolean. If True, only pairs with the left position greater than the right one are kept.
+        Yield:
+        ------
+            left_positions, right_positions, buckets:
+                numpy.array of int64. Pairs of positions and the bucket generating each pair.
+    '''
+    order_a, order_b = np.lexsort((positions_a, buckets_a)), np.lexsort((positions_b, buckets_b))
+    buckets_a, positions_a = buckets_a[order_a], positions_a[order_a]
+    buckets_b, positions_b = buckets_b[order_b], positions_b[order_b]
+    keys_a, start_a, count_a = np.unique(buckets_a, return_index=True, return_counts=True)
+    keys_b, start_b, count_b = np.unique(buckets_b, return_index=True, return_counts=True)
+    keys, index_a, index_b = np.intersect1d(keys_a, keys_b, assume_unique=True, return_indices=True)
+    start_a, count_a, start_b, count_b = start_a[index_a], count_a[index_a], start_b[index_b], count_b[index_b]
+
+    # -- slices of at most 'blocksize' pairs of each bucket
+    rows = np.maximum(1, blocksize//count_b)
+    nslices = (count_a-1)//rows + 1
+    bucket = np.repeat(np.arange(len(keys)), nslices)
+    first_slice = np.repeat(np.cumsum(nslices)-nslices, nslices)
+    offset = (np.arange(len(bucket))-first_slice)*rows[bucket]
+    slice_start, slice_count = start_a[bucket]+offset, np.minimum(rows[bucket], count_a[bucket]-offset)
+    sizes = slice_count*count_b[bucket]
+
+    # -- consecutive slices grouped in chunks of about 'blocksize' pairs
+    chunk = np.cumsum(sizes)//max(blocksize, 1)
+    bounds = np.flatnonzero(np.diff(chunk))+1
+    for current in np.split(np.arange(len(bucket)), bounds):
+        if len(current)==0:
+            continue
+        current_sizes = sizes[current]
+        pair_slice = np.repeat(current, current_sizes)
+        within = np.arange(current_sizes.sum())-np.repeat(np.cumsum(current_sizes)-current_sizes, current_sizes)
+        ncols = count_b[bucket[pair_slice]]
+        left = positions_a[slice_start[pair_slice]+within//ncols]
+        right = positions_b[start_b[bucket[pair_slice]]+within%ncols]
+        pair_buckets = keys[bucket[pair_slice]]
+        if dedup:
+            lower = left>right
+            left, right, pair_buckets = left[lower], right[lower], pair_buckets[lower]
+        if len(left):
+            yield left, right, pair_buckets
+
+def key_codes(left_df, right_df, left_on, right_on, dedup=False):
+    '''
+        Common integer codes of the values of the fields 'left_on' and 'right_on' (-1 if any field
+        is missing), so records with equal codes have equal values in all fields.
+    '''
+    left = left_df[left_on].set_axis(left_on, axis=1)
+    frame = left if dedup else pd.concat([left, right_df[right_on].set_axis(left_on, axis=1)], ignore_index=True)
+    codes = np.full(len(frame), -1, dtype=np.int64)
+    valid = frame.notna().all(axis=1).to_numpy()
+    if valid.any():
+        codes[valid] = frame[valid].groupby(left_on, sort=False).ngroup().to_numpy(np.int64)
+    return (codes, codes) if dedup else (codes[:len(left_df)], codes[len(left_df):])
+
+class PassKeys(ABC):
+    '''
+        Blocking keys of the records of a pass. The pairs of the pass are generated in chunks
+        ('iter_pairs'), each pair once, and whether a pair belongs to the pass is computed from the
+        keys of its records ('contains'), so the pairs of a pass are never stored.
+    '''
+    @abstractmethod
+    def iter_pairs(self, blocksize=200000):
+        '''
+            Generate the pairs of the pass as (left, right) arrays of positions of the records,
+            with at most 'blocksize' pairs each.
+        '''
+
+    @abstractmethod
+    def contains(self, left, right):
+        '''
+            Boolean array indicating which pairs of positions (left, right) belong to the pass.
+        '''
+
+class BlockKeys(PassKeys):
+    '''
+        Exact blocking: records with equal values in all fields (as 'recordlinkage.index.Block').
+    '''
+    def __init__(self, left_df, right_df, left_on, right_on, dedup=False):
+        self.dedup = dedup
+        self.codes_a, self.codes_b = key_codes(left_df, right_df, left_on, right_on, dedup)
+
+    def iter_pairs(self, blocksize=200000):
+        valid_a, valid_b = np.flatnonzero(self.codes_a>=0), np.flatnonzero(self.codes_b>=0)
+        for left, right, _ in bucket_pairs(self.codes_a[valid_a], valid_a, self.codes_b[valid_b], valid_b, self.dedup, blocksize):
+            yield left, right
+
+    def contains(self, left, right):
+        return (self.codes_a[left]>=0) & (self.codes_a[left]==self.codes_b[right])
+
+class SortedNeighbourhoodKeys(PassKeys):
+    '''
+        Sorted neighbourhood: records within 'window' positions after sorting by the first field,
+        with equal values for the remaining fields (as 'recordlinkage.index.SortedNeighbourhood').
+    '''
+    def __init__(self, left_df, right_df, left_on, right_on, window, dedup=False):
+        self.dedup, self.half_window = dedup, (window-1)//2
+        sort_a, sort_b = left_df[left_on[0]], right_df[right_on[0]]
+        if len(left_on)>1:
+            self.codes_a, self.codes_b = key_codes(left_df, right_df, left_on[1:], right_on[1:], dedup)
+        else:
+            self.codes_a, self.codes_b = np.zeros(len(left_df), dtype=np.int64), np.zeros(len(right_df), dtype=np.int64)
+        self.codes_a = np.where(sort_a.notna().to_numpy(), self.codes_a, -1)
+        self.codes_b = np.where(sort_b.notna().to_numpy(), self.codes_b, -1)
+
+        # -- rank of the sorting values among the distinct values of both dataframes
+        valid_a, valid_b = self.codes_a>=0, self.codes_b>=0
+        sorting_values = np.unique(np.concatenate([sort_a.to_numpy()[valid_a], sort_b.to_numpy()[valid_b]]))
+        self.ranks_a, self.ranks_b = np.full(len(left_df), -1, dtype=np.int64), np.full(len(right_df), -1, dtype=np.int64)
+        self.ranks_a[valid_a] = np.searchsorted(sorting_values, sort_a.to_numpy()[valid_a])
+        self.ranks_b[valid_b] = np.searchsorted(sorting_values, sort_b.to_numpy()[valid_b])
+        self.number_of_ranks = len(sorting_values)+2*self.half_window+1
+
+    def iter_pairs(self, blocksize=200000):
+        valid_a, valid_b = np.flatnonzero(self.codes_a>=0), np.flatnonzero(self.codes_b>=0)
+        buckets_a = self.codes_a[valid_a]*self.number_of_ranks + self.ranks_a[valid_a] + self.half_window
+        # -- each lag between the ranks of the records is a separate join (a pair has a single lag)
+        for lag in range(-self.half_window, self.half_window+1):
+            buckets_b = self.codes_b[valid_b]*self.number_of_ranks + self.ranks_b[valid_b] + lag + self.half_window
+            for left, right, _ in bucket_pairs(buckets_a, valid_a, buckets_b, valid_b, self.dedup, blocksize):
+                yield left, right
+
+    def contains(self, left, right):
+        return (self.codes_a[left]>=0) & (self.codes_a[left]==self.codes_b[right]) & (np.abs(self.ranks_a[left]-self.ranks_b[right])<=self.half_window)
+
+class MinHashKeys(PassKeys):
+    '''
+        Bands of the MinHash signatures of the records (see 'MinHashLSH'). A pair is generated by
+        the first band its records share.
+    '''
+    def __init__(self, indexer, left_df, right_df, dedup=False):
+        self.indexer, self.dedup = indexer, dedup
+        self.signatures_a, has_qgrams_a = indexer.signatures(left_df, indexer.left_on)
+        self.signatures_b, has_qgrams_b = (self.signatures_a, has_qgrams_a) if dedup else indexer.signatures(right_df, indexer.right_on)
+        self.bands_a = self._bands(self.signatures_a)
+        self.bands_b = self.bands_a if dedup else self._bands(self.signatures_b)
+        self.positions_a, self.positions_b = np.flatnonzero(has_qgrams_a), np.flatnonzero(has_qgrams_b)
+        self.has_qgrams_a, self.has_qgrams_b = has_qgrams_a, has_qgrams_b
+
+    def _bands(self, signatures):
+        banded = signatures.reshape(len(signatures), self.indexer.bands, self.indexer.rows)
+        with np.errstate(over='ignore'):
+            return (banded*self.indexer.band_weights).sum(axis=2, dtype=np.uint64)
+
+    def _similar(self, left, right):
+        keep = np.zeros(len(left), dtype=bool)
+        for start in range(0, len(left), self.indexer.chunksize):
+            current_left, current_right = left[start:start+self.indexer.chunksize], right[start:start+self.indexer.chunksize]
+            similarity = (self.signatures_a[current_left]==self.signatures_b[current_right]).mean(axis=1)
+            keep[start:start+self.indexer.chunksize] = similarity>=self.indexer.threshold
+        return keep
+
+    def iter_pairs(self, blocksize=200000):
+        for band in range(self.indexer.bands):
+            keys_a, keys_b = self.bands_a[self.positions_a, band], self.bands_b[self.positions_b, band]
+            codes, _ = pd.factorize(np.concatenate([keys_a, keys_b]))
+            codes = codes.astype(np.int64)
+            for left, right, _ in bucket_pairs(codes[:len(keys_a)], self.positions_a, codes[len(keys_a):], self.positions_b, self.dedup, blocksize):
+                first_band = ~(self.bands_a[left, :band]==self.bands_b[right, :band]).any(axis=1)
+                left, right = left[first_band], right[first_band]
+                keep = self._similar(left, right)
+                yield left[keep], right[keep]
+
+    def contains(self, left, right):
+        shared = (self.bands_a[left]==self.bands_b[right]).any(axis=1) & self.has_qgrams_a[left] & self.has_qgrams_b[right]
+        result = np.zeros(len(left), dtype=bool)
+        result[shared] = self._similar(left[shared], right[shared])
+        return result
+
+class RareTokenKeys(PassKeys):
+    '''
+        Rare tokens of the records (see 'RareTokenIndex'). A pair is generated by the first rare
+        token its records share.
+    '''
+    def __init__(self, indexer, left_df, right_df, dedup=False):
+        self.indexer, self.dedup = indexer, dedup
+        tokens_a = indexer.tokens(left_df, indexer.left_on)
+        tokens_b = tokens_a if dedup else indexer.tokens(right_df, indexer.right_on)
+
+        # -- rare tokens: frequency over all records (both dataframes for linkage), as in 'RareTokenIndex'
+        counts = tokens_a["token"].value_counts() if dedup else tokens_a["token"].value_counts().add(tokens_b["token"].value_counts(), fill_value=0)
+        number_of_records = len(left_df) if dedup else len(left_df)+len(right_df)
+        is_rare = (counts>=2) & (counts<=indexer.max_block_size)
+        if indexer.max_frequency is not None:
+            is_rare &= counts<=indexer.max_frequency*number_of_records
+        rare = pd.Index(counts[is_rare].index)
+        self.number_of_tokens = len(rare)
+        self.tokens_a = self._sparse(tokens_a, rare, len(left_df))
+        self.tokens_b = self.tokens_a if dedup else self._sparse(tokens_b, rare, len(right_df))
+
+    def _sparse(self, tokens, rare, number_of_records):
+        '''
+            Codes of the rare tokens of each record, sorted by record: (positions, codes, offsets).
+        '''
+        codes = rare.get_indexer(tokens["token"])
+        positions, codes = tokens["position"].to_numpy(np.int64)[codes>=0], codes[codes>=0].astype(np.int64)
+        order = np.lexsort((codes, positions))
+        positions, codes = positions[order], codes[order]
+        offsets = np.searchsorted(positions, np.arange(number_of_records+1))
+        return positions, codes, offsets
+
+    def _expand(self, sparse, records):
+        '''
+            Token codes of each record of 'records', with the index of the record in 'records'.
+        '''
+        _, codes, offsets = sparse
+        sizes = offsets[records+1]-offsets[records]
+        index = np.repeat(np.arange(len(records)), sizes)
+        within = np.arange(sizes.sum())-np.repeat(np.cumsum(sizes)-sizes, sizes)
+        return index, codes[offsets[records][index]+within]
+
+    def _shared(self, left, right):
+        '''
+            Number of rare tokens shared by each pair and the smallest of them (-1 if none).
+        '''
+        index_a, codes_a = self._expand(self.tokens_a, left)
+        index_b, codes_b = self._expand(self.tokens_b, right)
+        keys = np.concatenate([index_a*self.number_of_tokens+codes_a, index_b*self.number_of_tokens+codes_b])
+        keys, counts = np.unique(keys, return_counts=True)
+        shared = keys[counts==2]
+        number_shared = np.bincount(shared//self.number_of_tokens, minlength=len(left))
+        first_shared = np.full(len(left), -1, dtype=np.int64)
+        # -- keys are sorted, so the first key of each pair has its smallest token
+        pair_index, first = np.unique(shared//self.number_of_tokens, return_index=True)
+        first_shared[pair_index] = shared[first]%self.number_of_tokens
+        return number_shared, first_shared
+
+    def iter_pairs(self, blocksize=200000):
+        positions_a, codes_a, _ = self.tokens_a
+        positions_b, codes_b, _ = self.tokens_b
+        for left, right, token in bucket_pairs(codes_a, positions_a, codes_b, positions_b, self.dedup, blocksize):
+            number_shared, first_shared = self._shared(left, right)
+            keep = (number_shared>=self.indexer.min_shared) & (first_shared==token)
+            yield left[keep], right[keep]
+
+    def contains(self, left, right):
+        if self.number_of_tokens==0:
+            return np.zeros(len(left), dtype=bool)
+        return self._shared(left, right)[0]>=self.indexer.min_shared
+
+class MultiPassBlocking:
+    '''
+        Union of blocking passes.
+
+        Args:
+        -----
+            passes:
+                List of BlockingPass.
+
+        Attributes:
+        -----------
+            counts:
+                pandas.DataFrame. For each pass, the number of candidate pairs it generated
+                ('candidates') and how many of them were not found by the previous passes ('new').
+    '''
+    def __init__(self, passes):
+        self.passes = list(passes)
+        self.counts = None
+        if len(self.passes)==0:
+            raise Exception("At least one blocking pass must be provided.")
+
+    def iter_pairs(self, left_df, right_df=None, blocksize=200000, verbose=True):
+        '''
+            Candidate pairs of all passes, without repetitions, generated lazily as blocks of
+            integer positions.
+
+            Each pass generates its pairs a few blocking keys at a time (see 'PassKeys'). A pair is
+            discarded if one of the previous passes contains it, which is computed from the keys of
+            its records, so neither the pairs of a pass nor the pairs already generated are stored.
+
+            Args:
+            -----
+                left_df:
+                    pandas.DataFrame. Records indexed by their unique identifier.
+                right_df:
+                    pandas.DataFrame. Optional. Records to be linked to 'left_df'.
+                blocksize:
+                    Integer. Maximum number of pairs in each block.
+            Yield:
+            ------
+                left_positions, right_positions:
+                    numpy.array of int64. Positions of the records of each pair in 'left_df' and
+                    'right_df' (or 'left_df', for deduplication).
+        '''
+        previous, counts = [], []
+        buffer_left, buffer_right, buffered = [], [], 0
+        for current_pass in self.passes:
+            keys = current_pass.keys(left_df, right_df)
+            ncandidates, nnew = 0, 0
+            for left, right in keys.iter_pairs(blocksize=blocksize):
+                ncandidates += len(left)
+                for previous_keys in previous:
+                    found = previous_keys.contains(left, right)
+                    left, right = left[~found], right[~found]
+                nnew += len(left)
+                buffer_left.append(left)
+                buffer_right.append(right)
+                buffered += len(left)
+
+                # -- blocks of 'blocksize' pairs, whatever the number of pairs of each chunk of keys
+                while buffered>=blocksize:
+                    left, right = np.concatenate(buffer_left), np.concatenate(buffer_right)
+                    yield left[:blocksize], right[:blocksize]
+                    buffer_left, buffer_right, buffered = [left[blocksize:]], [right[blocksize:]], len(left)-blocksize
+
+            previous.append(keys)
+            counts.append((current_pass.name, ncandidates, nnew))
+            if verbose:
+                print(f"Blocking pass '{current_pass.name}': {ncandidates} pairs ({nnew} new).")
+
+        if buffered:
+            yield np.concatenate(buffer_left), np.concatenate(buffer_right)
+        self.counts = pd.DataFrame(counts, columns=["pass", "candidates", "new"])
+
+    def index(self, left_df, right_df=None, verbose=True):
+        '''
+            Candidate pairs of all passes, without repetitions.
+
+            For deduplication, all recordlinkage algorithms return the pairs of the lower triangular
+            part of the comparison matrix, so the same pair has the same orientation in all passes.
+
+            Args:
+            -----
+                left_df:
+                    pandas.DataFrame. Records indexed by their unique identifier.
+                right_df:
+                    pandas.DataFrame. Optional. Records to be linked to 'left_df'.
+            Return:
+            -------
+                candidate_pairs:
+                    pandas.MultiIndex.
+        '''
+        blocks = list(self.iter_pairs(left_df, right_df, verbose=verbose))
+        left = np.concatenate([ block[0] for block in blocks ]) if len(blocks) else np.empty(0, dtype=np.int64)
+        right = np.concatenate([ block[1] for block in blocks ]) if len(blocks) else np.empty(0, dtype=np.int64)
+        return pairs_from_positions(left, right, left_df, right_df)
+
+def pairs_from_positions(left_positions, right_positions, left_df, right_df=None):
+    '''
+        Candidate pairs (pandas.MultiIndex of IDs) from the positions of the records. The levels
+        are the indexes of the dataframes, so no tuples are built.
+    '''
+    other_df = left_df if right_df is None else right_df
+    return pd.MultiIndex(
+        levels=[left_df.index.values, other_df.index.values],
+        codes=[left_positions, right_positions],
+        names=[left_df.index.name, other_df.index.name],
+        verify_integrity=False,
+    )
@@ -1,12 +1,28 @@
 # -*- coding: utf-8 -*- 
 
 import os
+import multiprocessing
 import ujson as json
 import numpy as np
 import pandas as pd
 import recordlinkage
 
 import lente_ist.data_matching.utils as matching_utils
+from lente_ist.data_matching.string_compare import DamerauLevenshtein
+from lente_ist.data_matching.blocking import pairs_from_positions
+from concurrent.futures import ProcessPoolExecutor
+
+# -- comparison settings and dataframes used by the worker processes. With the 'fork' start
+# -- method they are inherited from the parent process, otherwise they are set once per worker.
+_worker_state = None
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+def _compare_block(pairs):
+    compare_cl, left_df, right_df = _worker_state
+    return compare_cl.compute(pairs, left_df, right_df)
 
 class MatchingBase:
     '''
@@ -25,17 +41,24 @@ class MatchingBase:
                 String. Unique ID for the right-hand dataframe.
             env_folder:
                 String. Optional path to the folder pairs' storage.
+            integer_ids:
+                Boolean. Default False. If True, the records are indexed internally by dense integer
+                codes (their positions) instead of their IDs, so the candidate pairs, comparisons
+                and classification work on pairs of integers. Use 'decode_pairs' and 'encode_pairs'
+                to convert the pairs at the edges (e.g. storage).
 
         Attributes:
         -----------
             comparison_matrix:
                 pandas.DataFrame.
     '''
-    def __init__(self, left_df, right_df=None, left_id=None, right_id=None, env_folder=None) -> None:
+    def __init__(self, left_df, right_df=None, left_id=None, right_id=None, env_folder=None, integer_ids=False) -> None:
         self.linkage_vars = None
         self.candidate_pairs = None
+        self.blocking, self.blocking_counts, self.pair_names = None, None, None
         self.name_ranks = None
         self.compare_cl, self._comparison_matrix = None, None
+        self._features_fitted = False
 
         # -- solve init for the left dataframe
         self.left_df, self.left_id = left_df.copy(), left_id
@@ -50,6 +73,15 @@ class MatchingBase:
             if self.right_id is None or self.right_id not in self.right_df.columns:
                 raise Exception("Must provide an existing field as a unique identifier.")
             self.right_df = self.right_df.set_index(self.right_id)
+
+        # -- integer codes of the records: the IDs are kept aside and the dataframes indexed by position
+        self.left_ids, self.right_ids = None, None
+        if integer_ids:
+            self.left_ids = self.left_df.index.to_numpy()
+            self.left_df.index = pd.RangeIndex(self.left_df.shape[0], name=self.left_id)
+            if self.right_df is not None:
+                self.right_ids = self.right_df.index.to_numpy()
+                self.right_df.index = pd.RangeIndex(self.right_df.shape[0], name=self.right_id)
             
         # -- select working folder
         self.env_folder = env_folder
@@ -71,7 +103,7 @@ class MatchingBase:
     # ---------------------------------------------------------
     # --------------- Matching general settings ---------------
     
-    def set_linkage_variables(self, linkage_vars, string_method="damerau_levenshtein"):
+    def set_linkage_variables(self, linkage_vars, string_method="damerau_levenshtein", string_engine="recordlinkage"):
         '''
             Define the variables to be compared and the method of comparison.
             
@@ -88,13 +120,24 @@ class MatchingBase:
                     'numerical', ...).
 
                     4th position is the label of the comparison.   
+                string_method:
+                    String. Method of comparison for the 'string' fields.
+                string_engine:
+                    String. {'recordlinkage', 'numpy'}. Engine for the 'string' comparisons. 'numpy'
+                    encodes the strings once per dataframe and scores whole blocks of pairs at once.
+                    It is available only for the 'damerau_levenshtein' method, with the same scores.
         '''
+        if string_engine=='numpy' and string_method!='damerau_levenshtein':
+            raise Exception("The 'numpy' string engine only supports the 'damerau_levenshtein' method.")
+
         self.linkage_vars = linkage_vars
-        self.compare_cl = recordlinkage.Compare()
+        self.compare_cl, self._features_fitted = recordlinkage.Compare(), False
         for elem in self.linkage_vars:
             left_field, right_field, cmethod, label = elem[0], elem[1], elem[2], elem[3]
             if cmethod=='exact':
                 self.compare_cl.exact(left_field, right_field, label=label)
+            elif cmethod=='string' and string_engine=='numpy':
+                self.compare_cl.add(DamerauLevenshtein(left_field, right_field, label=label))
             elif cmethod=='string':
                 self.compare_cl.string(left_field, right_field, label=label, method=string_method, threshold=None)
             elif cmethod=='numerical':
@@ -105,6 +148,186 @@ class MatchingBase:
                 pass
         return self
     
+    def fit_compare_features(self):
+        '''
+            Encode, once per dataframe, the fields used by comparison features that need it
+            (e.g. the 'numpy' string engine).
+        '''
+        if self._features_fitted:
+            return self
+        for feature in self.compare_cl.features:
+            if hasattr(feature, 'fit'):
+                feature.fit(self.left_df, self.right_df)
+        self._features_fitted = True
+        return self
+
+    def compute_blocks(self, blocks, n_jobs=1, verbose=True):
+        '''
+            Compare the blocks of candidate pairs and concatenate the results in the original order.
+
+            Args:
+            -----
+                blocks:
+                    List of pandas.MultiIndex. Blocks of candidate pairs.
+                n_jobs:
+                    Integer. Number of worker processes. With n_jobs=1 the blocks are compared
+                    sequentially in the current process. The dataframes are not sent along with
+                    each block: the workers inherit them when the 'fork' start method is available
+                    or receive them only once at startup otherwise.
+            Return:
+            -------
+                comparison_matrix:
+                    pandas.DataFrame.
+        '''
+        global _worker_state
+        if n_jobs==1:
+            results = []
+            for index, subset_candidate_pairs in enumerate(blocks):
+                if verbose:
+                    print(f"Matching subset batch {index+1}/{len(blocks)} of size {subset_candidate_pairs.shape[0]} ...")
+                results.append( self.compare_cl.compute(subset_candidate_pairs, self.left_df, self.right_df) )
+            return pd.concat(results)
+
+        state = (self.compare_cl, self.left_df, self.right_df)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            _worker_state = state
+            pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(state,))
+
+        if verbose:
+            print(f"Matching {len(blocks)} subset batches with {n_jobs} processes ...")
+        try:
+            with pool:
+                # -- 'map' yields the results in the order of the blocks.
+                results = list(pool.map(_compare_block, blocks))
+        finally:
+            _worker_state = None
+        return pd.concat(results)
+
+    def finish_comparison(self, comparison_matrix, threshold=None):
+        '''
+            Apply the score threshold to a comparison matrix and include the ranking of first names.
+
+            Args:
+            -----
+                comparison_matrix:
+                    pandas.DataFrame. Result of the comparison of a set of candidate pairs.
+                threshold:
+                    Float. All scores less than 'threshold' are reduced to zero.
+        '''
+        if threshold is not None and threshold<=1.0:
+            comparison_matrix[comparison_matrix<threshold] = 0.0
+
+        self.get_rank_names()
+        return comparison_matrix.merge(self.name_ranks, left_on=[comparison_matrix.index.names[0]], right_index=True, how="left").fillna(7)
+
+    def decode_pairs(self, pairs):
+        '''
+            Pairs of record IDs from pairs of integer codes (see 'integer_ids'). The IDs are taken
+            by position, without hashing them.
+
+            Args:
+            -----
+                pairs:
+                    pandas.MultiIndex. Pairs of integer codes.
+        '''
+        if self.left_ids is None:
+            return pairs
+        right_ids = self.left_ids if self.right_ids is None else self.right_ids
+        return pd.MultiIndex(
+            levels=[self.left_ids, right_ids],
+            codes=[pairs.get_level_values(0).to_numpy(), pairs.get_level_values(1).to_numpy()],
+            names=pairs.names, verify_integrity=False,
+        )
+
+    def encode_pairs(self, pairs):
+        '''
+            Pairs of integer codes from pairs of record IDs (see 'integer_ids'). Pairs with IDs not
+            present in the data are discarded.
+
+            Args:
+            -----
+                pairs:
+                    pandas.MultiIndex or list of 2-tuples. Pairs of IDs.
+        '''
+        if self.left_ids is None:
+            return pairs
+        if len(pairs)==0:
+            return pd.MultiIndex.from_arrays([np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)], names=self.pair_names)
+        if not isinstance(pairs, pd.MultiIndex):
+            pairs = pd.MultiIndex.from_tuples(list(pairs))
+        right_ids = self.left_ids if self.right_ids is None else self.right_ids
+        left = pd.Index(self.left_ids).get_indexer(pairs.get_level_values(0))
+        right = pd.Index(right_ids).get_indexer(pairs.get_level_values(1))
+        known = (left>=0) & (right>=0)
+        return pd.MultiIndex.from_arrays([left[known], right[known]], names=self.pair_names)
+
+    def iter_candidate_pairs(self, chunksize=200000):
+        '''
+            Candidate pairs in blocks of at most 'chunksize' pairs.
+
+            If the pairs were defined with 'lazy=True', each block is generated from the integer
+            positions yielded by the blocking passes, so the complete list of candidate pairs is
+            never held in memory. Otherwise, the blocks are slices of 'candidate_pairs'.
+
+            Yield:
+            ------
+                candidate_pairs:
+                    pandas.MultiIndex. Pairs of IDs of the current block.
+        '''
+        if self.candidate_pairs is not None:
+            for start in range(0, len(self.candidate_pairs), chunksize):
+                yield self.candidate_pairs[start:start+chunksize]
+            return
+        if self.blocking is None:
+            return
+
+        for left_positions, right_positions in self.blocking.iter_pairs(self.left_df, self.right_df, blocksize=chunksize):
+            yield pairs_from_positions(left_positions, right_positions, self.left_df, self.right_df).set_names(self.pair_names)
+        self.blocking_counts = self.blocking.counts
+
+    def stream_linkage(self, chunksize=200000, threshold=None, n_jobs=1, verbose=True, pair_filter=None):
+        '''
+            Perform the comparison calculations one chunk of candidate pairs at a time.
+
+            Instead of storing the complete 'comparison_matrix', the comparison matrix of each
+            chunk is yielded, so the memory is bounded by the size of the chunk.
+
+            Args:
+            -----
+                chunksize:
+                    Integer. Number of candidate pairs compared at each step.
+                threshold:
+                    Float. All scores less than 'threshold' are reduced to zero.
+                n_jobs:
+                    Integer. Number of processes comparing each chunk.
+                pair_filter:
+                    Callable. Optional. Receives the candidate pairs of each chunk and returns the
+                    ones to be compared (e.g. removing the pairs already compared).
+            Yield:
+            ------
+                comparison_matrix:
+                    pandas.DataFrame. Comparison matrix of the current chunk.
+        '''
+        if self.candidate_pairs is not None and len(self.candidate_pairs)==0:
+            return
+        self.fit_compare_features()
+
+        nchunks = f"/{(len(self.candidate_pairs)-1)//chunksize + 1}" if self.candidate_pairs is not None else ""
+        for index, subset_candidate_pairs in enumerate(self.iter_candidate_pairs(chunksize)):
+            if pair_filter is not None:
+                subset_candidate_pairs = pair_filter(subset_candidate_pairs)
+            if verbose:
+                print(f"Matching chunk {index+1}{nchunks} of size {subset_candidate_pairs.shape[0]} ...")
+            if len(subset_candidate_pairs)==0:
+                continue
+            if n_jobs>1:
+                comparison_matrix = self.compute_blocks(matching_utils.split_list(subset_candidate_pairs, n_jobs), n_jobs=n_jobs, verbose=False)
+            else:
+                comparison_matrix = self.compare_cl.compute(subset_candidate_pairs, self.left_df, self.right_df)
+            yield self.finish_comparison(comparison_matrix, threshold=threshold)
+
     def get_rank_names(self, rank_colnames=['rank_primeiro_nome', 'rank_primeiro_nome_mae']):
         '''
             Get the data with the ranking of first names. 
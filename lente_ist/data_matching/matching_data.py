@@ -3,14 +3,14 @@ import json
 import numpy as np
 import pandas as pd
 import recordlinkage
-from recordlinkage.index import SortedNeighbourhood
 
 from lente_ist.data_matching import MatchingBase
+from lente_ist.data_matching.blocking import BlockingPass, MultiPassBlocking
 import lente_ist.data_matching.utils as utils
 
 class Deduple(MatchingBase):
 
-    def define_pairs(self, blocking_var, window=1):
+    def define_pairs(self, blocking_var=None, window=1, passes=None, lazy=False):
         '''
             After setting the properties of the linkage, blocking is defined to generate the pairs 
             for comparison.
@@ -22,17 +22,29 @@ class Deduple(MatchingBase):
                 window:
                     Odd Integer. Window parameter for the sorted neighborhood blocking algorithm. 
                     window equal one means exact blocking.
+                passes:
+                    List of BlockingPass. If provided, the candidate pairs are the union of the pairs
+                    of all passes and 'blocking_var' and 'window' are ignored. The number of pairs
+                    of each pass is kept in the attribute 'blocking_counts'.
+                lazy:
+                    Boolean. Default False. If True, the candidate pairs are not built: they are
+                    generated block by block when consumed by 'stream_linkage' (see
+                    'MatchingBase.iter_candidate_pairs').
         '''
-        indexer = recordlinkage.Index()
-        indexer.add(SortedNeighbourhood(blocking_var, blocking_var, window=window))
-        self.candidate_pairs = indexer.index(self.left_df)
-        # -- sort the order of each pair with respect to the ID.
-        #self.candidate_pairs = pd.MultiIndex.from_tuples( list({*map(tuple, map(sorted, list(self.candidate_pairs)))}), names=[f"{self.left_id}_1", f"{self.left_id}_2"] )
-        self.candidate_pairs = pd.MultiIndex.from_tuples(list(self.candidate_pairs), names=[f"{self.left_id}_1", f"{self.left_id}_2"] )
+        if passes is None:
+            passes = [BlockingPass(blocking_var, blocking_var, method="sortedneighbourhood", window=window)]
+        blocking = MultiPassBlocking(passes)
+        self.pair_names = [f"{self.left_id}_1", f"{self.left_id}_2"]
+        if lazy:
+            self.candidate_pairs, self.blocking = None, blocking
+            return self
+
+        self.candidate_pairs = blocking.index(self.left_df, verbose=len(passes)>1).set_names(self.pair_names)
+        self.blocking_counts = blocking.counts
         print(f"Number of pairs: {len(self.candidate_pairs)}")
         return self
     
-    def perform_linkage(self, threshold=None, number_of_blocks=1, verbose=True):
+    def perform_linkage(self, threshold=None, number_of_blocks=1, n_jobs=1, verbose=True):
         '''
             Perform the comparison calculations.
 
@@ -43,40 +55,36 @@ class Deduple(MatchingBase):
                 number_of_blocks:
                     Integer. Number of partitions on the list of pairs to be compared. To be used
                     for larger datasets.
+                n_jobs:
+                    Integer. Number of processes comparing the partitions in parallel. When larger
+                    than 'number_of_blocks', the pairs are split into 'n_jobs' partitions.
         '''
-        
+        if self.candidate_pairs is None:
+            raise Exception("The candidate pairs were defined with 'lazy=True': compare them with 'stream_linkage'.")
+        number_of_blocks = max(number_of_blocks, n_jobs)
+        if len(self.candidate_pairs):
+            self.fit_compare_features()
+
         if len(self.candidate_pairs) and number_of_blocks==1:
             # -- one round of calculation for the complete list of pairs.
             self._comparison_matrix = self.compare_cl.compute(self.candidate_pairs, self.left_df)
         elif len(self.candidate_pairs) and number_of_blocks>1:
             # -- calculation by dividing the list of pairs into 'n' batches.
-            splitted_list = utils.split_list(list(self.candidate_pairs), number_of_blocks)
-            
-            self._comparison_matrix = []
-            for index, subset_candidate_pairs in enumerate(splitted_list):
-                #subset_candidate_pairs = pd.MultiIndex.from_tuples( list({*map(tuple, map(sorted, list(subset_candidate_pairs)))}), names=[f"{self.left_id}_1", f"{self.left_id}_2"] )
-                subset_candidate_pairs = pd.MultiIndex.from_tuples( list(subset_candidate_pairs), names=[f"{self.left_id}_1", f"{self.left_id}_2"] )
-                if verbose:
-                    print(f"Matching subset batch {index+1}/{len(splitted_list)} of size {subset_candidate_pairs.shape[0]} ...")
-                self._comparison_matrix.append( self.compare_cl.compute(subset_candidate_pairs, self.left_df) )
-            self._comparison_matrix = pd.concat(self._comparison_matrix)
+            splitted_list = utils.split_list(self.candidate_pairs, number_of_blocks)
+            self._comparison_matrix = self.compute_blocks(splitted_list, n_jobs=n_jobs, verbose=verbose)
             if verbose:
                 print('Done.')
         else:
             return self
 
-        # -- all scores less than 'threshold' are reduced to zero.
-        if threshold is not None and threshold<=1.0:
-            self._comparison_matrix[self._comparison_matrix<threshold] = 0.0
-
-        self.get_rank_names()
-        self._comparison_matrix = self.comparison_matrix.merge(self.name_ranks, left_on=[f"{self.left_id}_1"], right_index=True, how="left").fillna(7)
+        # -- all scores less than 'threshold' are reduced to zero and the ranks of first names are included.
+        self._comparison_matrix = self.finish_comparison(self._comparison_matrix, threshold=threshold)
 
         return self
 
 class PLinkage(MatchingBase):
 
-    def define_pairs(self, left_blocking_var, right_blocking_var, window=1):
+    def define_pairs(self, left_blocking_var=None, right_blocking_var=None, window=1, passes=None, lazy=False):
         '''
             After setting the properties of the linkage, blocking is defined to generate the pairs for 
             comparison.
@@ -90,16 +98,29 @@ class PLinkage(MatchingBase):
                 window:
                     Odd Integer. Window parameter for the sorted neighborhood blocking algorithm. 
                     window equal one means exact blocking.
+                passes:
+                    List of BlockingPass. If provided, the candidate pairs are the union of the pairs
+                    of all passes and the other blocking arguments are ignored. The number of pairs
+                    of each pass is kept in the attribute 'blocking_counts'.
+                lazy:
+                    Boolean. Default False. If True, the candidate pairs are not built: they are
+                    generated block by block when consumed by 'stream_linkage' (see
+                    'MatchingBase.iter_candidate_pairs').
         '''
-        indexer = recordlinkage.Index()
-        indexer.add(SortedNeighbourhood(left_blocking_var, right_blocking_var, window=window))
-        self.candidate_pairs = indexer.index(self.left_df, self.right_df)
-        # -- sort the order of each pair with respect to the ID. (THIS SORTING IS DANGEROUS)
-        self.candidate_pairs = pd.MultiIndex.from_tuples(list(self.candidate_pairs), names=[f"{self.left_id}", f"{self.right_id}"] )
+        if passes is None:
+            passes = [BlockingPass(left_blocking_var, right_blocking_var, method="sortedneighbourhood", window=window)]
+        blocking = MultiPassBlocking(passes)
+        self.pair_names = [f"{self.left_id}", f"{self.right_id}"]
+        if lazy:
+            self.candidate_pairs, self.blocking = None, blocking
+            return self
+
+        self.candidate_pairs = blocking.index(self.left_df, self.right_df, verbose=len(passes)>1).set_names(self.pair_names)
+        self.blocking_counts = blocking.counts
         print(f"Number of pairs: {len(self.candidate_pairs)}")
         return self
 
-    def perform_linkage(self, threshold=None, number_of_blocks=1, verbose=True):
+    def perform_linkage(self, threshold=None, number_of_blocks=1, n_jobs=1, verbose=True):
         '''
             Perform the comparison calculations.
 
@@ -110,35 +131,30 @@ class PLinkage(MatchingBase):
                 number_of_blocks:
                     Integer. Number of partitions on the list of pairs to be compared. To be used
                     for larger datasets.
+                n_jobs:
+                    Integer. Number of processes comparing the partitions in parallel. When larger
+                    than 'number_of_blocks', the pairs are split into 'n_jobs' partitions.
         '''
-        
+        if self.candidate_pairs is None:
+            raise Exception("The candidate pairs were defined with 'lazy=True': compare them with 'stream_linkage'.")
+        number_of_blocks = max(number_of_blocks, n_jobs)
+        if len(self.candidate_pairs):
+            self.fit_compare_features()
+
         if len(self.candidate_pairs) and number_of_blocks==1:
             # -- one round of calculation for the complete list of pairs.
             self._comparison_matrix = self.compare_cl.compute(self.candidate_pairs, self.left_df, self.right_df)
         elif len(self.candidate_pairs) and number_of_blocks>1:
             # -- calculation by dividing the list of pairs into 'n' batches.
-            splitted_list = utils.split_list(list(self.candidate_pairs), number_of_blocks)
-            
-            self._comparison_matrix = []
-            for index, subset_candidate_pairs in enumerate(splitted_list):
-                # -- expected format: labeled multiindex.
-                #subset_candidate_pairs = pd.MultiIndex.from_tuples( list({*map(tuple, map(sorted, list(subset_candidate_pairs)))}), names=[f"{self.right_id}", f"{self.left_id}"] )
-                subset_candidate_pairs = pd.MultiIndex.from_tuples( list(subset_candidate_pairs), names=[f"{self.left_id}", f"{self.right_id}"] )
-                if verbose:
-                    print(f"Matching subset batch {index+1}/{len(splitted_list)} of size {subset_candidate_pairs.shape[0]} ...")
-                # THERE IS AN ORDERING ISSUE HERE
-                self._comparison_matrix.append( self.compare_cl.compute(subset_candidate_pairs, self.left_df, self.right_df) )
-            self._comparison_matrix = pd.concat(self._comparison_matrix)
+            # -- slices of the labeled multiindex (no list of tuples is built).
+            splitted_list = utils.split_list(self.candidate_pairs, number_of_blocks)
+            self._comparison_matrix = self.compute_blocks(splitted_list, n_jobs=n_jobs, verbose=verbose)
             if verbose:
                 print('Done.')
         else:
             return self
 
-        # -- all scores less than 'threshold' are reduced to zero.
-        if threshold is not None and threshold<=1.0:
-            self._comparison_matrix[self._comparison_matrix<threshold] = 0.0
-
-        self.get_rank_names()
-        self._comparison_matrix = self.comparison_matrix.merge(self.name_ranks, left_on=[f"{self.left_id}"], right_index=True, how="left").fillna(7) # 7 or 0??
+        # -- all scores less than 'threshold' are reduced to zero and the ranks of first names are included.
+        self._comparison_matrix = self.finish_comparison(self._comparison_matrix, threshold=threshold)
 
         return self
\ No newline at end of file
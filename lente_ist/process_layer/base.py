@@ -2,6 +2,7 @@ import re
 import numpy as np
 import pandas as pd
 import lente_ist.utils as utils
+import lente_ist.process_layer.phonetic as phonetic
 
 class ProcessBase:
     '''
@@ -19,7 +20,7 @@ class ProcessBase:
     '''
     def __init__(self, raw_data, field_id):
         self.field_id = field_id
-        self._raw_data = raw_data.copy()
+        self._raw_data = raw_data.reset_index(drop=True)
         self._data = pd.DataFrame(self._raw_data[[self.field_id]])
 
         self.base_fields = ["NOME_PACIENTE", "DATA_NASCIMENTO", "NOME_MAE"]
@@ -50,23 +51,36 @@ class ProcessBase:
             Specific criteria, custom blocking variables and transformations are done in 
             'specific_standardize' method. 
         '''
-        self._data["NOME_PACIENTE"] = self._raw_data["NOME_PACIENTE"].apply(lambda x: utils.uniformize_name(x.upper().strip(), sep=" ") if pd.notna(x) else np.nan).apply(lambda x: re.sub(' {2,}', ' ', x) if pd.notna(x) else np.nan)
-        self._data["NOME_MAE"] = self._raw_data["NOME_MAE"].apply(lambda x: utils.uniformize_name(x.upper().strip(), sep=" ") if pd.notna(x) else np.nan).apply(lambda x: re.sub(' {2,}', ' ', x) if pd.notna(x) else np.nan)
+        # -- names are standardized once for each distinct value and broadcast back to the records
+        self._data["NOME_PACIENTE"] = utils.map_unique(self._raw_data["NOME_PACIENTE"], standardize_name)
+        self._data["NOME_MAE"] = utils.map_unique(self._raw_data["NOME_MAE"], standardize_name)
         self._data["DATA_NASCIMENTO"] = self._raw_data["DATA_NASCIMENTO"].copy()
 
-        self._data["primeiro_nome"] = self._data["NOME_PACIENTE"].apply(lambda x: x.split(" ")[0] if pd.notna(x) else np.nan )
-        self._data["complemento_nome"] = self._data["NOME_PACIENTE"].apply(lambda x: ' '.join(x.split(" ")[1:]) if pd.notna(x) and len(x.split(" "))>1 else np.nan )
+        self._data["primeiro_nome"] = utils.map_unique(self._data["NOME_PACIENTE"], lambda x: x.split(" ")[0])
+        self._data["complemento_nome"] = utils.map_unique(self._data["NOME_PACIENTE"], name_complement)
         
-        self._data["primeiro_nome_mae"] = self._data["NOME_MAE"].apply(lambda x: x.split(" ")[0] if pd.notna(x) else np.nan )
-        self._data["complemento_nome_mae"] = self._data["NOME_MAE"].apply(lambda x: ' '.join(x.split(" ")[1:]) if pd.notna(x) and len(x.split(" "))>1 else np.nan )
+        self._data["primeiro_nome_mae"] = utils.map_unique(self._data["NOME_MAE"], lambda x: x.split(" ")[0])
+        self._data["complemento_nome_mae"] = utils.map_unique(self._data["NOME_MAE"], name_complement)
         
-        self._data["nascimento_dia"] = self._data["DATA_NASCIMENTO"].apply(lambda x: x.day if hasattr(x, 'day') and pd.notna(x) else np.nan)
-        self._data["nascimento_mes"] = self._data["DATA_NASCIMENTO"].apply(lambda x: x.month if hasattr(x, 'day') and pd.notna(x) else np.nan)
-        self._data["nascimento_ano"] = self._data["DATA_NASCIMENTO"].apply(lambda x: x.year if hasattr(x, 'day') and pd.notna(x) else np.nan)
+        self._data["nascimento_dia"] = date_part(self._data["DATA_NASCIMENTO"], "day")
+        self._data["nascimento_mes"] = date_part(self._data["DATA_NASCIMENTO"], "month")
+        self._data["nascimento_ano"] = date_part(self._data["DATA_NASCIMENTO"], "year")
         
         # -- standard blocking variable
-        self._data["FONETICA_N"] = self._data[fonetica_column].apply(lambda x: f"{x.split(' ')[0]}{x.split(' ')[-1]}" if pd.notna(x) else np.nan)
+        self._data["FONETICA_N"] = utils.map_unique(self._data[fonetica_column], lambda x: f"{x.split(' ')[0]}{x.split(' ')[-1]}")
+        # -- phonetic blocking variables: codes of the first and last parts of the name, and of the surname only
+        self._data["FONETICA_BR"] = utils.map_unique(self._data[fonetica_column], phonetic.name_key)
+        self._data["FONETICA_SOBRENOME"] = utils.map_unique(self._data[fonetica_column], phonetic.surname_key)
 
+        return self.rank_names() # chaining
+
+    def rank_names(self):
+        '''
+            Frequency and rank of the first names (patient and patient's mother) within the records.
+
+            Unlike the other standardized fields, the ranks depend on the whole set of records
+            being processed.
+        '''
         # -- frequency of first names (patient and patient's mother)
         fst_name_freq = self._data["primeiro_nome"].value_counts().reset_index().rename({"index": "primeiro_nome", "count": "count_primeiro_nome"}, axis=1)
         mother_fst_name_freq = self._data["primeiro_nome_mae"].value_counts().reset_index().rename({"index": "primeiro_nome_mae", "count": "count_primeiro_nome_mae"}, axis=1)
@@ -84,16 +98,81 @@ class ProcessBase:
         self.freq_names = self.freq_names.drop(["count_primeiro_nome", "count_primeiro_nome_mae"], axis=1)
         self.freq_names = self.freq_names[["primeiro_nome", "norm_primeiro_nome", "rank_primeiro_nome", "primeiro_nome_mae", "norm_primeiro_nome_mae", "rank_primeiro_nome_mae"]].copy()
 
-        merged_primeiro_nome = self._data[pd.notna(self._data["primeiro_nome"])][[self.field_id, "primeiro_nome"]].merge(self.freq_names[["primeiro_nome", "norm_primeiro_nome", "rank_primeiro_nome"]], on="primeiro_nome", how="left")
-        merged_primeiro_nome_mae = self._data[pd.notna(self._data["primeiro_nome_mae"])][[self.field_id, "primeiro_nome_mae"]].merge(self.freq_names[["primeiro_nome_mae", "norm_primeiro_nome_mae", "rank_primeiro_nome_mae"]], on="primeiro_nome_mae", how="left")
-
+        # -- frequencies are aligned to the records through their first names
         if 'norm_primeiro_nome' not in self._data.columns and 'norm_primeiro_nome_mae' not in self._data.columns:
-            self._data = self._data.merge(merged_primeiro_nome[[self.field_id, "norm_primeiro_nome", "rank_primeiro_nome"]], on=self.field_id, how="left")
-            self._data = self._data.merge(merged_primeiro_nome_mae[[self.field_id, "norm_primeiro_nome_mae", "rank_primeiro_nome_mae"]], on=self.field_id, how="left")
+            fst_name_freq = self.freq_names.dropna(subset=["primeiro_nome"]).set_index("primeiro_nome")
+            mother_fst_name_freq = self.freq_names.dropna(subset=["primeiro_nome_mae"]).set_index("primeiro_nome_mae")
+            self.add_features({
+                "norm_primeiro_nome": self._data["primeiro_nome"].map(fst_name_freq["norm_primeiro_nome"]),
+                "rank_primeiro_nome": self._data["primeiro_nome"].map(fst_name_freq["rank_primeiro_nome"]),
+                "norm_primeiro_nome_mae": self._data["primeiro_nome_mae"].map(mother_fst_name_freq["norm_primeiro_nome_mae"]),
+                "rank_primeiro_nome_mae": self._data["primeiro_nome_mae"].map(mother_fst_name_freq["rank_primeiro_nome_mae"]),
+            })
 
         return self # chaining
 
     def specific_standardize(self):
         return self
 
-        
\ No newline at end of file
+    def add_features(self, features):
+        '''
+            Add derived fields to the processed data, aligned by position with 'raw_data'.
+
+            The processed data keeps one row per raw record in the same order, so new fields
+            are assigned as columns instead of merged through 'field_id' (which copies the
+            whole frame for each field).
+
+            Args:
+            -----
+                features:
+                    dict. Name of each new field and its values (pandas.Series or array with one
+                    value per record).
+        '''
+        for colname, values in features.items():
+            self._data[colname] = values.set_axis(self._data.index) if isinstance(values, pd.Series) else values
+        return self # chaining
+
+    @classmethod
+    def from_standardized(cls, standardized_data, field_id):
+        '''
+            Processor for records already standardized (e.g. loaded from 'StandardizedRecords').
+            Only the ranks of the first names, which depend on the set of records, are computed.
+
+            Args:
+            -----
+                standardized_data:
+                    pandas.DataFrame. Output of 'basic_standardize' and 'specific_standardize'
+                    without the rank columns.
+                field_id:
+                    String. Name of the field containing the unique identifier of the records.
+        '''
+        processor = cls(standardized_data, field_id)
+        processor._data = processor._raw_data.copy()
+        return processor.rank_names()
+
+
+def standardize_name(name):
+    '''
+        Uppercase name without special characters and with single spaces between its parts.
+    '''
+    return re.sub(' {2,}', ' ', utils.uniformize_name(name.upper().strip(), sep=" "))
+
+def name_complement(name):
+    '''
+        All parts of the name after the first one (NaN for single names).
+    '''
+    parts = name.split(" ")
+    return ' '.join(parts[1:]) if len(parts)>1 else np.nan
+
+def date_part(dates, part):
+    '''
+        Day, month or year of a column of dates (NaN for missing or invalid dates).
+
+        Datetime columns use the '.dt' accessor. Other columns are handled value by value,
+        once for each distinct value.
+    '''
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        values = getattr(dates.dt, part)
+        # -- integers when there are no missing dates, as when the parts are extracted one by one
+        return values.astype('float64') if values.isna().any() else values.astype('int64')
+    return utils.map_unique(dates, lambda x: getattr(x, part) if hasattr(x, 'day') else np.nan)
@@ -0,0 +1,78 @@
+'''
+    Phonetic codes for Brazilian names, following the rules of the BuscaBR algorithm.
+
+    Names written differently but pronounced alike receive the same code (e.g. 'WALESKA'
+    and 'VALESCA', 'SOUSA' and 'SOUZA', 'RAPHAEL' and 'RAFAEL'), so the codes can be used
+    as exact blocking keys. The code of each word is computed once and cached, and the
+    name keys are computed once for each distinct name (see 'utils.map_unique').
+'''
+
+import re
+import numpy as np
+from functools import lru_cache
+from unidecode import unidecode
+
+# -- substitutions applied in order to each word
+BUSCABR_RULES = [ (re.compile(pattern), replacement) for pattern, replacement in [
+    (r"BL|BR", "B"),
+    (r"PH", "F"),
+    (r"GL|GR|MG|NG|RG", "G"),
+    (r"Y", "I"),
+    (r"GE|GI|RJ|MJ", "J"),
+    (r"CA|CO|CU|CK|Q", "K"),
+    (r"N", "M"),
+    (r"AO", "M"),
+    (r"CHR", "KR"),
+    (r"CE|CI|CH", "S"),
+    (r"CS", "S"),
+    (r"TR|TL", "T"),
+    (r"CT|RT|ST|PT", "T"),
+    (r"(?<=.)(S|Z|R|M|AO|L)$", ""),
+    (r"L", "R"),
+    (r"C", "K"),
+    (r"W", "V"),
+    (r"X|Z", "S"),
+    (r"H", ""),
+    (r"(?<=.)[AEIOU]", ""),
+    (r"(.)\1+", r"\1"),
+]]
+
+@lru_cache(maxsize=None)
+def encode_word(word):
+    '''
+        BuscaBR-style code of a single word. Vowels are kept only as the first letter of the code.
+
+        Args:
+        -----
+            word:
+                String.
+        Return:
+        -------
+            code:
+                String. Empty if the word has no letters.
+    '''
+    code = re.sub(r"[^A-Z]", "", unidecode(word.upper().replace("Ç", "S")))
+    for pattern, replacement in BUSCABR_RULES:
+        code = pattern.sub(replacement, code)
+    return code
+
+def encode_name(name):
+    '''
+        Phonetic code of each part of a name, separated by spaces.
+    '''
+    return ' '.join([ code for code in map(encode_word, name.split(" ")) if code!='' ])
+
+def name_key(name):
+    '''
+        Blocking key with the codes of the first and last parts of a name (the phonetic
+        version of 'FONETICA_N'). NaN if the name has no letters.
+    '''
+    codes = encode_name(name).split(" ")
+    return f"{codes[0]} {codes[-1]}" if codes[0]!='' else np.nan
+
+def surname_key(name):
+    '''
+        Code of the last part of a name. NaN for single names.
+    '''
+    codes = encode_name(name).split(" ")
+    return codes[-1] if len(codes)>1 else np.nan
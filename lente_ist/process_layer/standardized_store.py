@@ -0,0 +1,117 @@
+'''
+    Materialized output of the processing layer for the records of 'pessoa'.
+
+    The matching variables of each record are computed once and kept in the warehouse.
+    A record is standardized again only when it is new or when its 'ATUALIZADO_EM'
+    in 'pessoa' changed, so the agents load ready-to-compare features directly.
+
+    Author: Higor S. Monteiro
+    Email: higor.monteiro@fisica.ufc.br
+'''
+
+import numpy as np
+from sqlalchemy import select, delete, func, or_
+from lente_ist.process_layer.sus_specific import ProcessSinan
+
+class StandardizedRecords:
+    '''
+        Interface to the table of standardized records of the warehouse.
+
+        Args:
+        -----
+            warehouse:
+                WarehouseBase. Warehouse containing the 'pessoa_padronizada' data model.
+            table_name:
+                String. Name of the table storing the standardized records.
+            source_table:
+                String. Name of the table with the records to be standardized.
+            processor:
+                ProcessBase subclass. Processing layer used to standardize the records.
+    '''
+    def __init__(self, warehouse, table_name='pessoa_padronizada', source_table='pessoa', processor=ProcessSinan):
+        self.warehouse = warehouse
+        self.table_name = table_name
+        self.table_model = self.warehouse.tables[table_name]
+        self.source_model = self.warehouse.tables[source_table]
+        self.processor = processor
+
+        # -- standardized fields (all columns except identification and bookkeeping ones)
+        self.bookkeeping = ["FONTE", "DATA_NOTIFICACAO", "PESSOA_ATUALIZADO_EM", "CRIADO_EM", "ATUALIZADO_EM"]
+        self.fields = [ col.name for col in self.table_model.columns if col.name not in self.bookkeeping ]
+
+    def outdated(self):
+        '''
+            Query of the source records not standardized yet or updated since their standardization.
+        '''
+        source, store = self.source_model, self.table_model
+        return select(source).select_from(source.outerjoin(store, store.c.ID==source.c.ID)).where(
+            or_(store.c.ID.is_(None), store.c.PESSOA_ATUALIZADO_EM.is_distinct_from(source.c.ATUALIZADO_EM))
+        )
+
+    def refresh(self, batchsize=200000, verbose=True):
+        '''
+            Standardize the new or updated records of the source table and remove the standardized
+            records no longer present in it.
+
+            Args:
+            -----
+                batchsize:
+                    Integer. Number of records standardized at once.
+            Return:
+            -------
+                nrecords:
+                    Integer. Number of records standardized.
+        '''
+        source, store = self.source_model, self.table_model
+        with self.warehouse.engine.begin() as conn:
+            conn.execute(delete(store).where(store.c.ID.not_in(select(source.c.ID))))
+            if verbose:
+                noutdated = conn.execute(select(func.count()).select_from(self.outdated().subquery())).scalar()
+                print(f"Records to be standardized: {noutdated}")
+
+        # -- the outdated records are paged by their ID: each page is read, then standardized and
+        # -- written before the next one is queried, so no cursor is open while the store is written.
+        nrecords, last_id = 0, None
+        while True:
+            page = self.outdated().order_by(source.c.ID).limit(batchsize)
+            if last_id is not None:
+                page = page.where(source.c.ID > last_id)
+            pages = [ batch for batch in self.warehouse.stream_query(page, batchsize=batchsize) ]
+            if len(pages)==0 or pages[0].shape[0]==0:
+                break
+            current_batch = pages[0]
+            last_id = current_batch["ID"].iloc[-1]
+
+            processor = self.processor(current_batch, "ID")
+            processor.basic_standardize().specific_standardize()
+
+            standardized = processor.data[self.fields].copy()
+            standardized["FONTE"] = current_batch["FONTE"].values
+            standardized["DATA_NOTIFICACAO"] = current_batch["DATA_NOTIFICACAO"].values
+            standardized["PESSOA_ATUALIZADO_EM"] = current_batch["ATUALIZADO_EM"].values
+            self.warehouse.upsert(self.table_name, standardized, batchsize=batchsize, verbose=False)
+            nrecords += current_batch.shape[0]
+        return nrecords
+
+    def load(self, period=None, date_col="DATA_NOTIFICACAO", batchsize=100000):
+        '''
+            Load the standardized records, optionally only the ones within a period.
+
+            Args:
+            -----
+                period:
+                    2-element list of datetime.datetime. Starting and ending dates of the period
+                    (see 'WarehouseBase.query_period').
+                date_col:
+                    String. Date field used to filter by period.
+                batchsize:
+                    Integer. Number of records fetched at once from the warehouse.
+            Return:
+            -------
+                standardized_data:
+                    pandas.DataFrame. Standardized fields and 'FONTE' of the records. Use
+                    'ProcessBase.from_standardized' (without 'FONTE') to rank the names.
+        '''
+        standardized_data = self.warehouse.query_frame(self.table_name, columns=self.fields+["FONTE"], batchsize=batchsize, date_col=date_col, period=period)
+        # -- missing values as NaN, as produced by the processing layer
+        return standardized_data.where(standardized_data.notna(), np.nan)
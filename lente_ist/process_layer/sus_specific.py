@@ -10,35 +10,64 @@ class ProcessSinan(ProcessBase):
         '''
             simplify_fonetica: if the size of the data allows, simplify fonetica (only first name) to increase number of compared pairs.
         '''
-        sexo_arr = self._raw_data.set_index(self.field_id)["SEXO"].apply(lambda x: x.upper().strip() if pd.notna(x) else np.nan)
-        cpf_arr = self._raw_data.set_index(self.field_id)["CPF"].apply(lambda x: f"{x:11.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else x)
-        cns_arr = self._raw_data.set_index(self.field_id)["CNS"].apply(lambda x: x if isinstance(x, str) and utils.cns_is_valid(x) and pd.notna(x) else ( f"{x:13.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else np.nan))
-        bairro_arr = self._raw_data.set_index(self.field_id)["BAIRRO_RESIDENCIA"].apply(lambda x: utils.uniformize_name(x.upper().strip(), sep=" ") if pd.notna(x) else np.nan)
-        cep_arr = self._raw_data.set_index(self.field_id)["CEP"].apply(lambda x: x if isinstance(x, str) and pd.notna(x) else ( f"{x:8.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else np.nan))
-        
-        newcol, colnames = [sexo_arr, cns_arr, cpf_arr, bairro_arr, cep_arr], ["sexo", "cns", "cpf", "bairro", "cep"]
-        for index, colname in enumerate(colnames):
-            self._data = self._data.merge(newcol[index], left_on=self.field_id, right_index=True, how='left')
+        features = sus_features(self._raw_data)
+        self.add_features({ colname: features[colname] for colname in ["sexo", "cns", "cpf", "bairro", "cep"] })
 
         if simplify_fonetica:
-            self._data["FONETICA_N"] = self._data[fonetica_column].apply(lambda x: f"{x.split(' ')[0]}" if pd.notna(x) else np.nan)
-            
-        self._data = self._data.rename({"SEXO": "sexo", "CPF": "cpf", "CNS": "cns", "BAIRRO_RESIDENCIA": "bairro", "CEP": "cep"}, axis=1)
+            self._data["FONETICA_N"] = utils.map_unique(self._data[fonetica_column], lambda x: f"{x.split(' ')[0]}")
+        return self # chaining
 
 class ProcessDB(ProcessBase):
     db_type = "ANY"
 
     def specific_standardize(self):
-        
-        sexo_arr = self._raw_data.set_index(self.field_id)["SEXO"].apply(lambda x: x.upper().strip() if pd.notna(x) else np.nan)
-        cpf_arr = self._raw_data.set_index(self.field_id)["CPF"].apply(lambda x: f"{x:11.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else x)
-        cns_arr = self._raw_data.set_index(self.field_id)["CNS"].apply(lambda x: x if isinstance(x, str) and utils.cns_is_valid(x) and pd.notna(x) else ( f"{x:13.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else np.nan))
-        bairro_arr = self._raw_data.set_index(self.field_id)["BAIRRO_RESIDENCIA"].apply(lambda x: utils.uniformize_name(x.upper().strip(), sep=" ") if pd.notna(x) else np.nan)
-        cep_arr = self._raw_data.set_index(self.field_id)["CEP"].apply(lambda x: x if isinstance(x, str) and pd.notna(x) else ( f"{x:8.0f}".replace(" ", "0") if not isinstance(x, str) and pd.notna(x) else np.nan))
-        
-        newcol, colnames = [sexo_arr, cpf_arr, cns_arr, bairro_arr, cep_arr], ["sexo", "cpf", "cns", "bairro", "cep"]
-        for index, colname in enumerate(colnames):
-            self._data = self._data.merge(newcol[index], left_on=self.field_id, right_index=True, how='left')
-            
-        self._data = self._data.rename({"SEXO": "sexo", "CPF": "cpf", "CNS": "cns", "BAIRRO_RESIDENCIA": "bairro", "CEP": "cep"}, axis=1) 
-        
\ No newline at end of file
+        features = sus_features(self._raw_data)
+        self.add_features({ colname: features[colname] for colname in ["sexo", "cpf", "cns", "bairro", "cep"] })
+        return self # chaining
+
+def sus_features(raw_data):
+    '''
+        Matching fields shared by the DATASUS databases ('sexo', 'cpf', 'cns', 'bairro' and 'cep').
+
+        Each transformation is applied once for each distinct value of the raw field.
+
+        Args:
+        -----
+            raw_data:
+                pandas.DataFrame. Records with the fields 'SEXO', 'CPF', 'CNS', 'BAIRRO_RESIDENCIA' and 'CEP'.
+        Return:
+        -------
+            features:
+                dict. Standardized fields, each one a pandas.Series aligned with 'raw_data'.
+    '''
+    return {
+        "sexo": utils.map_unique(raw_data["SEXO"], lambda x: x.upper().strip()),
+        "cpf": utils.map_unique(raw_data["CPF"], lambda x: zero_padded(x, 11)),
+        "cns": standardize_cns(raw_data["CNS"]),
+        "bairro": utils.map_unique(raw_data["BAIRRO_RESIDENCIA"], lambda x: utils.uniformize_name(x.upper().strip(), sep=" ")),
+        "cep": utils.map_unique(raw_data["CEP"], lambda x: zero_padded(x, 8)),
+    }
+
+def zero_padded(value, width):
+    '''
+        Numeric documents as strings of 'width' digits. Strings are kept as they are.
+    '''
+    return value if isinstance(value, str) else f"{value:{width}.0f}".replace(" ", "0")
+
+def standardize_cns(cns):
+    '''
+        CNS numbers: valid strings are kept, invalid strings become NaN and numbers are zero-padded
+        to 13 digits. The validation runs over the distinct strings at once (see 'utils.cns_is_valid').
+    '''
+    codes, uniques = pd.factorize(cns)
+    if len(uniques)==0:
+        return pd.Series(np.nan, index=cns.index)
+
+    uniques = np.asarray(uniques, dtype=object)
+    is_text = np.array([ isinstance(x, str) for x in uniques ], dtype=bool)
+    standardized = np.array([ np.nan if is_str else zero_padded(x, 13) for x, is_str in zip(uniques, is_text) ], dtype=object)
+    if is_text.any():
+        valid = utils.cns_is_valid(uniques[is_text])
+        standardized[np.flatnonzero(is_text)[valid]] = uniques[is_text][valid]
+    # -- code -1 (missing value) becomes NaN
+    return pd.Series(standardized).reindex(codes).set_axis(cns.index).rename(cns.name)
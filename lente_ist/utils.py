@@ -6,6 +6,7 @@
     Email: higormonteiros@gmail.com
 '''
 
+import numpy as np
 import pandas as pd
 from unidecode import unidecode
 import tkinter as tk
@@ -43,6 +44,26 @@ def perform_query(query_str, engine, batchsize=1000):
     res_df = pd.DataFrame(schema_data['rows'], columns=schema_data['columns'])
     return res_df
 
+def map_unique(series, func, skipna=True):
+    '''
+        Apply 'func' only once for each distinct value of 'series'.
+
+        Args:
+        -----
+            series:
+                pandas.Series.
+            func:
+                Callable applied to each distinct value.
+            skipna:
+                Boolean. If True, missing values are not passed to 'func' and become NaN.
+    '''
+    codes, uniques = pd.factorize(series, use_na_sentinel=skipna)
+    if len(uniques)==0:
+        return pd.Series(np.nan, index=series.index)
+    # -- code -1 (missing value) becomes NaN
+    mapped = pd.Series([ func(x) for x in uniques ]).reindex(codes)
+    return mapped.set_axis(series.index).rename(series.name)
+
 def uniformize_name(string, sep=''):
     '''
         Modify the input string to a final string without any special character and numbers.
@@ -75,24 +96,26 @@ def cns_is_valid(cns):
     """
     Função para validar número do CNS - Cartão Nacional de Saúde ou Cartão do SUS.
 
+    Para uma lista de números, os dígitos são organizados em uma matriz e o
+    dígito verificador é calculado de uma só vez para todos os números.
+
     Args:
     -----
         cns:
-            String.
+            String, ou lista/array/pandas.Series de strings.
     
     Return:
     -------
-        Boolean.
+        Boolean, ou numpy.array de booleanos.
     """
-    cns = ''.join(filter(str.isdigit, str(cns)))
-    
-    if len(cns) != 15:
-        return False
-    if cns=="000000000000000" or pd.isna(cns):
-        return False
-    
-    return sum(
-        [int(cns[i]) * (15 - i) for i in range(15)]
-    ) % 11 == 0
-
+    if np.ndim(cns)==0:
+        return bool(cns_is_valid([cns])[0])
 
+    # -- only the digits of each number are considered
+    digits = pd.Series(cns, dtype=object).astype(str).str.replace(r"[^0-9]", "", regex=True)
+    valid = (digits.str.len()==15).to_numpy()
+    if valid.any():
+        matrix = (np.array(digits[valid].tolist(), dtype="S15").view(np.uint8).reshape(-1, 15) - ord("0")).astype(np.int64)
+        checksum = matrix @ np.arange(15, 0, -1)
+        valid[valid] = (checksum % 11 == 0) & matrix.any(axis=1)
+    return valid
@@ -7,7 +7,7 @@
 '''
 
 import datetime as dt
-from sqlalchemy import Column, Table, MetaData
+from sqlalchemy import Column, Table, MetaData, Index
 from sqlalchemy import DateTime, Integer, Numeric, String, Float, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
 
@@ -37,6 +37,11 @@ class Pessoa:
             Column("FONTE", String, nullable=False),
             Column("CRIADO_EM", DateTime, default=dt.datetime.now),
             Column("ATUALIZADO_EM", DateTime, default=dt.datetime.now, onupdate=dt.datetime.now),
+            # -- secondary indexes: filters by period and by source, and exact blocking on documents
+            Index("ix_pessoa_DATA_NOTIFICACAO", "DATA_NOTIFICACAO"),
+            Index("ix_pessoa_FONTE_DATA_NOTIFICACAO", "FONTE", "DATA_NOTIFICACAO"),
+            Index("ix_pessoa_CPF", "CPF"),
+            Index("ix_pessoa_CNS", "CNS"),
         )
 
         # -- define data mapping (could be import if too big)
@@ -96,7 +101,7 @@ class SinanAidsAdultoInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column('NU_NOTIFIC', String, nullable=True), 
             Column('TP_NOT', String, nullable=True), 
             Column('ID_AGRAVO', String, nullable=True), 
@@ -235,7 +240,7 @@ class SinanAidsCriancaInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column('NU_NOTIFIC', String, nullable=True), 
             Column('TP_NOT', String, nullable=True), 
             Column('ID_AGRAVO', String, nullable=True), 
@@ -379,7 +384,7 @@ class SiclomInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column('UDM', String, nullable=True),
             Column('CODIGO_IBGE_NASC', String, nullable=True),
             Column('RACA', String, nullable=True),
@@ -418,7 +423,7 @@ class SimInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column("DTOBITO", DateTime, nullable=True),
             Column("CAUSABAS", String(4), nullable=True),
             Column("LINHAA", String(20), nullable=True),
@@ -453,7 +458,7 @@ class SimcInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column("DT_ULTIMA_DESPENSA", DateTime, nullable=True),
             Column("DURACAO", Numeric(precision=6, scale=1), nullable=True),
             Column("DT_RETORNO", DateTime, nullable=True),
@@ -487,7 +492,7 @@ class SiscelInfo:
         # -- define schema for table.
         self.model = Table(
             self.table_name, self.metadata,
-            Column("ID", String, ForeignKey('pessoa.ID')),
+            Column("ID", String, ForeignKey('pessoa.ID'), index=True),
             Column('DT_COLETA', DateTime, nullable=True),
             Column('NU_SOLICITA', Integer, nullable=True),
             Column('LOG', Numeric(precision=4, scale=1), nullable=True),
@@ -517,6 +522,67 @@ class SiscelInfo:
         return table_elem, mapping_elem
 
 
+# ---------- STANDARDIZED DATA MODELS ----------
+class PessoaPadronizada:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'pessoa_padronizada'
+        self._dummy_ = ["ID", "FONTE", "DATA_NOTIFICACAO", "NOME_PACIENTE", "NOME_MAE", "DATA_NASCIMENTO",
+                        "primeiro_nome", "complemento_nome", "primeiro_nome_mae", "complemento_nome_mae",
+                        "nascimento_dia", "nascimento_mes", "nascimento_ano", "FONETICA_N",
+                        "FONETICA_BR", "FONETICA_SOBRENOME", "sexo", "cns", "cpf", "bairro", "cep", "PESSOA_ATUALIZADO_EM"]
+
+        # -- define schema for table.
+        # -- matching variables of 'pessoa' after the processing layer. 'PESSOA_ATUALIZADO_EM' is the
+        # -- 'ATUALIZADO_EM' of the record in 'pessoa' when it was standardized.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("ID", String, ForeignKey('pessoa.ID'), primary_key=True),
+            Column("FONTE", String, nullable=False),
+            Column("DATA_NOTIFICACAO", DateTime, nullable=True),
+            Column("NOME_PACIENTE", String, nullable=True),
+            Column("NOME_MAE", String, nullable=True),
+            Column("DATA_NASCIMENTO", DateTime, nullable=True),
+            Column("primeiro_nome", String, nullable=True),
+            Column("complemento_nome", String, nullable=True),
+            Column("primeiro_nome_mae", String, nullable=True),
+            Column("complemento_nome_mae", String, nullable=True),
+            Column("nascimento_dia", Integer, nullable=True),
+            Column("nascimento_mes", Integer, nullable=True),
+            Column("nascimento_ano", Integer, nullable=True),
+            Column("FONETICA_N", String, nullable=True),
+            Column("FONETICA_BR", String, nullable=True),
+            Column("FONETICA_SOBRENOME", String, nullable=True),
+            Column("sexo", String, nullable=True),
+            Column("cns", String, nullable=True),
+            Column("cpf", String, nullable=True),
+            Column("bairro", String, nullable=True),
+            Column("cep", String, nullable=True),
+            Column("PESSOA_ATUALIZADO_EM", DateTime, nullable=True),
+            Column("CRIADO_EM", DateTime, default=dt.datetime.now),
+            Column("ATUALIZADO_EM", DateTime, default=dt.datetime.now, onupdate=dt.datetime.now),
+            # -- secondary indexes: filters by period and by source, and the blocking keys
+            Index("ix_pessoa_padronizada_DATA_NOTIFICACAO", "DATA_NOTIFICACAO"),
+            Index("ix_pessoa_padronizada_FONTE_DATA_NOTIFICACAO", "FONTE", "DATA_NOTIFICACAO"),
+            Index("ix_pessoa_padronizada_FONETICA_BR", "FONETICA_BR"),
+            Index("ix_pessoa_padronizada_FONETICA_SOBRENOME", "FONETICA_SOBRENOME", "nascimento_mes", "nascimento_ano"),
+            Index("ix_pessoa_padronizada_cpf", "cpf"),
+            Index("ix_pessoa_padronizada_cns", "cns"),
+        )
+
+        # -- define data mapping (could be import if too big)
+        self.mapping = { n:n for n in self._dummy_ }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
+
+
 # ---------- MATCHING DATA MODELS ----------
 class PositivePairsLabel:
     def __init__(self, metadata):
@@ -574,6 +640,34 @@ class NegativePairsLabel:
         table_elem = { self.table_name : self.model }
         mapping_elem = { self.table_name : self.mapping }
         return table_elem, mapping_elem
+
+class ComparedPairs:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'compared_pairs'
+
+        # --> define schema for table. The composite primary key indexes the pairs.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("ID_1", String, primary_key=True),
+            Column("ID_2", String, primary_key=True),
+            Column("CLASSIFICACAO", String, nullable=True, index=True),
+            Column("CRIADO_EM", DateTime, default=dt.datetime.now),
+        )
+
+        # -- define data mapping (could be imported if too big) - include all columns!
+        self.mapping = {
+            "ID_1": "ID_1", "ID_2": "ID_2", "CLASSIFICACAO": "CLASSIFICACAO",
+        }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
     
 # ---------- MATCHING DATA MODELS ----------
 #class PairsLabel:
@@ -609,4 +703,129 @@ class NegativePairsLabel:
 #        '''
 #        table_elem = { self.table_name : self.model }
 #        mapping_elem = { self.table_name : self.mapping }
-#        return table_elem, mapping_elem
\ No newline at end of file
+#        return table_elem, mapping_elem
+
+# ---------- JOB STATE MODELS ----------
+class LinkageRun:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'linkage_runs'
+
+        # --> define schema for table.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("RUN_ID", String, primary_key=True),
+            Column("TAREFA", String, nullable=False),
+            Column("PARAMETROS", String, nullable=True),
+            Column("NUMERO_PARES", Integer, nullable=False),
+            Column("TAMANHO_BLOCO", Integer, nullable=False),
+            Column("STATUS", String, nullable=False, index=True),
+            Column("CRIADO_EM", DateTime, default=dt.datetime.now),
+            Column("ATUALIZADO_EM", DateTime, default=dt.datetime.now, onupdate=dt.datetime.now),
+        )
+
+        # -- define data mapping (could be imported if too big) - include all columns!
+        self.mapping = {
+            "RUN_ID": "RUN_ID", "TAREFA": "TAREFA", "PARAMETROS": "PARAMETROS",
+            "NUMERO_PARES": "NUMERO_PARES", "TAMANHO_BLOCO": "TAMANHO_BLOCO", "STATUS": "STATUS",
+        }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
+
+
+class LinkageRunBlock:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'linkage_run_blocks'
+
+        # --> define schema for table.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("RUN_ID", String, ForeignKey('linkage_runs.RUN_ID'), primary_key=True),
+            Column("BLOCO", Integer, primary_key=True),
+            Column("NUMERO_PARES", Integer, nullable=True),
+            Column("CONCLUIDO_EM", DateTime, default=dt.datetime.now),
+        )
+
+        # -- define data mapping (could be imported if too big) - include all columns!
+        self.mapping = {
+            "RUN_ID": "RUN_ID", "BLOCO": "BLOCO", "NUMERO_PARES": "NUMERO_PARES",
+        }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
+
+# ---------- SOURCE MANIFEST MODELS ----------
+class SourceFile:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'source_files'
+
+        # --> define schema for table.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("FONTE", String, primary_key=True),
+            Column("ARQUIVO", String, nullable=False),
+            Column("HASH", String, nullable=False),
+            Column("NUMERO_REGISTROS", Integer, nullable=True),
+            Column("CRIADO_EM", DateTime, default=dt.datetime.now),
+            Column("ATUALIZADO_EM", DateTime, default=dt.datetime.now, onupdate=dt.datetime.now),
+        )
+
+        # -- define data mapping (could be imported if too big) - include all columns!
+        self.mapping = {
+            "FONTE": "FONTE", "ARQUIVO": "ARQUIVO", "HASH": "HASH", "NUMERO_REGISTROS": "NUMERO_REGISTROS",
+        }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
+
+
+class SourceRecord:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.table_name = 'source_records'
+
+        # --> define schema for table.
+        # -- 'FINGERPRINT' is the hash of all rows of the source file sharing the same 'ID'.
+        self.model = Table(
+            self.table_name, self.metadata,
+            Column("FONTE", String, primary_key=True),
+            Column("ID", String, primary_key=True),
+            Column("FINGERPRINT", String, nullable=False),
+            Column("CRIADO_EM", DateTime, default=dt.datetime.now),
+            Column("ATUALIZADO_EM", DateTime, default=dt.datetime.now, onupdate=dt.datetime.now),
+        )
+
+        # -- define data mapping (could be imported if too big) - include all columns!
+        self.mapping = {
+            "FONTE": "FONTE", "ID": "ID", "FINGERPRINT": "FINGERPRINT",
+        }
+
+    def define(self):
+        '''
+            Return dictionary elements containing the data model and 
+            the data mapping, respectively.
+        '''
+        table_elem = { self.table_name : self.model }
+        mapping_elem = { self.table_name : self.mapping }
+        return table_elem, mapping_elem
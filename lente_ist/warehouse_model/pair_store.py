@@ -0,0 +1,172 @@
+'''
+    Storage of the pairs of records already compared by the data matching.
+
+    Pairs are kept as two indexed ID columns with a composite key, so the pairs
+    already compared are removed from a list of candidates with a single join
+    against a temporary table instead of string lookups.
+
+    Author: Higor S. Monteiro
+    Email: higor.monteiro@fisica.ufc.br
+'''
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Table, MetaData, Integer, String
+from sqlalchemy import select, insert, func, and_, literal
+
+class PairStore:
+    '''
+        Interface to the table of compared pairs of the warehouse.
+
+        Args:
+        -----
+            warehouse:
+                WarehouseBase. Warehouse containing the 'compared_pairs' data model.
+            table_name:
+                String. Name of the table storing the pairs.
+    '''
+    def __init__(self, warehouse, table_name='compared_pairs'):
+        self.warehouse = warehouse
+        self.table_name = table_name
+        self.table_model = self.warehouse.tables[table_name]
+
+    def _temp_table(self, with_position=True):
+        columns = [ Column("ID_1", String), Column("ID_2", String) ]
+        if with_position:
+            columns.append(Column("POS", Integer))
+        return Table("temp_candidate_pairs", MetaData(), *columns, prefixes=["TEMPORARY"])
+
+    def count(self, classification=None):
+        '''
+            Number of pairs stored, optionally only for a given classification.
+        '''
+        sel = select(func.count()).select_from(self.table_model)
+        if classification is not None:
+            sel = sel.where(self.table_model.c["CLASSIFICACAO"]==classification)
+        with self.warehouse.engine.connect() as conn:
+            return conn.execute(sel).scalar()
+
+    def add(self, pairs, classification=None, batchsize=100000):
+        '''
+            Store a list of pairs. Pairs already stored are ignored.
+
+            Args:
+            -----
+                pairs:
+                    pandas.MultiIndex, pandas.DataFrame (first two columns) or list of 2-tuples.
+                classification:
+                    String. Label of the pairs (e.g. 'positive', 'negative').
+                batchsize:
+                    Integer. Number of pairs sent to the database at each step.
+        '''
+        pairs = _as_frame(pairs).drop_duplicates()
+        if pairs.shape[0]==0:
+            return 0
+
+        store, temp = self.table_model, self._temp_table(with_position=False)
+        new_pairs = select(temp.c.ID_1, temp.c.ID_2, literal(classification, String)).select_from(
+            temp.outerjoin(store, and_(store.c.ID_1==temp.c.ID_1, store.c.ID_2==temp.c.ID_2))
+        ).where(store.c.ID_1.is_(None))
+        ins = insert(store).from_select(["ID_1", "ID_2", "CLASSIFICACAO"], new_pairs)
+
+        ninserted = 0
+        with self.warehouse.engine.begin() as conn:
+            temp.create(conn)
+            for start in range(0, pairs.shape[0], batchsize):
+                current = pairs.iloc[start:start+batchsize]
+                conn.execute(insert(temp), current.to_dict(orient='records'))
+                ninserted += conn.execute(ins).rowcount
+                conn.execute(temp.delete())
+            temp.drop(conn)
+        return ninserted
+
+    def is_stored(self, candidate_pairs, classification=None, batchsize=200000):
+        '''
+            Whether each candidate pair is already stored.
+
+            The candidates are loaded into a temporary table and joined against the stored
+            pairs through their composite key.
+
+            Args:
+            -----
+                candidate_pairs:
+                    pandas.MultiIndex. Candidate pairs of IDs.
+                classification:
+                    String. If provided, only stored pairs with this classification are considered.
+                batchsize:
+                    Integer. Number of candidates joined at each step.
+            Return:
+            -------
+                stored:
+                    numpy.array of booleans, in the order of 'candidate_pairs'.
+        '''
+        stored = np.zeros(len(candidate_pairs), dtype=bool)
+        if len(candidate_pairs)==0:
+            return stored
+
+        store, temp = self.table_model, self._temp_table(with_position=True)
+        found = select(temp.c.POS).select_from(
+            temp.join(store, and_(store.c.ID_1==temp.c.ID_1, store.c.ID_2==temp.c.ID_2))
+        )
+        if classification is not None:
+            found = found.where(store.c["CLASSIFICACAO"]==classification)
+
+        with self.warehouse.engine.begin() as conn:
+            temp.create(conn)
+            for start in range(0, len(candidate_pairs), batchsize):
+                current = candidate_pairs[start:start+batchsize]
+                records = pd.DataFrame({
+                    "ID_1": current.get_level_values(0).astype(str),
+                    "ID_2": current.get_level_values(1).astype(str),
+                    "POS": np.arange(start, start+len(current)),
+                })
+                conn.execute(insert(temp), records.to_dict(orient='records'))
+                positions = [ row[0] for row in conn.execute(found) ]
+                stored[positions] = True
+                conn.execute(temp.delete())
+            temp.drop(conn)
+        return stored
+
+    def anti_join(self, candidate_pairs, classification=None, batchsize=200000):
+        '''
+            Remove from 'candidate_pairs' the pairs already stored (see 'is_stored').
+
+            Return:
+            -------
+                candidate_pairs:
+                    pandas.MultiIndex. Candidate pairs not stored yet, in the original order.
+        '''
+        if len(candidate_pairs)==0:
+            return candidate_pairs
+        return candidate_pairs[~self.is_stored(candidate_pairs, classification=classification, batchsize=batchsize)]
+
+    def import_fmt_ids(self, table_name, classification=None):
+        '''
+            Copy the pairs of a table keyed by 'FMT_ID' strings ("ID1-ID2") into the store.
+
+            Args:
+            -----
+                table_name:
+                    String. Table with the 'FMT_ID' field (e.g. 'likely_negative_pairs').
+                classification:
+                    String. Label of the imported pairs.
+        '''
+        source, store = self.warehouse.tables[table_name], self.table_model
+        # -- position of the separator ('instr' in SQLite, 'strpos' in PostgreSQL and DuckDB)
+        position = func.instr if self.warehouse.engine.dialect.name=='sqlite' else func.strpos
+        separator = position(source.c.FMT_ID, '-')
+        parts = select(func.substr(source.c.FMT_ID, 1, separator-1).label("ID_1"),
+                       func.substr(source.c.FMT_ID, separator+1).label("ID_2")).where(separator>0).subquery()
+        new_pairs = select(parts.c.ID_1, parts.c.ID_2, literal(classification, String)).select_from(
+            parts.outerjoin(store, and_(store.c.ID_1==parts.c.ID_1, store.c.ID_2==parts.c.ID_2))
+        ).where(store.c.ID_1.is_(None))
+        with self.warehouse.engine.begin() as conn:
+            rp = conn.execute(insert(store).from_select(["ID_1", "ID_2", "CLASSIFICACAO"], new_pairs))
+            return rp.rowcount
+
+def _as_frame(pairs):
+    if isinstance(pairs, pd.MultiIndex):
+        return pd.DataFrame({"ID_1": pairs.get_level_values(0).astype(str), "ID_2": pairs.get_level_values(1).astype(str)})
+    if isinstance(pairs, pd.DataFrame):
+        return pd.DataFrame({"ID_1": pairs.iloc[:,0].astype(str).values, "ID_2": pairs.iloc[:,1].astype(str).values})
+    return pd.DataFrame(list(pairs), columns=["ID_1", "ID_2"]).astype(str)
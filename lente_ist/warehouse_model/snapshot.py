@@ -0,0 +1,202 @@
+'''
+    Columnar snapshot of the warehouse as partitioned Parquet datasets (requires pyarrow).
+
+    Each table is exported to its own folder, partitioned by 'FONTE' and by the year of
+    'DATA_NOTIFICACAO' ('ANO') in the hive layout (e.g. 'pessoa/FONTE=SICLOM/ANO=2015/').
+    Tables referencing 'pessoa.ID' (the '*_info' tables) take both fields from 'pessoa'.
+    A manifest describes the exported tables, so the snapshot is read without touching
+    the live database, loading only the partitions and columns needed:
+
+        snapshot = WarehouseSnapshot("snapshots/2025-03-18")
+        snapshot.export(warehouse)
+        siclom = snapshot.read("pessoa", columns=["ID", "DATA_NOTIFICACAO"],
+                               filters=[("FONTE", "==", "SICLOM"), ("ANO", ">=", 2015)])
+
+    Author: Higor S. Monteiro
+    Email: higor.monteiro@fisica.ufc.br
+'''
+
+import json
+import shutil
+import datetime as dt
+from pathlib import Path
+from sqlalchemy import select, func
+from sqlalchemy import DateTime, Integer, Numeric, Float
+
+PARTITION_FIELDS = ["FONTE", "ANO"]
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception("pyarrow is required for the snapshots of the warehouse.")
+    return pa, ds, pq
+
+def arrow_type(sql_type):
+    '''
+        Arrow type of a column of the data models (strings for the remaining types).
+    '''
+    pa = _pyarrow()[0]
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, (Numeric, Float)):
+        return pa.float64()
+    return pa.string()
+
+class WarehouseSnapshot:
+    '''
+        Parquet snapshot of the tables of a warehouse.
+
+        Args:
+        -----
+            folder:
+                String or pathlib.Path. Folder of the snapshot, with one subfolder per table and
+                the file 'manifest.json'.
+    '''
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.manifest_path = self.folder.joinpath("manifest.json")
+
+    @property
+    def manifest(self):
+        if not self.manifest_path.exists():
+            return {"tables": {}}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def snapshot_query(self, warehouse, table_name):
+        '''
+            Query of the records of a table with its partition fields.
+
+            Return:
+            -------
+                sel:
+                    sqlalchemy.Select.
+                partition_fields:
+                    List. Partition fields included in the query ('FONTE' and/or 'ANO').
+        '''
+        table_model = warehouse.tables[table_name]
+        if "FONTE" not in table_model.c and "pessoa" in warehouse.tables and table_name!="pessoa":
+            # -- records of a person (e.g. '*_info' tables) are partitioned as their record in 'pessoa'
+            pessoa = warehouse.tables["pessoa"]
+            fkeys = [ fkey.parent for fkey in table_model.foreign_keys if fkey.column.table is pessoa ]
+            if len(fkeys):
+                sel = select(table_model, pessoa.c.FONTE, func.extract("year", pessoa.c.DATA_NOTIFICACAO).label("ANO"))
+                return sel.select_from(table_model.outerjoin(pessoa, fkeys[0]==pessoa.c.ID)), PARTITION_FIELDS
+
+        partition_fields, fields = [], []
+        if "FONTE" in table_model.c:
+            partition_fields.append("FONTE")
+        if "DATA_NOTIFICACAO" in table_model.c:
+            partition_fields.append("ANO")
+            fields.append(func.extract("year", table_model.c.DATA_NOTIFICACAO).label("ANO"))
+        return select(table_model, *fields), partition_fields
+
+    def export(self, warehouse, table_names=None, batchsize=100000, verbose=True):
+        '''
+            Export tables of the warehouse to the snapshot. The records are streamed from the
+            warehouse (see 'WarehouseBase.stream_query') and each table is first written to a
+            temporary folder, so an interrupted export does not replace the previous snapshot.
+
+            Args:
+            -----
+                warehouse:
+                    WarehouseBase.
+                table_names:
+                    List. Tables to be exported. All tables if not provided.
+                batchsize:
+                    Integer. Number of records read from the warehouse at once.
+            Return:
+            -------
+                manifest:
+                    Dictionary. Updated manifest of the snapshot.
+        '''
+        pa, ds, pq = _pyarrow()
+        table_names = list(warehouse.tables.keys()) if table_names is None else table_names
+        manifest = self.manifest
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        for table_name in table_names:
+            sel, partition_fields = self.snapshot_query(warehouse, table_name)
+            schema = pa.schema([ (col.name, pa.int32() if col.name=="ANO" else arrow_type(col.type)) for col in sel.selected_columns ])
+            counts = {"rows": 0}
+
+            def batches():
+                for batch in warehouse.stream_query(sel, batchsize=batchsize):
+                    counts["rows"] += batch.shape[0]
+                    yield pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False)
+
+            table_folder, temp_folder = self.folder.joinpath(table_name), self.folder.joinpath(f".{table_name}.tmp")
+            if temp_folder.exists():
+                shutil.rmtree(temp_folder)
+            partitioning = ds.partitioning(pa.schema([ schema.field(col) for col in partition_fields ]), flavor="hive") if len(partition_fields) else None
+            ds.write_dataset(batches(), temp_folder, schema=schema, format="parquet", partitioning=partitioning,
+                             basename_template="part-{i}.parquet", existing_data_behavior="overwrite_or_ignore")
+            if counts["rows"]==0:
+                # -- empty tables keep their schema in a single file without records
+                temp_folder.mkdir(parents=True, exist_ok=True)
+                fields = [ field for field in schema if field.name not in partition_fields ]
+                pq.write_table(pa.schema(fields).empty_table(), temp_folder.joinpath("part-0.parquet"))
+            if table_folder.exists():
+                shutil.rmtree(table_folder)
+            temp_folder.rename(table_folder)
+
+            manifest["tables"][table_name] = {
+                "path": table_name,
+                "rows": counts["rows"],
+                "columns": { field.name: str(field.type) for field in schema },
+                "partitioning": partition_fields,
+                "files": len(list(table_folder.rglob("*.parquet"))),
+                "exported_at": dt.datetime.now().isoformat(timespec="seconds"),
+            }
+            if verbose:
+                print(f"{table_name}: {counts['rows']} records exported.")
+
+        manifest["updated_at"] = dt.datetime.now().isoformat(timespec="seconds")
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def dataset(self, table_name):
+        '''
+            pyarrow.dataset.Dataset of an exported table, with its partition fields typed as in
+            the manifest.
+        '''
+        pa, ds, pq = _pyarrow()
+        tables = self.manifest["tables"]
+        if table_name not in tables:
+            raise Exception(f"Table '{table_name}' not found in the snapshot.")
+        entry = tables[table_name]
+        partition_types = {"FONTE": pa.string(), "ANO": pa.int32()}
+        partitioning = None
+        if len(entry["partitioning"]):
+            partitioning = ds.partitioning(pa.schema([ (col, partition_types[col]) for col in entry["partitioning"] ]), flavor="hive")
+        return ds.dataset(self.folder.joinpath(entry["path"]), format="parquet", partitioning=partitioning)
+
+    def read(self, table_name, columns=None, filters=None, output="pandas"):
+        '''
+            Read an exported table. Only the partitions matching the filters on 'FONTE' and 'ANO'
+            are opened, and only the selected columns are read from the files; filters on the other
+            fields are checked against the statistics of the row groups.
+
+            Args:
+            -----
+                table_name:
+                    String. Name of the exported table.
+                columns:
+                    List. Subset of columns to read. All columns if not provided.
+                filters:
+                    List of (field, operator, value) tuples combined with AND, or list of such lists
+                    combined with OR (as in 'pyarrow.parquet.read_table'). E.g.
+                    [("FONTE", "==", "SICLOM"), ("ANO", ">=", 2015)].
+                output:
+                    String. 'pandas' for a pandas.DataFrame or 'arrow' for a pyarrow.Table.
+        '''
+        pa, ds, pq = _pyarrow()
+        expression = pq.filters_to_expression(filters) if filters is not None else None
+        table = self.dataset(table_name).to_table(columns=columns, filter=expression)
+        return table if output=="arrow" else table.to_pandas()
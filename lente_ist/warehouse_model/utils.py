@@ -5,76 +5,109 @@
     Autor: Higor S. Monteiro
     Email: higormonteiros@gmail.com
 '''
+import hashlib
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from unidecode import unidecode
+from lente_ist.utils import map_unique
+
+def normalize_text(series):
+    '''
+        Uppercase, transliterated to ASCII and stripped text (NaN for missing values).
+    '''
+    return map_unique(series, lambda x: unidecode(x.upper()).strip())
+
+def join_present(values, sep='_'):
+    '''
+        Join, row by row, the string representation of the non-missing values of a 2D object array.
+    '''
+    joined = pd.Series([ '' for n in range(values.shape[0]) ], dtype=object)
+    has_value = np.zeros(values.shape[0], dtype=bool)
+    for k in range(values.shape[1]):
+        column = pd.Series(values[:, k], dtype=object)
+        present = column.notna().values
+        text = map_unique(column, lambda x: f'{x}').values
+        joined[present & has_value] = joined[present & has_value] + sep + text[present & has_value]
+        joined[present & ~has_value] = text[present & ~has_value]
+        has_value = has_value | present
+    return joined.values
+
+def row_digest(row_str, ndigits=12):
+    '''
+        Stable numeric ID of each row string: the SHA-1 digest of its text, truncated to 'ndigits'
+        digits (unlike the built-in 'hash', it does not change between processes).
+    '''
+    return [ f'{int(hashlib.sha1(x.encode("utf-8")).hexdigest(), 16) % (10**ndigits)}' for x in row_str ]
 
 def process_sinan(df, source_name="SICLOM"):
     '''
         ...
     '''
     # -- ID_SINAN: ID_AGRAVO+NU_NOTIFIC+ID_MUNICIP+DT_NOTIFIC
-    notific_fmt = df["DT_NOTIFIC"].apply(lambda x: f"{x.day:2.0f}{x.month:2.0f}{x.year}".replace(" ", "0"))
-    id_municip_fmt = df["ID_MUNICIP"].apply(lambda x: f"{x}")
+    # -- DDMMYYYY ('nannannan' for missing dates)
+    dt_notific = pd.to_datetime(df["DT_NOTIFIC"])
+    notific_fmt = dt_notific.dt.strftime("%d%m") + dt_notific.dt.year.astype("Int64").astype(str)
+    notific_fmt = notific_fmt.where(dt_notific.notna(), "nannannan")
+    id_municip_fmt = df["ID_MUNICIP"].astype(str)
     df["ID"] = df["ID_AGRAVO"]+df["NU_NOTIFIC"]+id_municip_fmt+notific_fmt
-    df["CPF"] = [ np.nan for n in range(df.shape[0]) ]
-    df["FONTE"] = [ source_name for n in range(df.shape[0]) ]
+    df["CPF"] = np.nan
+    df["FONTE"] = source_name
     return df
 
 def process_siclom(df, source_name="SICLOM"):
     '''
         ...
     '''
-    df["ID"] = df["codigo_paciente"].apply(lambda x: unidecode(x.upper()).strip())
-    df['NM_PACIENT'] = df['nome_paciente'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ID"] = map_unique(df["codigo_paciente"], lambda x: unidecode(x.upper()).strip(), skipna=False)
+    df['NM_PACIENT'] = normalize_text(df['nome_paciente'])
     df['DT_NASC'] = pd.to_datetime(df['data_nascimento'], errors="coerce")
-    df["NM_MAE_PAC"] = df["nome_mae"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["NM_MAE_PAC"] = normalize_text(df["nome_mae"])
     df['DT_NOTIFIC'] = pd.to_datetime(df['data_cadastro'], errors="coerce") # auxiliary only
-    df["DT_DIAG"] = [ np.nan for n in range(df.shape[0]) ]
-    df["CS_SEXO"] = df["sexo"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan).map({'1': 'M', '2': 'F', '3': np.nan, '4': np.nan})
-    df["NM_BAIRRO"] = df["bairro"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["ID_MN_RESI"] = df["codigo_ibge_resid"].apply(lambda x: unidecode(x)[:6] if pd.notna(x) else np.nan)
-    df["NM_LOGRADO"] = df["endereco"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["NU_CEP"] = df["Cep"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["NU_NUMERO"] = [ np.nan for n in range(df.shape[0]) ]
-    df["ID_CNS_SUS"] = [ np.nan for n in range(df.shape[0]) ]
-    df["FONTE"] = [ source_name for n in range(df.shape[0]) ]
-    df["CPF"] = df["cpf"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-
-    df["UDM"] = df["UDM"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["CODIGO_IBGE_NASC"] = df["codigo_ibge_nasc"].apply(lambda x: unidecode(x) if pd.notna(x) else np.nan)
-    df["RACA"] = df["raca"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["ESTADO_CIVIL"] = df["estado_civil"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["ESCOLARIDADE"] = df["escolaridade"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["CD4_INICIO_TARV"] = df["cd4_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["CV_INICIO_TARV"] = df["cv_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["ANO_INICIO_TARV"] = df["ano_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["DT_DIAG"] = np.nan
+    df["CS_SEXO"] = normalize_text(df["sexo"]).map({'1': 'M', '2': 'F', '3': np.nan, '4': np.nan})
+    df["NM_BAIRRO"] = normalize_text(df["bairro"])
+    df["ID_MN_RESI"] = map_unique(df["codigo_ibge_resid"], lambda x: unidecode(x)[:6])
+    df["NM_LOGRADO"] = normalize_text(df["endereco"])
+    df["NU_CEP"] = normalize_text(df["Cep"])
+    df["NU_NUMERO"] = np.nan
+    df["ID_CNS_SUS"] = np.nan
+    df["FONTE"] = source_name
+    df["CPF"] = normalize_text(df["cpf"])
+
+    df["UDM"] = normalize_text(df["UDM"])
+    df["CODIGO_IBGE_NASC"] = map_unique(df["codigo_ibge_nasc"], unidecode)
+    df["RACA"] = normalize_text(df["raca"])
+    df["ESTADO_CIVIL"] = normalize_text(df["estado_civil"])
+    df["ESCOLARIDADE"] = normalize_text(df["escolaridade"])
+    df["CD4_INICIO_TARV"] = normalize_text(df["cd4_inicio_TARV"])
+    df["CV_INICIO_TARV"] = normalize_text(df["cv_inicio_TARV"])
+    df["ANO_INICIO_TARV"] = normalize_text(df["ano_inicio_TARV"])
     df["DT_CADASTRO"] = pd.to_datetime(df['data_cadastro'], errors="coerce")
     df["DT_DIGITACAO"] = pd.to_datetime(df['data_digitacao'], errors="coerce")
     df["DT_ULT_ATU"] = pd.to_datetime(df['data_ult_atu'], errors="coerce")
-    df["ST_PACIENTE"] = df['st_paciente'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ST_PACIENTE"] = normalize_text(df['st_paciente'])
     return df
 
 def process_sim(df, source_name="SIM"):
     '''
         ...
     '''
-    df["ID"] = df["NUMERODO"].apply(lambda x: f'DO{x}')
+    df["ID"] = 'DO' + df["NUMERODO"].astype(str)
     df["NM_PACIENT"] = df["NOME"].copy()
     df["NM_MAE_PAC"] = df["NOMEMAE"].copy()
     df["ID_MN_RESI"] = df["CODMUNRES"].copy()
-    df['DT_NOTIFIC'] = [ np.nan for n in range(df.shape[0]) ]
-    df["DT_DIAG"] = [ np.nan for n in range(df.shape[0]) ]
+    df['DT_NOTIFIC'] = np.nan
+    df["DT_DIAG"] = np.nan
     df["NM_BAIRRO"] = df["BAIRES"].copy()
     df["DT_NASC"] = pd.to_datetime(df["DTNASC"], format="%d%m%Y", errors='coerce')
     df["NM_LOGRADO"] = df["ENDRES"].copy()
     df["NU_NUMERO"] = df["NUMRES"].copy()
     df["NU_CEP"] = df["CEPRES"].copy()
     df["ID_CNS_SUS"] = df["NUMSUS"].copy()
-    df["CPF"] = [ np.nan for elem in range(df.shape[0]) ]
+    df["CPF"] = np.nan
     df["CS_SEXO"] = df["SEXO"].copy()
-    df["FONTE"] = [ source_name for elem in range(df.shape[0]) ]
+    df["FONTE"] = source_name
 
     df["DTOBITO"] = pd.to_datetime(df["DTOBITO"], format="%d%m%Y", errors='coerce')
     df["CAUSABAS"] = df["CAUSABAS"].copy()
@@ -97,22 +130,22 @@ def process_simc(df, source_name="SIMC"):
        'Instituição solicitante', 'Nome Paciente', 'Nome mãe', 'Data Nascimento', 
        'Idade', 'Sexo/Gênero', 'Raça/cor', 'Escolaridade', 'CPF'
     ]
-    row_str = df[cols].apply(lambda x: abs(hash('_'.join([ f'{x[col]}' for col in cols if pd.notna(x[col]) ]))) % (10**12) , axis=1)
-    df["ID"] = row_str.apply(lambda x: f'{x:.0f}')
-    df['NM_PACIENT'] = df['Nome Paciente'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    row_str = join_present(df[cols].values)
+    df["ID"] = row_digest(row_str)
+    df['NM_PACIENT'] = normalize_text(df['Nome Paciente'])
     df['DT_NASC'] = pd.to_datetime(df['Data Nascimento'], errors="coerce")
-    df["NM_MAE_PAC"] = df['Nome mãe'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df['DT_NOTIFIC'] = [ np.nan for elem in range(df.shape[0]) ]
-    df['DT_DIAG'] = [ np.nan for elem in range(df.shape[0]) ]
-    df["CS_SEXO"] = df['Sexo/Gênero'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan).map({'Masculino': 'M', 'Feminino': 'F'})
-    df["NM_BAIRRO"] = [ np.nan for elem in range(df.shape[0]) ]
+    df["NM_MAE_PAC"] = normalize_text(df['Nome mãe'])
+    df['DT_NOTIFIC'] = np.nan
+    df['DT_DIAG'] = np.nan
+    df["CS_SEXO"] = normalize_text(df['Sexo/Gênero']).map({'Masculino': 'M', 'Feminino': 'F'})
+    df["NM_BAIRRO"] = np.nan
     df["ID_MN_RESI"] = df['Município de residência'].copy() # -- needs transformation
-    df["NM_LOGRADO"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["NU_CEP"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["NU_NUMERO"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["ID_CNS_SUS"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["FONTE"] = [ source_name for n in range(df.shape[0]) ]
-    df["CPF"] = df["CPF"].apply(lambda x: unidecode(f'{x:11.0f}'.replace(" ", "0").upper()).strip() if pd.notna(x) else np.nan)
+    df["NM_LOGRADO"] = np.nan
+    df["NU_CEP"] = np.nan
+    df["NU_NUMERO"] = np.nan
+    df["ID_CNS_SUS"] = np.nan
+    df["FONTE"] = source_name
+    df["CPF"] = map_unique(df["CPF"], lambda x: unidecode(f'{x:11.0f}'.replace(" ", "0").upper()).strip())
 
     df['DT_ULTIMA_DESPENSA'] = pd.to_datetime(df['Data últ. dispensa'], errors='coerce')
     df['DURACAO'] = df['Duração'].copy()
@@ -130,24 +163,24 @@ def process_siscel(df, source_name="SISCEL"):
     cols = [
        "Nome Civil", 'Data de Nascimento', 'Mãe', 'Código', 'CEP', "Endereço", "Nº da Solicitação"
     ]
-    row_str = df[cols].apply(lambda x: abs(hash('_'.join([ f'{x[col]}' for col in cols if pd.notna(x[col]) ]))) % (10**12) , axis=1)
-    df["ID"] = row_str.apply(lambda x: f'{x:.0f}')
-    df["NM_PACIENT"] = df["Nome Civil"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    row_str = join_present(df[cols].values)
+    df["ID"] = row_digest(row_str)
+    df["NM_PACIENT"] = normalize_text(df["Nome Civil"])
     df['DT_NASC'] = pd.to_datetime(df['Data de Nascimento'], errors="coerce")
-    df["NM_MAE_PAC"] = df['Mãe'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df['DT_NOTIFIC'] = [ np.nan for elem in range(df.shape[0]) ]
-    df['DT_DIAG'] = [ np.nan for elem in range(df.shape[0]) ]
-    df["CS_SEXO"] = df['Sexo'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan).map({'Masculino': 'M', 'Feminino': 'F', 
+    df["NM_MAE_PAC"] = normalize_text(df['Mãe'])
+    df['DT_NOTIFIC'] = np.nan
+    df['DT_DIAG'] = np.nan
+    df["CS_SEXO"] = normalize_text(df['Sexo']).map({'Masculino': 'M', 'Feminino': 'F', 
                                                                                                                        'Intersexo': 'I', 'Não Informado': 'I',
                                                                                                                        '-': 'I'})
-    df["NM_BAIRRO"] = [ np.nan for elem in range(df.shape[0]) ]
+    df["NM_BAIRRO"] = np.nan
     df["ID_MN_RESI"] = df['Cidade de Residência'].copy() # -- needs transformation
-    df["NM_LOGRADO"] = df["Endereço"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["NU_CEP"] = df["CEP"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
-    df["NU_NUMERO"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["ID_CNS_SUS"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["CPF"] = [ np.nan for elem in range(df.shape[0]) ]
-    df["FONTE"] = [ source_name for n in range(df.shape[0]) ]
+    df["NM_LOGRADO"] = normalize_text(df["Endereço"])
+    df["NU_CEP"] = normalize_text(df["CEP"])
+    df["NU_NUMERO"] = np.nan
+    df["ID_CNS_SUS"] = np.nan
+    df["CPF"] = np.nan
+    df["FONTE"] = source_name
 
     df["DT_COLETA"] = pd.to_datetime(df["Data da Coleta"], errors="coerce")
     df["NU_SOLICITA"] = df["Nº da Solicitação"].copy()
@@ -157,11 +190,11 @@ def process_siscel(df, source_name="SISCEL"):
     df["PAC_ASSINTOM"] = df["Paciente assintomático?"].copy()
     df["STATUS_CARGA_VIRAL"] = df["Carga Viral Indetectável?"].copy()
     df["COPIAS"] = df["Cópias"].copy()
-    df["CD4"] = df["Contagem CD4"].apply(lambda x: int(x) if pd.notna(x) else np.nan).copy()
+    df["CD4"] = map_unique(df["Contagem CD4"], int)
     df["CD4%"] = df["% CD4"].copy()
-    df["CD8"] = df["Contagem CD8"].apply(lambda x: int(x) if pd.notna(x) else np.nan).copy()
+    df["CD8"] = map_unique(df["Contagem CD8"], int)
     df["CD8%"] = df["% CD8"].copy()
-    df["CD3_MEDIA"] = df["Média CD3"].apply(lambda x: int(x) if pd.notna(x) else np.nan).copy()
+    df["CD3_MEDIA"] = map_unique(df["Média CD3"], int)
     return df
 
 
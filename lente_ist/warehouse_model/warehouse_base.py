@@ -9,12 +9,16 @@
 import numpy as np
 import pandas as pd
 import datetime as dt
+from pathlib import Path
+from contextlib import contextmanager
 from simpledbf import Dbf5
 
-from sqlalchemy import create_engine
+from lente_ist.warehouse_model.backend import get_engine
 from sqlalchemy import Column, Table, MetaData
 from sqlalchemy import select, insert, update, delete
-from sqlalchemy import inspect, text
+from sqlalchemy import inspect, text, and_, or_, true, func, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy import DateTime, Integer, Numeric, String, Sequence, ForeignKey, CheckConstraint
 from sqlalchemy.exc import InternalError, IntegrityError
 
@@ -48,9 +52,15 @@ class WarehouseBase:
             mappings:
                 Dictionary. Following a key-value schema, it stores the field relations between the original
                 data source and the schema used in the data models. 
+            bulk_pragmas:
+                Dictionary. SQLite pragmas applied to the connection used by the bulk operations, and
+                restored once they finish. Write-ahead logging is opt-in ('journal_mode': 'WAL'), since
+                it is kept by the database file while in use.
     '''
+    bulk_pragmas = {"synchronous": "NORMAL", "temp_store": "MEMORY", "cache_size": -200000}
+
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = get_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
@@ -110,7 +120,7 @@ class WarehouseBase:
     
     # ------------------ CRUD ------------------
 
-    def insert(self, table_name, data_df, batchsize=50, verbose=True):
+    def insert(self, table_name, data_df, batchsize=50, verbose=True, bulk=False):
         '''
             Insert new records from a given dataframe.
             
@@ -125,6 +135,9 @@ class WarehouseBase:
                     then the columns must match the original ones. 
                 batchsize:
                     Integer. Size of the batches of records to insert in the table.
+                bulk:
+                    Boolean. If True, all batches are inserted within a single transaction
+                    and records whose primary key already exists are ignored (see 'bulk_insert').
         '''
         # -- load the data model and the schema mapping from 'table_name' and rename the columns of 'data_df'
         try:
@@ -135,6 +148,12 @@ class WarehouseBase:
             data_df = data_df.rename(table_mapping, axis=1, errors='raise')
         except:
             raise Exception('Data source schema could not be properly mapped.')
+
+        if bulk:
+            # -- as in the dictionaries of records, a renamed column replaces the original one with the same name
+            data_df = data_df[ table_mapping.values() ]
+            data_df = data_df.loc[:, ~data_df.columns.duplicated(keep='last')]
+            return self.bulk_insert(table_name, data_df, batchsize=batchsize, verbose=verbose)
         
         # - define 'smart_hash' to avoid 'NaN' values in the records during insert
         nonan_hash = smart_dict()
@@ -180,6 +199,144 @@ class WarehouseBase:
             if verbose:
                 print('done.')
         
+    def bulk_insert(self, table_name, data_df, batchsize=50000, verbose=True):
+        '''
+            Fast insertion of records whose columns already follow the schema of the table.
+
+            All batches share one connection and one transaction. For SQLite, the rows are
+            sent as tuples through 'executemany' of the driver, with the pragmas in 'bulk_pragmas'
+            set during the insertion. Records with a primary key already stored (or duplicated
+            within 'data_df') are ignored with 'ON CONFLICT (<primary key>) DO NOTHING', keeping
+            the first one. Other violations (e.g. NOT NULL) raise an error.
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database. Possible to extract
+                    from attribute 'tables'.
+                data_df:
+                    pandas.DataFrame. Records to be inserted, with the column names of the data model.
+                batchsize:
+                    Integer. Size of the batches of records sent to the database.
+            Return:
+            -------
+                ninserted:
+                    Integer. Number of records effectively inserted.
+        '''
+        table_model = self._tables[table_name]
+        columns, defaults, processors = self._driver_columns(table_model, data_df.columns)
+
+        ninserted, nbatches = 0, (data_df.shape[0]-1)//batchsize + 1 if data_df.shape[0] else 0
+        with self._bulk_connection() as conn:
+            with conn.begin():
+                for nindex, start in enumerate(range(0, data_df.shape[0], batchsize)):
+                    if verbose:
+                        print(f'Insertion of batch {nindex+1} of {nbatches} ... ', end='')
+                    rows = self._driver_rows(data_df.iloc[start:start+batchsize], columns, defaults, processors)
+                    ninserted += self._executemany(conn, table_model, columns, rows, ignore_duplicates=True)
+                    if verbose:
+                        print('done.')
+
+        if verbose and ninserted<data_df.shape[0]:
+            print(f'{data_df.shape[0]-ninserted} records already stored were ignored.')
+        return ninserted
+
+    # ------------------ helpers of the bulk operations ------------------
+
+    @contextmanager
+    def _bulk_connection(self):
+        '''
+            Connection for bulk operations. For SQLite, the pragmas in 'bulk_pragmas' are applied
+            and their previous values are restored before the connection returns to the pool.
+        '''
+        conn = self._engine.connect()
+        previous = {}
+        try:
+            if self._engine.dialect.name=='sqlite':
+                for pragma, value in self.bulk_pragmas.items():
+                    previous[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+                    conn.exec_driver_sql(f"PRAGMA {pragma}={value}")
+                conn.commit()
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction():
+                    conn.rollback()
+                for pragma, value in previous.items():
+                    conn.exec_driver_sql(f"PRAGMA {pragma}={value}")
+                conn.commit()
+            except Exception:
+                # -- a connection whose settings could not be restored is not reused
+                conn.invalidate()
+            conn.close()
+
+    def _driver_columns(self, table_model, data_columns):
+        '''
+            Columns sent to the database when inserting a dataframe with columns 'data_columns'.
+
+            Columns with default values (e.g. 'CRIADO_EM') are included and, for SQLite, the type
+            conversions are returned since the statements are sent directly to the driver.
+        '''
+        dialect = self._engine.dialect
+        defaults = { col.name : col.default for col in table_model.columns if col.name not in data_columns
+                     and col.default is not None and (col.default.is_scalar or col.default.is_callable) }
+        # -- same order of the columns in the compiled statements
+        columns = [ col.name for col in table_model.columns if col.name in data_columns or col.name in defaults ]
+        if dialect.name=='sqlite':
+            processors = [ table_model.c[col].type.dialect_impl(dialect).bind_processor(dialect) for col in columns ]
+        else:
+            processors = [ None for col in columns ]
+        return columns, defaults, processors
+
+    def _driver_rows(self, batch_df, columns, defaults, processors):
+        '''
+            Rows of 'batch_df' as tuples of native python values, with None in place of the missing ones.
+        '''
+        batch_df = batch_df.astype(object)
+        batch_df = batch_df.where(batch_df.notna(), None)
+        for colname, default in defaults.items():
+            batch_df[colname] = default.arg(None) if default.is_callable else default.arg
+        # -- conversions (e.g. datetimes to strings) are computed once per distinct value
+        for colname, process in zip(columns, processors):
+            if process is not None:
+                codes, uniques = pd.factorize(batch_df[colname])
+                processed = np.array([ process(val) for val in uniques ] + [None], dtype=object)
+                batch_df[colname] = processed[codes]
+        return list(batch_df[columns].itertuples(index=False, name=None))
+
+    def _executemany(self, conn, table_model, columns, rows, ignore_duplicates=False):
+        '''
+            Insert the rows built by '_driver_rows' and return the number of inserted records.
+        '''
+        if len(rows)==0:
+            return 0
+        ins = table_model.insert()
+        primary_key_names = [ p.name for p in inspect(table_model).primary_key ]
+        if ignore_duplicates and len(primary_key_names):
+            # -- only conflicts on the primary key are ignored
+            ins = self._dialect_insert(table_model).on_conflict_do_nothing(index_elements=primary_key_names)
+        if self._engine.dialect.name=='sqlite':
+            sql_str = str(ins.compile(dialect=self._engine.dialect, column_keys=columns))
+            return conn.exec_driver_sql(sql_str, rows).rowcount
+        if self._engine.dialect.name=='duckdb':
+            # -- the driver does not report the number of rows inserted by 'executemany'
+            count = select(func.count()).select_from(table_model)
+            nrecords = conn.execute(count).scalar()
+            conn.execute(ins, [ dict(zip(columns, row)) for row in rows ])
+            return conn.execute(count).scalar()-nrecords
+        return conn.execute(ins, [ dict(zip(columns, row)) for row in rows ]).rowcount
+
+    def _dialect_insert(self, table_model):
+        '''
+            INSERT construct with support to 'ON CONFLICT' clauses.
+        '''
+        if self._engine.dialect.name=='sqlite':
+            return sqlite_insert(table_model)
+        # -- DuckDB follows the PostgreSQL syntax
+        if self._engine.dialect.name in ('postgresql', 'duckdb'):
+            return postgresql_insert(table_model)
+        raise Exception(f"Conflict resolution not available for '{self._engine.dialect.name}'.")
+
     def update(self, table_name, primary_key_value, updated_record, verbose=True):
         '''
             Update a given record identified by its primary key value 'primary_key_value'.
@@ -248,6 +405,143 @@ class WarehouseBase:
                 if verbose:
                     print('done.')
 
+    def upsert(self, table_name, data_df, batchsize=50000, verbose=True):
+        '''
+            Insert new records and update the stored ones from a given dataframe.
+
+            Records are matched through the primary key of the table. Each batch is loaded
+            into a temporary table and merged with a single 'INSERT ... ON CONFLICT DO UPDATE'
+            statement. Stored records are only updated (with 'ATUALIZADO_EM' refreshed) when at
+            least one of the fields changed.
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database. Possible to extract
+                    from attribute 'tables'.
+                data_df:
+                    pandas.DataFrame. Records to be inserted or updated. Schema should match the
+                    official data sources, as in 'insert'. For repeated primary keys, the last
+                    record is kept.
+                batchsize:
+                    Integer. Size of the batches of records merged at once.
+            Return:
+            -------
+                counts:
+                    Dictionary. Number of records 'inserted', 'updated' and 'unchanged'.
+        '''
+        try:
+            table_model, table_mapping = self._tables[table_name], self._mappings[table_name]
+        except:
+            raise Exception(f"Table '{table_name}' not found.")
+        try:
+            data_df = data_df.rename(table_mapping, axis=1, errors='raise')[ table_mapping.values() ]
+        except:
+            raise Exception('Data source schema could not be properly mapped.')
+        data_df = data_df.loc[:, ~data_df.columns.duplicated(keep='last')]
+
+        primary_key_names = [ p.name for p in inspect(table_model).primary_key ]
+        if len(primary_key_names)==0:
+            raise Exception(f"Table '{table_name}' has no primary key to match the records.")
+        data_df = data_df.drop_duplicates(subset=primary_key_names, keep='last')
+
+        columns, defaults, processors = self._driver_columns(table_model, data_df.columns)
+        compared = [ col for col in data_df.columns if col not in primary_key_names ]
+        refreshed = [ col.name for col in table_model.columns if col.onupdate is not None and col.name in defaults ]
+
+        # -- temporary table with the batch to be merged
+        temp = Table(f"temp_upsert_{table_name}", MetaData(),
+                     *[ Column(col, table_model.c[col].type) for col in columns ], prefixes=["TEMPORARY"])
+        same_key = and_(*[ table_model.c[col]==temp.c[col] for col in primary_key_names ])
+        changed = or_(*[ table_model.c[col].is_distinct_from(temp.c[col]) for col in compared ])
+        new_records = select(func.count()).select_from(temp.outerjoin(table_model, same_key)).where(table_model.c[primary_key_names[0]].is_(None))
+        changed_records = select(func.count()).select_from(temp.join(table_model, same_key)).where(changed)
+
+        # -- 'WHERE true' avoids the ambiguity of 'ON CONFLICT' after a SELECT in SQLite
+        ups = self._dialect_insert(table_model).from_select(columns, select(*[ temp.c[col] for col in columns ]).where(true()))
+        if len(compared):
+            updated_values = { col : ups.excluded[col] for col in compared+refreshed }
+            updated_when = or_(*[ table_model.c[col].is_distinct_from(ups.excluded[col]) for col in compared ])
+            ups = ups.on_conflict_do_update(index_elements=primary_key_names, set_=updated_values, where=updated_when)
+        else:
+            ups = ups.on_conflict_do_nothing(index_elements=primary_key_names)
+
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        nbatches = (data_df.shape[0]-1)//batchsize + 1 if data_df.shape[0] else 0
+        with self._bulk_connection() as conn:
+            with conn.begin():
+                temp.create(conn)
+                for nindex, start in enumerate(range(0, data_df.shape[0], batchsize)):
+                    if verbose:
+                        print(f'Upsert of batch {nindex+1} of {nbatches} ... ', end='')
+                    rows = self._driver_rows(data_df.iloc[start:start+batchsize], columns, defaults, processors)
+                    self._executemany(conn, temp, columns, rows)
+
+                    ninserted = conn.execute(new_records).scalar()
+                    nupdated = conn.execute(changed_records).scalar() if len(compared) else 0
+                    conn.execute(ups)
+                    conn.execute(temp.delete())
+
+                    counts["inserted"] += ninserted
+                    counts["updated"] += nupdated
+                    counts["unchanged"] += len(rows)-ninserted-nupdated
+                    if verbose:
+                        print('done.')
+                temp.drop(conn)
+
+        if verbose:
+            print(f"Inserted: {counts['inserted']} - Updated: {counts['updated']} - Unchanged: {counts['unchanged']}")
+        return counts
+
+    def delete_many(self, table_name, list_of_records, colname=None, batchsize=50000, verbose=True):
+        '''
+            Delete a list of records from the warehouse within a single transaction. The records
+            are identified according to the value of their primary keys (or of 'colname').
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database. Possible to extract
+                    from attribute 'tables'.
+                list_of_records:
+                    List of unique IDs representing the primary key of the records
+                    to be deleted.
+                colname:
+                    String. Column identifying the records, if not the primary key. All records
+                    matching the given values are deleted.
+                batchsize:
+                    Integer. Number of IDs deleted at once.
+            Return:
+            -------
+                ndeleted:
+                    Integer. Number of records deleted.
+        '''
+        table_model = self._tables[table_name]
+        primary_key_name = colname
+        if colname is None:
+            primary_key_name = [ p.name for p in inspect(table_model).primary_key ][0]
+
+        # -- the IDs are loaded into a temporary table and deleted with a single statement per batch
+        temp = Table(f"temp_delete_{table_name}", MetaData(),
+                     Column(primary_key_name, table_model.c[primary_key_name].type), prefixes=["TEMPORARY"])
+        qdel = delete(table_model).where(table_model.c[primary_key_name].in_(select(temp.c[primary_key_name])))
+
+        list_of_records = list(list_of_records)
+        ndeleted = 0
+        with self._bulk_connection() as conn:
+            with conn.begin():
+                temp.create(conn)
+                for start in range(0, len(list_of_records), batchsize):
+                    rows = [ (record,) for record in list_of_records[start:start+batchsize] ]
+                    self._executemany(conn, temp, [primary_key_name], rows)
+                    ndeleted += conn.execute(qdel).rowcount
+                    conn.execute(temp.delete())
+                temp.drop(conn)
+
+        if verbose:
+            print(f'Records deleted: {ndeleted}')
+        return ndeleted
+
     def delete_table(self, table_name, is_sure=False, authkey=""):
         '''
             Delete a given table from the database.
@@ -275,17 +569,146 @@ class WarehouseBase:
             else:
                 raise Exception('delete table command called, but without assurance.')
             
+    # --------------- INDEX MANAGEMENT ---------------
+
+    def manage_indexes(self, action='create', table_names=None, verbose=True):
+        '''
+            Create, rebuild or analyze the secondary indexes declared in the data models.
+
+            'db_init' creates the indexes only along with new tables, so 'create' adds the indexes
+            declared after a table was created. 'rebuild' drops and creates them again and 'analyze'
+            updates the statistics used by the query planner (also done after 'rebuild').
+
+            Args:
+            -----
+                action:
+                    String. 'create', 'rebuild' or 'analyze'.
+                table_names:
+                    List. Tables whose indexes are managed. All tables if not provided.
+            Return:
+            -------
+                index_names:
+                    List. Names of the indexes created (only the missing ones) or rebuilt.
+        '''
+        if action not in ('create', 'rebuild', 'analyze'):
+            raise Exception(f"Action '{action}' not supported. Use 'create', 'rebuild' or 'analyze'.")
+        table_names = list(self._tables.keys()) if table_names is None else table_names
+
+        index_names = []
+        with self._engine.begin() as conn:
+            existing = set(inspect(conn).get_table_names())
+            for table_name in table_names:
+                table_model = self._tables[table_name]
+                if table_model.name not in existing:
+                    continue
+                stored = self._stored_indexes(conn, table_model.name)
+                for index in sorted(table_model.indexes, key=lambda index: index.name):
+                    if action=='rebuild' and index.name in stored:
+                        index.drop(conn)
+                    if action=='rebuild' or (action=='create' and index.name not in stored):
+                        index.create(conn)
+                        index_names.append(index.name)
+                if action in ('rebuild', 'analyze'):
+                    conn.exec_driver_sql(f"ANALYZE {conn.dialect.identifier_preparer.quote(table_model.name)}")
+        if verbose:
+            print(f"{action}: {len(index_names)} indexes in {len(table_names)} tables.")
+        return index_names
+
+    def _stored_indexes(self, conn, table_name):
+        '''
+            Names of the indexes of a table stored in the database. DuckDB indexes are not reflected
+            by its SQLAlchemy dialect, so they are read from its catalog.
+        '''
+        if self._engine.dialect.name=='duckdb':
+            rows = conn.exec_driver_sql(f"SELECT index_name FROM duckdb_indexes() WHERE table_name='{table_name}'")
+            return set([ row[0] for row in rows ])
+        return set([ index["name"] for index in inspect(conn).get_indexes(table_name) ])
+
+    def explain(self, sel):
+        '''
+            Query plan of a query, as chosen by the database.
+
+            Args:
+            -----
+                sel:
+                    sqlalchemy.Select.
+            Return:
+            -------
+                plan:
+                    List of strings. Steps of the plan.
+        '''
+        statement = str(sel.compile(dialect=self._engine.dialect, compile_kwargs={"literal_binds": True}))
+        prefix = "EXPLAIN QUERY PLAN" if self._engine.dialect.name=='sqlite' else "EXPLAIN"
+        with self._engine.connect() as conn:
+            rows = conn.exec_driver_sql(f"{prefix} {statement}").fetchall()
+        # -- SQLite returns the step in the last column, other databases one line of text per row
+        return [ str(row[-1]) for row in rows ]
+
+    def common_queries(self):
+        '''
+            Common access paths of the warehouse: period of notification (see 'query_period'),
+            records of a source, records of a person through the foreign keys, and the leading
+            columns of each declared index (e.g. blocking keys).
+        '''
+        queries = {}
+        period = [dt.datetime(2000, 1, 1), dt.datetime(2000, 12, 31)]
+        for table_name, table_model in self._tables.items():
+            if "DATA_NOTIFICACAO" in table_model.c:
+                queries[f"{table_name}: DATA_NOTIFICACAO"] = self.select_records(table_name, date_col="DATA_NOTIFICACAO", period=period)
+            for index in table_model.indexes:
+                columns = [ col for col in index.columns ]
+                condition = and_(*[ col.between(*period) if isinstance(col.type, DateTime) else col==(0 if isinstance(col.type, Integer) else "0") for col in columns ])
+                queries.setdefault(f"{table_name}: {'+'.join([ col.name for col in columns ])}", select(table_model).where(condition))
+            for fkey in table_model.foreign_keys:
+                if not fkey.parent.primary_key:
+                    queries.setdefault(f"{table_name}: {fkey.parent.name}", select(table_model).where(fkey.parent=="0"))
+        return queries
+
+    def check_query_plans(self, queries=None, verbose=True):
+        '''
+            Check whether the query plans of the access paths avoid full table scans.
+
+            On DuckDB, sequential scans filtered by the zone maps of the columns are the usual plan
+            for ranges and non-selective filters, so full scans are expected there.
+
+            Args:
+            -----
+                queries:
+                    Dictionary. Name and sqlalchemy.Select of each query. Default is 'common_queries'.
+            Return:
+            -------
+                plans:
+                    pandas.DataFrame. Query ('CONSULTA'), its plan ('PLANO') and whether the plan
+                    scans a whole table ('VARREDURA_COMPLETA').
+        '''
+        queries = self.common_queries() if queries is None else queries
+        plans = []
+        for name, sel in queries.items():
+            plan = self.explain(sel)
+            # -- SQLite: 'SCAN <table>'; PostgreSQL: 'Seq Scan'; DuckDB: 'SEQ_SCAN'
+            full_scan = any([ step.lstrip(" |-`").startswith("SCAN ") or "Seq Scan" in step or "SEQ_SCAN" in step for step in plan ])
+            plans.append({"CONSULTA": name, "PLANO": " | ".join([ step.strip() for step in plan ]), "VARREDURA_COMPLETA": full_scan})
+        plans = pd.DataFrame(plans, columns=["CONSULTA", "PLANO", "VARREDURA_COMPLETA"])
+        if verbose:
+            print(f"Queries with full table scans: {plans['VARREDURA_COMPLETA'].sum()} of {plans.shape[0]}")
+        return plans
+
     # --------------- BUILT-IN QUERY METHODS ---------------
     
-    def number_of_records(self, table_name):
+    def number_of_records(self, table_name, refresh=False):
         '''
             Return the number of records from a specific table within the warehouse.
+
+            The records are counted by the database (COUNT(*)) and, for SQLite and DuckDB, the
+            result is cached until the table changes (see 'table_version').
             
             Args:
             -----
                 table_name:
                     String. Table name inside the database. Possible to extract
                     from attribute 'tables'.
+                refresh:
+                    Boolean. Default False. If True, the cached result is ignored.
     
             Results:
                 results:
@@ -293,17 +716,133 @@ class WarehouseBase:
         '''
         # -- Load and select the data model
         table_model = self._tables[table_name]
-        sel = select(table_model)
+        sel = select(func.count()).select_from(table_model)
 
         try:
-            with self._engine.connect() as conn:
-                rp = conn.execute(sel)
-                nrecords = 0
-                for record in rp: nrecords+=1
-                return nrecords
+            return self._cached_aggregate(table_name, ("count",), lambda conn: conn.execute(sel).scalar_one(), refresh=refresh)
         except Exception as error:
             print(error.args[0])
             return -1
+
+    def count_by(self, table_name, columns=("FONTE",), year_col=None, refresh=False):
+        '''
+            Number of records of a table for each group of values of the given columns and, optionally,
+            for each year of a date field. The records are grouped by the database (GROUP BY).
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                columns:
+                    List. Fields used to group the records. Default is 'FONTE'.
+                year_col:
+                    String. Date field whose year is also used to group the records (column 'ANO'
+                    of the result).
+                refresh:
+                    Boolean. Default False. If True, the cached result is ignored.
+            Return:
+            -------
+                counts:
+                    pandas.DataFrame. Grouping columns and the number of records of each group
+                    (column 'NUMERO_REGISTROS').
+        '''
+        table_model = self._tables[table_name]
+        groups = [ table_model.c[col] for col in columns ]
+        if year_col is not None:
+            groups.append(func.extract('year', table_model.c[year_col]).label("ANO"))
+        sel = select(*groups, func.count().label("NUMERO_REGISTROS")).group_by(*groups).order_by(*groups)
+
+        def aggregate(conn):
+            rp = conn.execute(sel)
+            return pd.DataFrame(rp.fetchall(), columns=list(rp.keys()))
+
+        key = ("count_by", tuple(columns), year_col)
+        return self._cached_aggregate(table_name, key, aggregate, refresh=refresh).copy()
+
+    def date_range(self, table_name, date_col, refresh=False):
+        '''
+            Earliest and latest dates of a date field of a table (MIN and MAX computed by the database).
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                date_col:
+                    String. Date field of the table.
+                refresh:
+                    Boolean. Default False. If True, the cached result is ignored.
+            Return:
+            -------
+                date_range:
+                    2-element tuple of datetime.datetime. None for tables without dates.
+        '''
+        table_model = self._tables[table_name]
+        sel = select(func.min(table_model.c[date_col]), func.max(table_model.c[date_col]))
+        aggregate = lambda conn: tuple(conn.execute(sel).one())
+        return self._cached_aggregate(table_name, ("date_range", date_col), aggregate, refresh=refresh)
+
+    # --------------- CACHE OF THE AGGREGATES ---------------
+
+    def table_version(self, table_name):
+        '''
+            Version of a table, used to invalidate the cached aggregates.
+
+            The version changes whenever a statement writing to the table is executed through the
+            engine of the warehouse. For SQLite and DuckDB files, the modification time and size of
+            the database files are also part of the version, so writes from other processes are detected.
+            For server databases (e.g. PostgreSQL), the writes of other clients cannot be detected, so
+            there is no version (None) and the aggregates are not cached.
+        '''
+        if self._engine.dialect.name not in ('sqlite', 'duckdb'):
+            return None
+        versions = self._aggregate_state()[1]
+        version = (versions.get(table_name, 0), versions.get("*", 0))
+        database = self._engine.url.database
+        if database not in (None, "", ":memory:"):
+            files = [ Path(database), Path(f"{database}-wal"), Path(f"{database}.wal") ]
+            version += tuple([ (f.stat().st_mtime_ns, f.stat().st_size) for f in files if f.exists() ])
+        return version
+
+    def _aggregate_state(self):
+        '''
+            Cache of the aggregates and versions of the tables. Created on first use, when the writes
+            executed through the engine start to be tracked.
+        '''
+        if getattr(self, "_aggregate_cache", None) is None:
+            self._aggregate_cache, self._table_versions = {}, {}
+            event.listen(self._engine, "after_cursor_execute", self._track_writes)
+        return self._aggregate_cache, self._table_versions
+
+    def _track_writes(self, conn, cursor, statement, parameters, context, executemany):
+        '''
+            Increase the version of the tables written by a statement. Statements sent directly to
+            the driver (without a compiled table) increase the version of all tables.
+        '''
+        if not statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE", "REPLACE", "DROP", "CREATE", "ALTER")):
+            return
+        compiled = getattr(context, "compiled", None)
+        table = getattr(getattr(compiled, "statement", None), "table", None)
+        name = getattr(table, "name", "*")
+        self._table_versions[name] = self._table_versions.get(name, 0) + 1
+
+    def _cached_aggregate(self, table_name, key, aggregate, refresh=False):
+        '''
+            Result of 'aggregate' (a function of a connection) for the current version of the table.
+            Tables without a version (see 'table_version') are always aggregated by the database.
+        '''
+        version = self.table_version(table_name)
+        if version is None:
+            with self._engine.connect() as conn:
+                return aggregate(conn)
+
+        cache = self._aggregate_state()[0]
+        cached = cache.get((table_name, key))
+        if not refresh and cached is not None and cached[0]==version:
+            return cached[1]
+        with self._engine.connect() as conn:
+            result = aggregate(conn)
+        cache[(table_name, key)] = (version, result)
+        return result
     
     def query_all(self, table_name, columns=None):
         '''
@@ -464,4 +1003,122 @@ class WarehouseBase:
                 return results
         except Exception as error:
             print(error.args[0])
-            return [] 
\ No newline at end of file
+            return [] 
+    # --------------- STREAMING (COLUMNAR) QUERY METHODS ---------------
+
+    def select_records(self, table_name, columns=None, value=None, colname=None, condition='equal', date_col=None, period=None):
+        '''
+            Build the query of the records of a table, with the same filters of 'query_where' and
+            'query_period'. Only the selected columns are included in the SELECT.
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                columns:
+                    List. Subset of columns to retrieve. All columns if not provided.
+                value, colname, condition:
+                    Filter on the field 'colname' (see 'query_where'). Ignored if 'colname' is None.
+                date_col, period:
+                    Filter on the period of the date field 'date_col' (see 'query_period'). Ignored
+                    if 'period' is None.
+            Return:
+            -------
+                sel:
+                    sqlalchemy.Select.
+        '''
+        table_model = self._tables[table_name]
+        if columns is None:
+            sel = select(table_model)
+        else:
+            sel = select(*[ table_model.c[col] for col in columns ])
+
+        if colname is not None:
+            if condition=='equal':
+                sel = sel.where(table_model.c[colname] == value)
+            elif condition=='larger':
+                sel = sel.where(table_model.c[colname] >= value)
+            elif condition=='smaller':
+                sel = sel.where(table_model.c[colname] < value)
+            sel = sel.order_by(table_model.c[colname])
+
+        if period is not None:
+            if date_col is None:
+                raise Exception("The name of the datetime field should be provided.")
+            period = list(period)
+            if period[1] is None:
+                period[1] = dt.datetime.today()
+            sel = sel.where(table_model.c[date_col].between(period[0], period[1])).order_by(table_model.c[date_col])
+        return sel
+
+    def stream_query(self, sel, batchsize=100000, output='pandas'):
+        '''
+            Execute a query and yield its results in batches of at most 'batchsize' records.
+
+            The rows are fetched from a server-side cursor (when supported by the driver), so the
+            first batch is available before the whole result is read and only one batch of rows
+            is held in memory at a time.
+
+            Args:
+            -----
+                sel:
+                    sqlalchemy.Select. Query to be executed (e.g. from 'select_records').
+                batchsize:
+                    Integer. Maximum number of records of each batch.
+                output:
+                    String. 'pandas' for pandas.DataFrame batches or 'arrow' for pyarrow.RecordBatch
+                    batches (requires pyarrow).
+            Return:
+            -------
+                batches:
+                    Generator of pandas.DataFrame or pyarrow.RecordBatch. Date fields are typed as
+                    datetimes and numeric fields as numbers.
+        '''
+        if output not in ('pandas', 'arrow'):
+            raise Exception(f"Output '{output}' not supported. Use 'pandas' or 'arrow'.")
+        if output=='arrow':
+            try:
+                import pyarrow as pa
+            except ImportError:
+                raise Exception("pyarrow is required for 'arrow' batches.")
+
+        date_cols = [ col.name for col in sel.selected_columns if isinstance(col.type, DateTime) ]
+        with self._engine.connect() as conn:
+            rp = conn.execution_options(stream_results=True, yield_per=batchsize).execute(sel)
+            keys = list(rp.keys())
+            for rows in rp.partitions(batchsize):
+                batch = pd.DataFrame.from_records(rows, columns=keys, coerce_float=True)
+                for colname in date_cols:
+                    batch[colname] = pd.to_datetime(batch[colname])
+                yield batch if output=='pandas' else pa.RecordBatch.from_pandas(batch, preserve_index=False)
+
+    def stream_records(self, table_name, columns=None, batchsize=100000, output='pandas', **filters):
+        '''
+            Yield the records of a table in batches of at most 'batchsize' records.
+
+            Args:
+            -----
+                table_name:
+                    String. Table name inside the database.
+                columns:
+                    List. Subset of columns to retrieve. All columns if not provided.
+                filters:
+                    Filters of the records ('value', 'colname', 'condition', 'date_col' and 'period'),
+                    see 'select_records'.
+            Return:
+            -------
+                batches:
+                    Generator of pandas.DataFrame or pyarrow.RecordBatch (see 'stream_query').
+        '''
+        return self.stream_query(self.select_records(table_name, columns=columns, **filters), batchsize=batchsize, output=output)
+
+    def query_frame(self, table_name, columns=None, batchsize=100000, **filters):
+        '''
+            Records of a table as a single pandas.DataFrame, built from the batches of 'stream_records'
+            (the rows are never held all at once as python objects).
+        '''
+        sel = self.select_records(table_name, columns=columns, **filters)
+        batches = list(self.stream_query(sel, batchsize=batchsize))
+        if len(batches)==0:
+            return pd.DataFrame(columns=[ col.name for col in sel.selected_columns ])
+        return pd.concat(batches, ignore_index=True)
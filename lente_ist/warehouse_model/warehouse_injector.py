@@ -13,12 +13,16 @@
 import numpy as np
 import pandas as pd
 import datetime as dt
+import hashlib
 from simpledbf import Dbf5
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 # -- import the warehouse class
 from lente_ist import WarehouseHIV
+from lente_ist.warehouse_model.backend import warehouse_url
 from lente_ist.utils import select_folder
+from lente_ist.process_layer.standardized_store import StandardizedRecords
 from lente_ist.warehouse_model.utils import process_siclom, process_sinan, process_sim, process_simc, process_siscel
 
 class InjectorHIV:
@@ -32,7 +36,8 @@ class InjectorHIV:
             warehouse_location:
                 String. Absolute path to the folder containing (or that will contain) the database with the injected data.
             warehouse_name:
-                String. Filename of the database.
+                String. Filename of the database ('.db' for SQLite, '.duckdb' for DuckDB) or the
+                URL of a database server (e.g. PostgreSQL), see 'backend.warehouse_url'.
                 
         Attributes:
         -----------
@@ -60,7 +65,7 @@ class InjectorHIV:
         self.basefolder = Path(source_data_location)
         self.warehouse_location = Path(warehouse_location)
         self.warehouse_name = Path(warehouse_name)
-        self.engine_url = f"sqlite:///{self.warehouse_location.joinpath(self.warehouse_name)}"
+        self.engine_url = warehouse_url(warehouse_location, warehouse_name)
 
         self.warehouse = WarehouseHIV(self.engine_url)
         self.engine = self.warehouse.db_init()
@@ -84,65 +89,200 @@ class InjectorHIV:
         self.warehouse = WarehouseHIV(self.engine_url)
         self.engine = self.warehouse.db_init()
 
-    def inject_data(self, verbose=True):
+    def stored_hash(self, source_name):
+        '''
+            Content hash of the source file recorded in the last injection (None if never injected).
+        '''
+        stored = self.warehouse.query_where('source_files', value=source_name, colname='FONTE')
+        return stored[0].HASH if len(stored) else None
+
+    def select_changed_records(self, data_df, source_name):
+        '''
+            Keep only the records of 'data_df' that are new or changed since the last injection of the source.
+
+            Records are grouped by 'ID' and each group is summarized by the hash of its rows. Groups
+            whose hash differs from the one stored in 'source_records' are returned.
+
+            Args:
+            -----
+                data_df:
+                    pandas.DataFrame. Processed records of the source file.
+                source_name:
+                    String. Stem of the source file (e.g. 'AIDSANET').
+            Return:
+            -------
+                changed_df:
+                    pandas.DataFrame. Records of the new or changed IDs.
+                fingerprints:
+                    pandas.DataFrame. Columns 'FONTE', 'ID' and 'FINGERPRINT' of the new or changed IDs.
+        '''
+        fingerprints = record_fingerprints(data_df)
+        stored = self.warehouse.query_where('source_records', value=source_name, colname='FONTE')
+        stored = pd.Series([ rec.FINGERPRINT for rec in stored ], index=[ rec.ID for rec in stored ], dtype=object)
+
+        changed = fingerprints!=stored.reindex(fingerprints.index).values
+        fingerprints = fingerprints[changed]
+        changed_df = data_df[data_df["ID"].isin(fingerprints.index)]
+        fingerprints = pd.DataFrame({"FONTE": source_name, "ID": fingerprints.index, "FINGERPRINT": fingerprints.values})
+        return changed_df, fingerprints
+
+    def inject_data(self, incremental=False, n_jobs=1, verbose=True):
         '''
             Considering the expected files within the selected folder, inject the formatted data into the database.
+
+            Args:
+            -----
+                incremental:
+                    Boolean. If True, files with the same content hash as in the last injection are
+                    skipped. For the other files, only the IDs with new or changed records are
+                    injected: 'pessoa' is upserted and the records of these IDs in the info tables
+                    are replaced. The hashes are kept in 'source_files' and 'source_records'.
+                n_jobs:
+                    Integer. Number of processes reading and processing the source files at the same
+                    time. The records are still written to the database by this process only, one
+                    source at a time and in the order of 'expected_files'.
         '''
+        info_tables = {
+            "AIDSANET": "sinan_aids_adulto_info", "AIDSCNET": "sinan_aids_crianca_info", "SICLOM": "siclom_info",
+            "DO2020": "sim_info", "DO2021": "sim_info", "DO2022": "sim_info", "DO2023": "sim_info",
+            "SIMC": "simc_info", "SISCEL_CV_CD4": "siscel_info",
+        }
+
+        # -- select the files to be injected
+        pending = []
         for current_file in self._expected_files:
             source_name = current_file.stem
-            extension = current_file.suffix.lower()
 
             # -- check whether data exists in the source folder
-            if self.basefolder.joinpath(current_file).exists():
-                if extension=='.dbf':
-                    data_df = Dbf5(self.basefolder.joinpath(current_file), codec='latin').to_dataframe()
-                elif extension==".xlsx":
-                    data_df = pd.read_excel(self.basefolder.joinpath(current_file))
-                elif extension==".parquet":
-                    data_df = pd.read_parquet(self.basefolder.joinpath(current_file))
-                    #if self.source_guide[source_name]=="SIMC":
-                    #    data_df = pd.read_excel(self.basefolder.joinpath(current_file))
-                    #else:
-                    #    data_df = pd.read_excel(self.basefolder.joinpath(current_file))
-
-            if self.source_guide[source_name]=="SINAN":
-                data_df = process_sinan(data_df, source_name=source_name)
-            elif self.source_guide[source_name]=="SICLOM":
-                data_df = process_siclom(data_df, source_name="SICLOM")
-            elif self.source_guide[source_name]=="SIMC":
-                data_df = process_simc(data_df, source_name="SIMC")
-            elif self.source_guide[source_name]=="SIM":
-                data_df = process_sim(data_df, source_name=source_name)
-            elif self.source_guide[source_name]=="SISCEL":
-                data_df = process_siscel(data_df, source_name=source_name)
-
-            # -- check whether a ID already exists in the db (for now, not necessary)
-            #min_year, max_year = data_df["DT_NOTIFIC"].min().year, data_df["DT_NOTIFIC"].max().year
-            #list_of_ids = []
-            #try:
-            #    for current_year in np.arange(min_year, max_year+1, 1):
-            #        list_of_ids += [ pd.DataFrame(self.warehouse.query_id('pessoa', current_year)) ]
-            #    list_of_ids = pd.concat(list_of_ids)
-            #    if list_of_ids.shape[0]>0:
-            #        list_of_ids = list_of_ids["ID"]
-            #    # -- remove from the dbf the records already present in the database
-            #    data_df = data_df[~data_df["ID"].isin(list_of_ids)].copy()
-            #except:
-            #    print("no records to check duplicated IDs.")
-            
-            self.warehouse.insert('pessoa', data_df, batchsize=200, verbose=verbose)
-            if source_name=="AIDSANET":
-                self.warehouse.insert('sinan_aids_adulto_info', data_df, batchsize=200, verbose=verbose)
-            elif source_name=="AIDSCNET":
-                self.warehouse.insert('sinan_aids_crianca_info', data_df, batchsize=200, verbose=verbose)
-            elif source_name=="SICLOM":
-                self.warehouse.insert('siclom_info', data_df, batchsize=200, verbose=verbose)
-            elif self.source_guide[source_name]=="SIM":
-                self.warehouse.insert('sim_info', data_df, batchsize=200, verbose=verbose)
-            elif self.source_guide[source_name]=="SIMC":
-                self.warehouse.insert('simc_info', data_df, batchsize=200, verbose=verbose)
-            elif self.source_guide[source_name]=="SISCEL":
-                self.warehouse.insert("siscel_info", data_df, batchsize=200, verbose=verbose)
-            print("done.")
+            filepath = self.basefolder.joinpath(current_file)
+            if not filepath.exists():
+                continue
+
+            # -- skip files not modified since the last injection
+            content_hash = None
+            if incremental:
+                content_hash = file_hash(filepath)
+                if self.stored_hash(source_name)==content_hash:
+                    print(f"{current_file} not modified since the last injection ... skipped.")
+                    continue
+            pending.append((current_file, content_hash))
+
+        # -- read and process the files (in parallel, if requested)
+        executor = None
+        if n_jobs>1 and len(pending)>1:
+            executor = ProcessPoolExecutor(max_workers=min(n_jobs, len(pending)))
+            futures = [ executor.submit(read_source, self.basefolder.joinpath(current_file), self.source_guide[current_file.stem]) for current_file, _ in pending ]
+            sources = ( future.result() for future in futures )
+        else:
+            sources = ( read_source(self.basefolder.joinpath(current_file), self.source_guide[current_file.stem]) for current_file, _ in pending )
+
+        try:
+            for (current_file, content_hash), data_df in zip(pending, sources):
+                source_name = current_file.stem
+
+                # -- check whether a ID already exists in the db (for now, not necessary)
+                #min_year, max_year = data_df["DT_NOTIFIC"].min().year, data_df["DT_NOTIFIC"].max().year
+                #list_of_ids = []
+                #try:
+                #    for current_year in np.arange(min_year, max_year+1, 1):
+                #        list_of_ids += [ pd.DataFrame(self.warehouse.query_id('pessoa', current_year)) ]
+                #    list_of_ids = pd.concat(list_of_ids)
+                #    if list_of_ids.shape[0]>0:
+                #        list_of_ids = list_of_ids["ID"]
+                #    # -- remove from the dbf the records already present in the database
+                #    data_df = data_df[~data_df["ID"].isin(list_of_ids)].copy()
+                #except:
+                #    print("no records to check duplicated IDs.")
+
+                if incremental:
+                    number_of_records = data_df.shape[0]
+                    data_df, fingerprints = self.select_changed_records(data_df, source_name)
+                    print(f"{current_file}: {data_df.shape[0]} of {number_of_records} records new or changed.")
 
+                    # -- the info records are removed before the upsert: DuckDB refuses to update the indexed
+                    # -- fields of a record of 'pessoa' still referenced by a foreign key
+                    self.warehouse.delete_many(info_tables[source_name], list(fingerprints["ID"]), colname="ID", verbose=verbose)
+                    # -- first record of each ID, as in the full injection
+                    self.warehouse.upsert('pessoa', data_df.drop_duplicates(subset=["ID"], keep='first'), verbose=verbose)
+                    self.warehouse.insert(info_tables[source_name], data_df, batchsize=50000, verbose=verbose, bulk=True)
 
+                    self.warehouse.upsert('source_records', fingerprints, verbose=False)
+                    manifest = pd.DataFrame([{"FONTE": source_name, "ARQUIVO": str(current_file), "HASH": content_hash, "NUMERO_REGISTROS": number_of_records}])
+                    self.warehouse.upsert('source_files', manifest, verbose=False)
+                    print("done.")
+                    continue
+
+                self.warehouse.insert('pessoa', data_df, batchsize=50000, verbose=verbose, bulk=True)
+                self.warehouse.insert(info_tables[source_name], data_df, batchsize=50000, verbose=verbose, bulk=True)
+                print("done.")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        # -- standardize the new or updated records of 'pessoa' for the matching agents
+        StandardizedRecords(self.warehouse).refresh(verbose=verbose)
+
+        # -- indexes declared after the tables were created, and statistics of the planner after the load
+        self.warehouse.manage_indexes('create', verbose=verbose)
+        self.warehouse.manage_indexes('analyze', verbose=verbose)
+
+def read_source(filepath, source_type):
+    '''
+        Read a source file and format its records with the processing of its information system.
+
+        Args:
+        -----
+            filepath:
+                pathlib.Path. Path to the source file. Its stem is the name of the source (e.g. 'DO2021').
+            source_type:
+                String. Information system of the source: 'SINAN', 'SICLOM', 'SIM', 'SIMC' or 'SISCEL'.
+    '''
+    source_name = filepath.stem
+    extension = filepath.suffix.lower()
+    if extension=='.dbf':
+        data_df = Dbf5(filepath, codec='latin').to_dataframe()
+    elif extension==".xlsx":
+        data_df = pd.read_excel(filepath)
+    elif extension==".parquet":
+        data_df = pd.read_parquet(filepath)
+        #if self.source_guide[source_name]=="SIMC":
+        #    data_df = pd.read_excel(self.basefolder.joinpath(current_file))
+        #else:
+        #    data_df = pd.read_excel(self.basefolder.joinpath(current_file))
+
+    if source_type=="SINAN":
+        data_df = process_sinan(data_df, source_name=source_name)
+    elif source_type=="SICLOM":
+        data_df = process_siclom(data_df, source_name="SICLOM")
+    elif source_type=="SIMC":
+        data_df = process_simc(data_df, source_name="SIMC")
+    elif source_type=="SIM":
+        data_df = process_sim(data_df, source_name=source_name)
+    elif source_type=="SISCEL":
+        data_df = process_siscel(data_df, source_name=source_name)
+    return data_df
+
+def file_hash(filepath, chunksize=2**20):
+    '''
+        SHA-256 hash of the content of a file.
+    '''
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def record_fingerprints(data_df):
+    '''
+        Hash of the records of each 'ID' of 'data_df', independent of the order of the rows.
+
+        Return:
+        -------
+            fingerprints:
+                pandas.Series. Hexadecimal hashes indexed by 'ID'.
+    '''
+    row_hashes = pd.util.hash_pandas_object(data_df, index=False).values
+    codes, ids = pd.factorize(data_df["ID"])
+    group_hashes = np.zeros(len(ids), dtype=np.uint64)
+    np.add.at(group_hashes, codes[codes>=0], row_hashes[codes>=0])
+    return pd.Series([ f"{h:016x}" for h in group_hashes ], index=ids, dtype=object)
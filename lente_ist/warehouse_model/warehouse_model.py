@@ -9,15 +9,19 @@
     Email: higor.monteiro@fisica.ufc.br
 '''
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import MetaData
 # -- import the data models
 from lente_ist.warehouse_model.warehouse_base import WarehouseBase
+from lente_ist.warehouse_model.backend import get_engine
 from lente_ist.warehouse_model.data_models import Pessoa, SinanAidsAdultoInfo, SinanAidsCriancaInfo, SiclomInfo, SimInfo, SimcInfo, SiscelInfo 
-from lente_ist.warehouse_model.data_models import PositivePairsLabel, NegativePairsLabel
+from lente_ist.warehouse_model.data_models import PessoaPadronizada
+from lente_ist.warehouse_model.data_models import PositivePairsLabel, NegativePairsLabel, ComparedPairs
+from lente_ist.warehouse_model.data_models import LinkageRun, LinkageRunBlock
+from lente_ist.warehouse_model.data_models import SourceFile, SourceRecord
 
 class WarehouseHIV(WarehouseBase):
     def __init__(self, engine_url):
-        self._engine = create_engine(engine_url, future=True)
+        self._engine = get_engine(engine_url)
         self._metadata = MetaData()
         self._tables = {}
         self._mappings = {}
@@ -30,8 +34,14 @@ class WarehouseHIV(WarehouseBase):
                                        SimInfo(self._metadata).define(),
                                        SimcInfo(self._metadata).define(), 
                                        SiscelInfo(self._metadata).define(),  
+                                       PessoaPadronizada(self._metadata).define(),
                                        PositivePairsLabel(self._metadata).define(),
-                                       NegativePairsLabel(self._metadata).define() ]
+                                       NegativePairsLabel(self._metadata).define(),
+                                       ComparedPairs(self._metadata).define(),
+                                       LinkageRun(self._metadata).define(),
+                                       LinkageRunBlock(self._metadata).define(),
+                                       SourceFile(self._metadata).define(),
+                                       SourceRecord(self._metadata).define() ]
 
         for elem in self._imported_data_models:
             self._tables.update(elem[0])
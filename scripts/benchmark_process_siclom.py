@@ -0,0 +1,112 @@
+'''
+    Benchmark of 'process_siclom' on a synthetic SICLOM export.
+
+    The current (vectorized) transform is compared against the previous row-by-row
+    implementation, kept here as reference, and both outputs are checked to be identical.
+
+    Usage: python benchmark_process_siclom.py [number_of_rows]
+'''
+import sys
+sys.path.append("..")
+
+import time
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+from lente_ist.warehouse_model.utils import process_siclom
+
+def process_siclom_rowwise(df, source_name="SICLOM"):
+    '''
+        Previous implementation of 'process_siclom', applying the transformations row by row.
+    '''
+    df["ID"] = df["codigo_paciente"].apply(lambda x: unidecode(x.upper()).strip())
+    df['NM_PACIENT'] = df['nome_paciente'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df['DT_NASC'] = pd.to_datetime(df['data_nascimento'], errors="coerce")
+    df["NM_MAE_PAC"] = df["nome_mae"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df['DT_NOTIFIC'] = pd.to_datetime(df['data_cadastro'], errors="coerce") # auxiliary only
+    df["DT_DIAG"] = [ np.nan for n in range(df.shape[0]) ]
+    df["CS_SEXO"] = df["sexo"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan).map({'1': 'M', '2': 'F', '3': np.nan, '4': np.nan})
+    df["NM_BAIRRO"] = df["bairro"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ID_MN_RESI"] = df["codigo_ibge_resid"].apply(lambda x: unidecode(x)[:6] if pd.notna(x) else np.nan)
+    df["NM_LOGRADO"] = df["endereco"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["NU_CEP"] = df["Cep"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["NU_NUMERO"] = [ np.nan for n in range(df.shape[0]) ]
+    df["ID_CNS_SUS"] = [ np.nan for n in range(df.shape[0]) ]
+    df["FONTE"] = [ source_name for n in range(df.shape[0]) ]
+    df["CPF"] = df["cpf"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+
+    df["UDM"] = df["UDM"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["CODIGO_IBGE_NASC"] = df["codigo_ibge_nasc"].apply(lambda x: unidecode(x) if pd.notna(x) else np.nan)
+    df["RACA"] = df["raca"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ESTADO_CIVIL"] = df["estado_civil"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ESCOLARIDADE"] = df["escolaridade"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["CD4_INICIO_TARV"] = df["cd4_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["CV_INICIO_TARV"] = df["cv_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["ANO_INICIO_TARV"] = df["ano_inicio_TARV"].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    df["DT_CADASTRO"] = pd.to_datetime(df['data_cadastro'], errors="coerce")
+    df["DT_DIGITACAO"] = pd.to_datetime(df['data_digitacao'], errors="coerce")
+    df["DT_ULT_ATU"] = pd.to_datetime(df['data_ult_atu'], errors="coerce")
+    df["ST_PACIENTE"] = df['st_paciente'].apply(lambda x: unidecode(x.upper()).strip() if pd.notna(x) else np.nan)
+    return df
+
+def synthetic_siclom(number_of_rows, seed=0):
+    '''
+        SICLOM-like export with realistic repetition of names, places and categories.
+    '''
+    rng = np.random.default_rng(seed)
+    first = np.array(["maria", "josé", "antônio", "francisca", "joão", "ana", "raimunda", "sebastião", "luíz", "conceição"])
+    last = np.array(["da silva", "de sousa", "oliveira", "araújo", "gonçalves", "pereira", "lima", "magalhães"])
+    bairros = np.array([ f"bairro {n} são josé" for n in range(300) ])
+
+    def names(size):
+        return np.char.add(np.char.add(rng.choice(first, size), " "), rng.choice(last, size))
+
+    def with_missing(values, frac=0.05):
+        values = values.astype(object)
+        values[rng.random(values.shape[0]) < frac] = np.nan
+        return values
+
+    n = number_of_rows
+    dates = pd.Timestamp("1950-01-01") + pd.to_timedelta(rng.integers(0, 25000, n), unit="D")
+    return pd.DataFrame({
+        "codigo_paciente": np.char.add("pac", rng.integers(0, n, n).astype(str)),
+        "nome_paciente": with_missing(np.char.add(names(n), np.char.add(" ", rng.choice(last, n)))),
+        "data_nascimento": with_missing(dates.strftime("%Y-%m-%d").values),
+        "nome_mae": with_missing(names(n)),
+        "data_cadastro": with_missing((dates + pd.Timedelta(days=9000)).strftime("%Y-%m-%d").values),
+        "sexo": with_missing(rng.choice(np.array(["1", "2", "3", "4"]), n)),
+        "bairro": with_missing(rng.choice(bairros, n)),
+        "codigo_ibge_resid": with_missing(rng.choice(np.array(["2304400", "2303709", "2307650"]), n)),
+        "endereco": with_missing(np.char.add("rua ", rng.choice(bairros, n))),
+        "Cep": with_missing(np.char.add("60", rng.integers(100000, 999999, n).astype(str))),
+        "cpf": with_missing(rng.integers(10**10, 10**11, n).astype(str), frac=0.4),
+        "UDM": with_missing(rng.choice(np.array(["udm centro", "udm são josé", "udm norte"]), n)),
+        "codigo_ibge_nasc": with_missing(rng.choice(np.array(["2304400", "2303709"]), n)),
+        "raca": with_missing(rng.choice(np.array(["parda", "branca", "preta", "amarela", "indígena"]), n)),
+        "estado_civil": with_missing(rng.choice(np.array(["solteiro", "casado", "viúvo"]), n)),
+        "escolaridade": with_missing(rng.choice(np.array(["fundamental", "médio", "superior"]), n)),
+        "cd4_inicio_TARV": with_missing(rng.integers(0, 1500, n).astype(str), frac=0.3),
+        "cv_inicio_TARV": with_missing(rng.integers(0, 100000, n).astype(str), frac=0.3),
+        "ano_inicio_TARV": with_missing(rng.integers(1995, 2025, n).astype(str), frac=0.3),
+        "data_digitacao": with_missing((dates + pd.Timedelta(days=9001)).strftime("%Y-%m-%d").values),
+        "data_ult_atu": with_missing((dates + pd.Timedelta(days=9100)).strftime("%Y-%m-%d").values),
+        "st_paciente": with_missing(rng.choice(np.array(["ativo", "óbito", "abandono"]), n)),
+    })
+
+if __name__=="__main__":
+    number_of_rows = int(sys.argv[1]) if len(sys.argv)>1 else 1000000
+    raw_df = synthetic_siclom(number_of_rows)
+    print(f"Synthetic SICLOM export: {raw_df.shape[0]} rows.")
+
+    start = time.perf_counter()
+    reference_df = process_siclom_rowwise(raw_df.copy())
+    rowwise_time = time.perf_counter() - start
+    print(f"Row-by-row transform: {rowwise_time:.2f} s")
+
+    start = time.perf_counter()
+    processed_df = process_siclom(raw_df.copy())
+    vectorized_time = time.perf_counter() - start
+    print(f"Vectorized transform: {vectorized_time:.2f} s")
+
+    pd.testing.assert_frame_equal(reference_df, processed_df)
+    print(f"Identical outputs. Speedup: {rowwise_time/vectorized_time:.1f}x")
@@ -19,6 +19,11 @@ setup(
         "ujson",
         "joblib"
     ],
+    extras_require={
+        "duckdb": ["duckdb-engine"],
+        "postgresql": ["psycopg2-binary"],
+        "parquet": ["pyarrow"],
+    },
     author="Higor S. Monteiro",
     author_email="higormonteiros@gmail.com",
     description='''Lente-IST: Biblioteca em python para processamento e avaliação de qualidade 
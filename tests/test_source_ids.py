@@ -0,0 +1,41 @@
+'''
+    The IDs of the SIMC and SISCEL records are derived from the values of each row, and must
+    be the same in every process (the incremental injection compares records by their ID).
+'''
+import os
+import sys
+import json
+import subprocess
+
+SCRIPT = '''
+import json
+import pandas as pd
+from lente_ist.warehouse_model.utils import process_simc
+df = pd.DataFrame({
+    "Instituição solicitante": ["UDM CENTRO", "UDM NORTE", None],
+    "Nome Paciente": ["Maria da Silva", "João Souza", "Ana Lima"],
+    "Nome mãe": ["Joana da Silva", None, "Rita Lima"],
+    "Data Nascimento": ["1980-01-02", "1975-05-06", None],
+    "Idade": [40, 45, None],
+    "Sexo/Gênero": ["Feminino", "Masculino", "Feminino"],
+    "Raça/cor": ["Parda", "Branca", None],
+    "Escolaridade": [None, "Médio", "Superior"],
+    "CPF": [12345678901.0, None, 98765432100.0],
+    "Município de residência": ["FORTALEZA", "CAUCAIA", "FORTALEZA"],
+    "Data últ. dispensa": ["2020-01-01", "2020-02-01", "2020-03-01"],
+    "Duração": [30, 60, 90],
+    "Data retorno": ["2020-01-31", "2020-04-01", "2020-06-01"],
+    "Dias atraso": [0, 5, 10],
+})
+print(json.dumps(process_simc(df)["ID"].tolist()))
+'''
+
+def simc_ids(hashseed):
+    env = dict(os.environ, PYTHONHASHSEED=str(hashseed))
+    result = subprocess.run([sys.executable, "-c", SCRIPT], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_simc_ids_are_stable_between_processes():
+    first, second = simc_ids(1), simc_ids(2)
+    assert first==second
+    assert len(set(first))==len(first)